@@ -3,18 +3,20 @@ import re
 import json
 from PyPDF2 import PdfReader
 from pdf2image import convert_from_path
-from pytesseract import image_to_string
+from ocr_backend import batch_enabled, image_data_batch, image_to_string
+from preprocess import preprocess
 from PIL import Image
 from extract_fields import extract_fields
+from layout_fields import analyze_layout, merge_fields, merge_page_fields, page_fields
+from line_items import extract_line_items
 from db_utils import (
     save_cleaned_text_to_db,
     save_extracted_fields_to_db,
+    save_line_items_to_db,
     save_cleaned_pdf_to_db,  # <-- save to DB
     get_sql_server_connection
 )
-from azure.ai.documentintelligence import DocumentIntelligenceClient
-from azure.core.credentials import AzureKeyCredential
-from openai import AzureOpenAI
+from instrumentation import span, profile_run
 from dotenv import load_dotenv
 import argparse
 from pathlib import Path
@@ -23,16 +25,9 @@ from pathlib import Path
 # Load environment variables
 # -------------------------------
 load_dotenv()
-key_doc = os.getenv("AZURE_DOC_KEY")
-endpoint_doc = os.getenv("AZURE_DOC_ENDPOINT")
-credential_doc = AzureKeyCredential(key_doc)
-client_doc = DocumentIntelligenceClient(endpoint_doc, credential_doc)
-
-client_openai = AzureOpenAI(
-    api_key=os.getenv("AZURE_OPENAI_KEY"),
-    api_version="2024-12-01-preview",
-    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-)
+
+# Whole-document fields from the Document Intelligence layout result, keyed by PDF path
+azure_fields_cache = {}
 
 # -------------------------------
 # Text extraction helpers
@@ -46,12 +41,11 @@ def extract_text_from_pdf(pdf_path: str) -> str:
     return full_text.strip()
 
 def extract_text_from_image(image: Image.Image) -> str:
-    return image_to_string(image).strip()
+    return image_to_string(preprocess(image)).strip()
 
 def extract_text_azure_document(pdf_path: str) -> str:
-    with open(pdf_path, "rb") as f:
-        poller = client_doc.begin_analyze_document("prebuilt-layout", f)
-    result = poller.result()
+    result = analyze_layout(pdf_path)
+    azure_fields_cache[pdf_path] = merge_page_fields(page_fields(result))
     pages_text = []
     for page in result.pages:
         lines = [line.content for line in page.lines]
@@ -60,19 +54,30 @@ def extract_text_azure_document(pdf_path: str) -> str:
 
 def extract_text_fallback(pdf_path: str, method: str = "tesseract") -> str:
     print(" PDF text is empty, running fallback OCR...")
-    images = convert_from_path(pdf_path)
+    with span("rasterize"):
+        images = convert_from_path(pdf_path)
     full_text = ""
 
     if method.lower() == "azure":
         try:
-            full_text = extract_text_azure_document(pdf_path)
+            with span("azure_doc_intelligence"):
+                full_text = extract_text_azure_document(pdf_path)
             if full_text.strip():
                 return full_text
         except Exception as e:
             print(f"Azure OCR failed: {e}")
 
-    for image in images:
-        page_text = extract_text_from_image(image)
+    if batch_enabled():
+        try:
+            with span("tesseract_batch", pages=len(images)):
+                results = image_data_batch(preprocess(image) for image in images)
+            return "\n\n".join(r["text"].strip() for r in results if r["text"].strip())
+        except Exception as e:
+            print(f"[OCR] Batch tesseract run failed, OCR page by page: {e}")
+
+    for page_number, image in enumerate(images, start=1):
+        with span("tesseract", page=page_number):
+            page_text = extract_text_from_image(image)
         if page_text.strip():
             full_text += page_text + "\n\n"
     return full_text.strip()
@@ -80,14 +85,16 @@ def extract_text_fallback(pdf_path: str, method: str = "tesseract") -> str:
 # -------------------------------
 # Main processing function
 # -------------------------------
-def process_pdf(pdf_path: str, session_id: str, document_id: str, ocr_method: str = "tesseract"):
-    conn = get_sql_server_connection()
+def process_pdf(pdf_path: str, session_id: str, document_id: str, ocr_method: str = "tesseract", conn=None):
+    if conn is None:
+        conn = get_sql_server_connection()
     print(f" Processing PDF: {pdf_path}")
 
     # -------------------------------
     # Save PDF to database
     # -------------------------------
-    save_cleaned_pdf_to_db(conn, session_id, document_id, "full_document", pdf_path)
+    with span("sql_write"):
+        save_cleaned_pdf_to_db(conn, session_id, document_id, "full_document", pdf_path)
     print(" PDF saved to database.")
 
     # -------------------------------
@@ -103,7 +110,8 @@ def process_pdf(pdf_path: str, session_id: str, document_id: str, ocr_method: st
     # -------------------------------
     # Extract text
     # -------------------------------
-    full_text = extract_text_from_pdf(pdf_path)
+    with span("pdf_text"):
+        full_text = extract_text_from_pdf(pdf_path)
     if not full_text.strip():
         full_text = extract_text_fallback(pdf_path, method=ocr_method)
     if not full_text.strip():
@@ -112,13 +120,18 @@ def process_pdf(pdf_path: str, session_id: str, document_id: str, ocr_method: st
     # -------------------------------
     # Extract structured fields
     # -------------------------------
-    fields = extract_fields(full_text)
+    with span("extract_fields"):
+        fields = merge_fields(azure_fields_cache.pop(pdf_path, {}), extract_fields(full_text))
+    with span("line_items"):
+        line_items = extract_line_items(fields, full_text)
 
     # -------------------------------
     # Save text and extracted fields to database
     # -------------------------------
-    save_cleaned_text_to_db(conn, session_id, document_id, "full_document", full_text)
-    save_extracted_fields_to_db(conn, session_id, document_id, "full_document", fields)
+    with span("sql_write"):
+        save_cleaned_text_to_db(conn, session_id, document_id, "full_document", full_text)
+        save_extracted_fields_to_db(conn, session_id, document_id, "full_document", fields)
+        save_line_items_to_db(conn, session_id, document_id, "full_document", line_items)
     print(" OCR and field extraction completed successfully.")
 
 # -------------------------------
@@ -132,4 +145,5 @@ if __name__ == "__main__":
     parser.add_argument("ocr_method", nargs="?", default="azure")
     args = parser.parse_args()
 
-    process_pdf(args.pdf_path, args.session_id, args.document_id, args.ocr_method)
+    with profile_run("OCR_Alone"):
+        process_pdf(args.pdf_path, args.session_id, args.document_id, args.ocr_method)
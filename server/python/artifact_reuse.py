@@ -0,0 +1,270 @@
+import os
+import json
+import shutil
+import hashlib
+from typing import Dict, List, Optional
+
+# Cross-session reuse of pipeline results.
+#
+# The upload route stores a SHA-256 FileHash per upload but only uses it to
+# reject duplicates inside one session. Here every completed stage (split,
+# group, catalog) is recorded in TF_pipeline_runs under (file hash, engine
+# config). When the same bytes are processed again with the same settings,
+# the earlier run's files are hard-linked (copied if linking fails) into
+# the new session's folders and its SQL rows are cloned with INSERT ...
+# SELECT, so the stage finishes in milliseconds instead of re-running OCR.
+# The earlier run's search_index.py entries for the cloned OCR tables are
+# copied too, so reused documents stay searchable. Tables and columns from
+# migrations not applied on this database (003/004/006, 007/008) are
+# skipped, and if cloning fails the files linked for it are removed again.
+#
+# TF_REUSE_ARTIFACTS=false disables reuse; bump PIPELINE_VERSION when OCR or
+# extraction output changes so older runs stop matching.
+
+REUSE_ENABLED = os.getenv("TF_REUSE_ARTIFACTS", "true").lower() not in ("0", "false", "no")
+PIPELINE_VERSION = 1
+
+# table -> (copied columns, timestamp column)
+SPLIT_TABLES = {
+    "TF_ingestion_CleanedPDF": (["form_type", "file_data"], "created_at"),
+    "TF_ingestion_CleanedOCR": (["form_type", "ocr_text", "is_partial"], "created_at"),
+    "TF_fields_delta": (["form_type", "field_key"], "extracted_at"),
+    "TF_fields_KeyValuePair": (["form_type", "field_key", "field_value"], "extracted_at"),
+    "TF_field_index": (["page_name", "form_type", "canonical_key", "value_type", "raw_key", "raw_value",
+                        "value_text", "value_number", "value_date", "currency", "unit"], "extracted_at"),
+    "TF_page_previews": (["page_name", "kind", "file_name", "image_format", "width", "height", "byte_size"],
+                         "created_at"),
+    "TF_line_items": (["page_name", "form_type", "row_index", "is_total", "description", "quantity", "unit",
+                       "unit_price", "amount", "currency", "net_weight", "gross_weight", "packages"],
+                      "extracted_at"),
+}
+GROUP_TABLES = {
+    "TF_ingestion_mGroupsPDF": (["form_type", "file_data", "file_sha256"], "created_at"),
+    "TF_ingestion_mGroupsOCR": (["form_type", "ocr_text"], "created_at"),
+    "TF_ingestion_mGroupsFields": (["form_type", "fields_json"], "created_at"),
+}
+# OCR table -> search_index.py entry kind copied alongside its rows
+SEARCH_KINDS = {
+    "TF_ingestion_CleanedOCR": "page",
+    "TF_ingestion_mGroupsOCR": "group",
+}
+CATALOG_TABLES = {
+    "TF_mdocs_mgroups": (["grouped_form_type", "matched_document_name", "matched_document_id",
+                          "confidence_score"], "cataloged_at"),
+}
+
+
+# ---------------------- Keys ----------------------
+
+def file_sha256(path: str) -> str:
+    """Same digest the upload route stores in SB_TF_ingestion_Sets.FileHash."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def engine_config(script: str, ocr_method: Optional[str], **settings) -> str:
+    """Short hash of every setting that changes split/group output (plus caller `settings`); None: no ocr_method."""
+    from ocr_backend import active_backend, batch_enabled
+    from page_dedup import DEDUP_ENABLED
+    from segmentation import SEGMENTATION_ENABLED
+    from preprocess import PREPROCESS_ENABLED
+    from layout_fields import LAYOUT_FIELDS_ENABLED
+    from line_items import LINE_ITEMS_ENABLED
+    settings.update({
+        "version": PIPELINE_VERSION,
+        "script": script,
+        "ocr_method": ocr_method,
+        "ocr_backend": active_backend(),
+        "ocr_batch": batch_enabled(),
+        "dedup": DEDUP_ENABLED,
+        "segmentation": SEGMENTATION_ENABLED,
+        "preprocess": PREPROCESS_ENABLED,
+        "layout_fields": LAYOUT_FIELDS_ENABLED,
+        "line_items": LINE_ITEMS_ENABLED,
+    })
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode("utf-8")).hexdigest()[:32]
+
+
+# ---------------------- Run registry ----------------------
+
+def record_run(conn, file_hash: str, config: str, stage: str, session_id, document_id, output_path: str = None):
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO TF_pipeline_runs (file_hash, engine_config, stage, session_id, document_id, output_path, completed_at)
+        VALUES (?, ?, ?, ?, ?, ?, GETDATE())
+    """, (file_hash, config, stage, str(session_id), str(document_id),
+          os.path.abspath(output_path) if output_path else None))
+    conn.commit()
+
+
+def find_run(conn, file_hash: str, config: str, stage: str, session_id, document_id) -> Optional[Dict]:
+    """Most recent completed `stage` for this hash/config from another document."""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT session_id, document_id, output_path
+        FROM TF_pipeline_runs
+        WHERE file_hash = ? AND engine_config = ? AND stage = ?
+          AND NOT (session_id = ? AND document_id = ?)
+        ORDER BY completed_at DESC
+    """, (file_hash, config, stage, str(session_id), str(document_id)))
+    row = cursor.fetchone()
+    if not row:
+        return None
+    run = {"session_id": row[0], "document_id": row[1], "output_path": row[2]}
+    if run["output_path"] and not os.path.exists(run["output_path"]):
+        return None             # files were cleaned up; run again
+    return run
+
+
+def split_key(conn, session_id, document_id) -> Optional[Dict]:
+    """(file_hash, engine_config) recorded when this document was split."""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT file_hash, engine_config FROM TF_pipeline_runs
+        WHERE session_id = ? AND document_id = ? AND stage = 'split'
+        ORDER BY completed_at DESC
+    """, (str(session_id), str(document_id)))
+    row = cursor.fetchone()
+    return {"file_hash": row[0], "engine_config": row[1]} if row else None
+
+
+# ---------------------- Cloning ----------------------
+
+def link_tree(source_dir: str, target_dir: str) -> List[str]:
+    """Hard-link every file under source_dir into target_dir (copy across devices); returns the new paths."""
+    linked = []
+    for root, _, files in os.walk(source_dir):
+        relative = os.path.relpath(root, source_dir)
+        destination = os.path.normpath(os.path.join(target_dir, relative))
+        if not os.path.isdir(destination):
+            os.makedirs(destination)
+            linked.append(destination)
+        for name in files:
+            src, dst = os.path.join(root, name), os.path.join(destination, name)
+            if os.path.exists(dst):
+                os.remove(dst)
+            try:
+                os.link(src, dst)
+            except OSError:
+                shutil.copy2(src, dst)
+            linked.append(dst)
+    return linked
+
+
+def unlink_tree(linked: List[str]):
+    """Undo link_tree(): remove the linked files, then the directories it created."""
+    for path in reversed(linked):
+        try:
+            if os.path.isdir(path):
+                os.rmdir(path)
+            else:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def existing_tables(conn, tables: Dict) -> Dict:
+    """`tables` minus the tables and columns missing from this database (their migration was never applied)."""
+    cursor = conn.cursor()
+    present = {}
+    for table, (columns, timestamp) in tables.items():
+        cursor.execute("SELECT OBJECT_ID(?, 'U')", (table,))
+        row = cursor.fetchone()
+        if not row or row[0] is None:
+            print(f"[Reuse] {table} not cloned: table does not exist")
+            continue
+        kept = []
+        for column in columns:
+            cursor.execute("SELECT COL_LENGTH(?, ?)", (table, column))
+            row = cursor.fetchone()
+            if row and row[0] is not None:
+                kept.append(column)
+            else:
+                print(f"[Reuse] {table}.{column} not cloned: column does not exist")
+        present[table] = (kept, timestamp)
+    return present
+
+
+def clone_rows(conn, tables: Dict, source: Dict, session_id, document_id):
+    cursor = conn.cursor()
+    try:
+        for table, (columns, timestamp) in existing_tables(conn, tables).items():
+            column_list = ", ".join(columns)
+            cursor.execute(f"""
+                INSERT INTO {table} (session_id, document_id, {column_list}, {timestamp})
+                SELECT ?, ?, {column_list}, GETDATE() FROM {table}
+                WHERE session_id = ? AND document_id = ?
+            """, (str(session_id), str(document_id), str(source["session_id"]), str(source["document_id"])))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def clone_search_entries(tables: Dict, source: Dict, session_id, document_id):
+    """Copy the source document's search entries for the OCR tables in `tables`; never fails the clone."""
+    import search_index
+    for table, kind in SEARCH_KINDS.items():
+        if table not in tables:
+            continue
+        try:
+            search_index.copy_document(source["session_id"], source["document_id"], session_id, document_id, kind)
+        except Exception as e:
+            print(f"[Search] Not indexed cloned {kind} entries: {e}")
+
+
+def reuse_stage(conn, stage: str, tables: Dict, file_hash: str, config: str,
+                session_id, document_id, target_dir: str = None) -> bool:
+    """Clone a matching earlier run of `stage` into this document; False if none."""
+    source = find_run(conn, file_hash, config, stage, session_id, document_id)
+    if source is None:
+        return False
+    linked = []
+    try:
+        if target_dir and source["output_path"]:
+            linked = link_tree(source["output_path"], target_dir)
+        clone_rows(conn, tables, source, session_id, document_id)
+    except Exception:
+        unlink_tree(linked)
+        raise
+    clone_search_entries(tables, source, session_id, document_id)
+    record_run(conn, file_hash, config, stage, session_id, document_id, target_dir)
+    print(f"[Reuse] {stage} cloned from session {source['session_id']} document {source['document_id']}")
+    return True
+
+
+def try_reuse(conn, stage: str, tables: Dict, session_id, document_id, target_dir: str = None,
+              file_hash: str = None, config: str = None) -> bool:
+    """reuse_stage() that never fails the caller; group/catalog find the key from the split run."""
+    if not REUSE_ENABLED:
+        return False
+    try:
+        if file_hash is None:
+            key = split_key(conn, session_id, document_id)
+            if key is None:
+                return False
+            file_hash, config = key["file_hash"], key["engine_config"]
+        return reuse_stage(conn, stage, tables, file_hash, config, session_id, document_id, target_dir)
+    except Exception as e:
+        conn.rollback()
+        print(f"[Reuse] {stage} lookup skipped: {e}")
+        return False
+
+
+def try_record(conn, stage: str, session_id, document_id, output_path: str = None,
+               file_hash: str = None, config: str = None):
+    if not REUSE_ENABLED:
+        return
+    try:
+        if file_hash is None:
+            key = split_key(conn, session_id, document_id)
+            if key is None:
+                return
+            file_hash, config = key["file_hash"], key["engine_config"]
+        record_run(conn, file_hash, config, stage, session_id, document_id, output_path)
+    except Exception as e:
+        conn.rollback()
+        print(f"[Reuse] {stage} not recorded: {e}")
@@ -0,0 +1,98 @@
+import os
+import threading
+from dotenv import load_dotenv
+
+# Shared, lazily built Azure clients.
+#
+# The OCR scripts used to construct DocumentIntelligenceClient / AzureOpenAI
+# at import time (paying the azure/openai import even on Tesseract-only
+# runs) and some call sites built a fresh client per page, i.e. a new TLS
+# handshake per call. Here each client is built on first use, once per
+# process, on top of a pooled keep-alive HTTP session with explicit
+# timeouts and a bounded retry policy. Tests and the offline benchmark
+# swap clients in with register().
+
+load_dotenv()
+
+OPENAI_API_VERSION = "2024-12-01-preview"
+CONNECT_TIMEOUT = float(os.getenv("AZURE_CONNECT_TIMEOUT", 10))
+READ_TIMEOUT = float(os.getenv("AZURE_READ_TIMEOUT", 120))
+MAX_RETRIES = int(os.getenv("AZURE_MAX_RETRIES", 3))
+POOL_SIZE = int(os.getenv("AZURE_POOL_SIZE", 10))
+KEEPALIVE_EXPIRY = 60.0
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def _get_or_build(name: str, build):
+    client = _clients.get(name)
+    if client is None:
+        with _lock:
+            client = _clients.get(name)
+            if client is None:
+                client = _clients[name] = build()
+    return client
+
+
+def register(name: str, client):
+    """Install a prebuilt client (e.g. a fake) under `name`."""
+    with _lock:
+        _clients[name] = client
+
+
+def reset():
+    with _lock:
+        _clients.clear()
+
+
+def _build_document_client():
+    import requests
+    from requests.adapters import HTTPAdapter
+    from azure.ai.documentintelligence import DocumentIntelligenceClient
+    from azure.core.credentials import AzureKeyCredential
+    from azure.core.pipeline.transport import RequestsTransport
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+    session.mount("https://", adapter)
+    transport = RequestsTransport(session=session, session_owner=False,
+                                  connection_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT)
+    return DocumentIntelligenceClient(
+        endpoint=os.getenv("AZURE_DOC_ENDPOINT"),
+        credential=AzureKeyCredential(os.getenv("AZURE_DOC_KEY")),
+        transport=transport,
+        retry_total=MAX_RETRIES,
+        retry_backoff_factor=0.8,
+    )
+
+
+def _build_openai_client(api_version: str):
+    import httpx
+    from openai import AzureOpenAI
+
+    http_client = httpx.Client(
+        timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+        limits=httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE,
+                            keepalive_expiry=KEEPALIVE_EXPIRY),
+    )
+    return AzureOpenAI(
+        api_key=os.getenv("AZURE_OPENAI_KEY"),
+        api_version=api_version,
+        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+        http_client=http_client,
+        max_retries=MAX_RETRIES,
+    )
+
+
+def document_client():
+    """Shared Document Intelligence client (prebuilt-layout callers)."""
+    return _get_or_build("document_intelligence", _build_document_client)
+
+
+def openai_client(api_version: str = OPENAI_API_VERSION):
+    """Shared Azure OpenAI client for one API version."""
+    override = _clients.get("openai")      # register("openai", ...) covers every version
+    if override is not None:
+        return override
+    return _get_or_build(f"openai:{api_version}", lambda: _build_openai_client(api_version))
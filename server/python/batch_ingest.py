@@ -0,0 +1,193 @@
+import os
+import sys
+import csv
+import json
+import time
+import uuid
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List
+from db_utils import ConnectionPool
+from instrumentation import span, profile_run
+
+# Batch ingestion: process many PDFs in one interpreter with a shared worker
+# pool, shared Azure clients (azure_clients.py) and a pool
+# of SQL Server connections, instead of one Python process per upload.
+#
+#   python batch_ingest.py archive/2025-08 --session-id <uuid> --workers 4
+#   python batch_ingest.py manifest.csv --group --catalog --report report.json
+#
+# A manifest is CSV (header: pdf_path,session_id,document_id) or JSON lines
+# with the same keys. Relative pdf paths resolve against the manifest folder.
+
+SPLITTERS = ("split_OCR", "split_by_form_azure", "OCR_Alone", "pipeline")
+
+
+# ---------------------- Job discovery ----------------------
+
+def load_manifest(manifest_path: str) -> List[Dict]:
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    if manifest_path.lower().endswith((".jsonl", ".json")):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+    else:
+        with open(manifest_path, "r", encoding="utf-8", newline="") as f:
+            rows = list(csv.DictReader(f))
+
+    jobs = []
+    for row in rows:
+        pdf_path = row["pdf_path"].strip()
+        if not os.path.isabs(pdf_path):
+            pdf_path = os.path.join(base_dir, pdf_path)
+        jobs.append({
+            "pdf_path": pdf_path,
+            "session_id": row["session_id"].strip(),
+            "document_id": (row.get("document_id") or "").strip() or str(uuid.uuid4()),
+        })
+    return jobs
+
+
+def discover_directory(directory: str, session_id: str) -> List[Dict]:
+    jobs = []
+    for name in sorted(os.listdir(directory)):
+        if name.lower().endswith(".pdf"):
+            jobs.append({
+                "pdf_path": os.path.join(directory, name),
+                "session_id": session_id,
+                "document_id": str(uuid.uuid4()),
+            })
+    return jobs
+
+
+# ---------------------- Processing ----------------------
+
+def run_job(job: Dict, pool: ConnectionPool, splitter: str, ocr_method: str, group: bool, catalog: bool) -> Dict:
+    pdf_path, session_id, document_id = job["pdf_path"], job["session_id"], job["document_id"]
+    result = dict(job, status="ok", error=None)
+    started = time.perf_counter()
+
+    try:
+        with pool.connection() as conn:
+            if splitter == "pipeline":
+                # Fused split -> group -> catalog, no intermediate file reads
+                import pipeline
+                with span("pipeline", document=document_id):
+                    pipeline.run_pipeline(pdf_path, session_id, document_id, conn, catalog=catalog)
+                return dict(result, seconds=round(time.perf_counter() - started, 3))
+
+            with span("split", document=document_id):
+                if splitter == "split_OCR":
+                    import split_OCR
+                    split_OCR.split_pdf_by_form_type(pdf_path, session_id, document_id, conn, ocr_method=ocr_method)
+                elif splitter == "split_by_form_azure":
+                    import split_by_form_azure
+                    split_by_form_azure.split_pdf_by_form_type(pdf_path, session_id, document_id, conn, ocr_method=ocr_method)
+                else:
+                    import OCR_Alone
+                    OCR_Alone.process_pdf(pdf_path, session_id, document_id, ocr_method, conn=conn)
+
+            if group:
+                import group_by_form
+                with span("group", document=document_id):
+                    group_by_form.group_documents(session_id, document_id, conn)
+
+            if catalog:
+                import catalog_with_master
+                with span("catalog", document=document_id):
+                    catalog_with_master.catalog_all_grouped_documents(session_id, document_id, conn)
+    except Exception as e:
+        result["status"] = "failed"
+        result["error"] = str(e)
+
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    return result
+
+
+def run_batch(jobs: List[Dict], workers: int, splitter: str, ocr_method: str,
+              group: bool = False, catalog: bool = False) -> Dict:
+    # Import once on the main thread so workers do not race on first import;
+    # Azure clients are shared through azure_clients' locked registry.
+    __import__(splitter)
+    if group and splitter != "pipeline":
+        __import__("group_by_form")
+    if catalog:
+        __import__("catalog_with_master")
+
+    pool = ConnectionPool(workers)
+    results = []
+    lock = threading.Lock()
+    started = time.perf_counter()
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(run_job, job, pool, splitter, ocr_method, group, catalog)
+                for job in jobs
+            ]
+            for future in as_completed(futures):
+                result = future.result()
+                with lock:
+                    results.append(result)
+                    done = len(results)
+                marker = "OK" if result["status"] == "ok" else "FAILED"
+                print(f"[Batch {done}/{len(jobs)}] {marker} {os.path.basename(result['pdf_path'])} ({result['seconds']}s)")
+    finally:
+        pool.close_all()
+
+    elapsed = time.perf_counter() - started
+    failed = [r for r in results if r["status"] != "ok"]
+    return {
+        "splitter": splitter,
+        "ocr_method": ocr_method,
+        "workers": workers,
+        "documents": len(results),
+        "succeeded": len(results) - len(failed),
+        "failed": len(failed),
+        "seconds": round(elapsed, 3),
+        "documents_per_minute": round(len(results) * 60 / elapsed, 2) if elapsed else 0.0,
+        "results": sorted(results, key=lambda r: r["pdf_path"]),
+    }
+
+
+# ---------------------- Entry Point ----------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest a directory or manifest of PDFs in one process")
+    parser.add_argument("source", help="Directory of PDFs or a .csv/.jsonl manifest")
+    parser.add_argument("--session-id", help="Session for every PDF when source is a directory")
+    parser.add_argument("--splitter", choices=SPLITTERS, default="split_OCR")
+    parser.add_argument("--ocr-method", default="tesseract")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrency cap (threads and DB connections)")
+    parser.add_argument("--group", action="store_true", help="Run group_by_form after splitting")
+    parser.add_argument("--catalog", action="store_true", help="Run catalog_with_master after grouping")
+    parser.add_argument("--report", help="Write the summary report as JSON to this path")
+    args = parser.parse_args()
+
+    if os.path.isdir(args.source):
+        if not args.session_id:
+            parser.error("--session-id is required when ingesting a directory")
+        jobs = discover_directory(args.source, args.session_id)
+    else:
+        jobs = load_manifest(args.source)
+
+    if not jobs:
+        print("No PDFs to ingest.")
+        sys.exit(0)
+
+    with profile_run("batch_ingest"):
+        report = run_batch(jobs, max(1, args.workers), args.splitter, args.ocr_method,
+                           group=args.group, catalog=args.catalog)
+
+    print(f"\n Batch complete: {report['succeeded']}/{report['documents']} succeeded "
+          f"in {report['seconds']}s ({report['documents_per_minute']} docs/min)")
+    for r in report["results"]:
+        if r["status"] != "ok":
+            print(f"   FAILED {r['pdf_path']}: {r['error']}")
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f" Report written to {args.report}")
+
+    sys.exit(1 if report["failed"] else 0)
@@ -0,0 +1,525 @@
+import os
+import sys
+import json
+import time
+import glob
+import uuid
+import argparse
+import tempfile
+import subprocess
+from typing import Dict, List
+
+# Offline benchmark for the OCR pipeline.
+#
+# Runs split_OCR, split_by_form_azure, OCR_Alone, group_by_form, extract_fields,
+# catalog_with_master and the fused pipeline over test_docs/ and uploads/ with fake_services in
+# place of Document Intelligence, Azure OpenAI and SQL Server. Each script runs
+# in its own child process so peak RSS is attributable to that script.
+#
+#   python benchmark.py                       # run and store results
+#   python benchmark.py --save-baseline       # also make this run the baseline
+#   python benchmark.py --limit 3 --latency 0.5
+#   python benchmark.py --imports-only        # cold-start import check only (writes no results)
+#   python benchmark.py --ocr-backends        # per-page OCR latency: pytesseract, tesserocr, batch
+#   python benchmark.py --preprocess          # OCR time / fallback rate with and without preprocess.py
+#
+# Behavioural tests live in tests/ (python -m pytest tests); the import check
+# also runs there as tests/test_imports.py.
+#
+# Every run also imports each entry script in a fresh interpreter with
+# -X importtime: cumulative import time is compared to the baseline, and an
+# entry script that loads a module listed in LAZY_IMPORTS fails the run.
+
+PYTHON_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.abspath(os.path.join(PYTHON_DIR, "..", ".."))
+DEFAULT_CORPUS = [os.path.join(ROOT_DIR, "test_docs"), os.path.join(ROOT_DIR, "uploads")]
+RESULTS_DIR = os.path.join(ROOT_DIR, "benchmarks")
+BASELINE_PATH = os.path.join(RESULTS_DIR, "baseline.json")
+
+SESSION_ID = str(uuid.uuid5(uuid.NAMESPACE_URL, "tf-benchmark-session"))
+
+# Script -> working directory name. group/catalog/extract_fields consume the
+# split_OCR outputs, so they share its directory and must run after it.
+SCRIPTS = [
+    ("split_OCR", "pipeline"),
+    ("group_by_form", "pipeline"),
+    ("catalog_with_master", "pipeline"),
+    ("extract_fields", "pipeline"),
+    ("split_by_form_azure", "split_by_form_azure"),
+    ("OCR_Alone", "OCR_Alone"),
+    ("pipeline", "fused"),
+]
+
+
+# Entry scripts Node spawns per upload, and heavy modules they must only load
+# on the code path that needs them
+IMPORT_MODULES = ["split_OCR", "split_by_form_azure", "OCR_Alone", "group_by_form",
+                  "catalog_with_master", "pipeline", "job_queue"]
+LAZY_IMPORTS = {
+    "split_OCR": ["azure", "openai", "cv2", "pyodbc"],
+    "split_by_form_azure": ["azure", "openai", "cv2", "pyodbc"],
+    "OCR_Alone": ["azure", "openai", "cv2", "pyodbc"],
+    "group_by_form": ["openai", "pyodbc"],
+    "catalog_with_master": ["pyodbc"],
+    "pipeline": ["azure", "openai", "cv2", "pyodbc"],
+    "job_queue": ["azure", "openai", "pyodbc", "PyPDF2", "pdf2image"],
+}
+IMPORT_REPEATS = 3
+
+
+def document_id_for(pdf_path: str) -> str:
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, os.path.basename(pdf_path)))
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+            return round(psutil.Process().memory_info().peak_wset / (1024 * 1024), 1)
+        except Exception:
+            return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(peak / divisor, 1)
+
+
+def find_corpus(dirs: List[str], limit: int = 0) -> List[str]:
+    pdfs = []
+    for directory in dirs:
+        pdfs.extend(sorted(glob.glob(os.path.join(directory, "*.pdf"))))
+    return pdfs[:limit] if limit else pdfs
+
+
+# ---------------------- Child process ----------------------
+
+def install_offline_services(latency: float):
+    """Point the shared Azure client registry at fake_services."""
+    os.environ.setdefault("AZURE_DEPLOYMENT_NAME", "gpt-4o")
+
+    import azure_clients
+    import fake_services
+
+    azure_clients.register("document_intelligence", fake_services.FakeDocumentIntelligenceClient(latency=latency))
+    azure_clients.register("openai", fake_services.FakeAzureOpenAI(latency=latency))
+
+
+def count_pages(pdf_path: str) -> int:
+    from PyPDF2 import PdfReader
+    return len(PdfReader(pdf_path).pages)
+
+
+def run_document(script: str, pdf_path: str, conn):
+    document_id = document_id_for(pdf_path)
+
+    if script == "split_OCR":
+        import split_OCR
+        split_OCR.split_pdf_by_form_type(pdf_path, SESSION_ID, document_id, conn)
+    elif script == "split_by_form_azure":
+        import split_by_form_azure
+        split_by_form_azure.split_pdf_by_form_type(pdf_path, SESSION_ID, document_id, conn)
+    elif script == "OCR_Alone":
+        import OCR_Alone
+        OCR_Alone.process_pdf(pdf_path, SESSION_ID, document_id, "azure", conn=conn)
+    elif script == "pipeline":
+        import pipeline
+        pipeline.run_pipeline(pdf_path, SESSION_ID, document_id, conn)
+    elif script == "group_by_form":
+        import group_by_form
+        group_by_form.group_documents(SESSION_ID, document_id, conn)
+    elif script == "catalog_with_master":
+        import catalog_with_master
+        grouped_path = os.path.join("grouped", SESSION_ID, document_id)
+        for folder in sorted(os.listdir(grouped_path)):
+            content = catalog_with_master.read_grouped_text(os.path.join(grouped_path, folder))
+            catalog_with_master.catalog_grouped_text(conn, SESSION_ID, document_id, folder, content)
+    elif script == "extract_fields":
+        from extract_fields import extract_fields
+        from instrumentation import span
+        base_name = os.path.splitext(os.path.basename(pdf_path))[0]
+        page_dir = os.path.join("outputs", SESSION_ID, f"{base_name}-{document_id}")
+        for txt_path in sorted(glob.glob(os.path.join(page_dir, "Page_*.txt"))):
+            with open(txt_path, "r", encoding="utf-8") as f:
+                text = f.read()
+            with span("extract_fields", page=os.path.basename(txt_path)):
+                extract_fields(text)
+    else:
+        raise ValueError(f"Unknown benchmark script: {script}")
+
+
+def page_latencies(spans: List[Dict]) -> List[float]:
+    """Per-page seconds from one document's spans."""
+    whole_pages = [s["seconds"] for s in spans if s["stage"] == "page"]
+    if whole_pages:
+        return whole_pages
+    per_page: Dict = {}
+    for s in spans:
+        if "page" in s:
+            per_page[s["page"]] = per_page.get(s["page"], 0.0) + s["seconds"]
+    return list(per_page.values())
+
+
+def run_worker(script: str, pdfs: List[str], latency: float) -> Dict:
+    sys.path.insert(0, PYTHON_DIR)
+    install_offline_services(latency)
+    import fake_services
+    import instrumentation
+
+    conn = fake_services.sqlite_connection()
+    instrumentation.reset()
+
+    doc_seconds, page_seconds, total_pages, failures = [], [], 0, []
+    started = time.perf_counter()
+    for pdf_path in pdfs:
+        before = len(instrumentation.get_spans())
+        doc_start = time.perf_counter()
+        try:
+            run_document(script, pdf_path, conn)
+        except Exception as e:
+            failures.append({"pdf": os.path.basename(pdf_path), "error": str(e)})
+            continue
+        doc_seconds.append(time.perf_counter() - doc_start)
+        total_pages += count_pages(pdf_path)
+        page_seconds.extend(page_latencies(instrumentation.get_spans()[before:]))
+    elapsed = time.perf_counter() - started
+
+    pct = instrumentation.percentile
+    return {
+        "script": script,
+        "documents": len(doc_seconds),
+        "pages": total_pages,
+        "seconds": round(elapsed, 3),
+        "pages_per_sec": round(total_pages / elapsed, 3) if elapsed else 0.0,
+        "doc_latency": {"p50": round(pct(doc_seconds, 50), 4), "p95": round(pct(doc_seconds, 95), 4)},
+        "page_latency": {"p50": round(pct(page_seconds, 50), 4), "p95": round(pct(page_seconds, 95), 4)},
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": instrumentation.summary(),
+        "failures": failures,
+    }
+
+
+# ---------------------- Parent process ----------------------
+
+def measure_import(module: str) -> Dict:
+    """Best-of-N cold import time of `module` and any lazy modules it pulled in."""
+    best_ms, loaded = None, set()
+    for _ in range(IMPORT_REPEATS):
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                              cwd=PYTHON_DIR, capture_output=True, text=True, encoding="utf-8", errors="replace")
+        if proc.returncode != 0:
+            return {"error": proc.stderr[-2000:]}
+        cumulative = None
+        for line in proc.stderr.splitlines():
+            if not line.startswith("import time:") or "|" not in line:
+                continue
+            _, cum, name = line[len("import time:"):].split("|")
+            name = name.strip()
+            loaded.add(name.split(".")[0])
+            if name == module:
+                cumulative = int(cum) / 1000.0
+        if cumulative is not None and (best_ms is None or cumulative < best_ms):
+            best_ms = cumulative
+    heavy = sorted(set(LAZY_IMPORTS.get(module, [])) & loaded)
+    return {"ms": round(best_ms or 0.0, 1), "eager_heavy_imports": heavy}
+
+
+def check_imports(modules: List[str]) -> Dict:
+    return {module: measure_import(module) for module in modules}
+
+
+def compare_ocr_backends(pdfs: List[str], max_pages: int) -> Dict:
+    """Per-page latency of the 4-angle rotation search on each OCR backend."""
+    sys.path.insert(0, PYTHON_DIR)
+    from pdf2image import convert_from_path
+    import instrumentation
+    import ocr_backend
+
+    images = []
+    for pdf_path in pdfs:
+        images.extend(convert_from_path(pdf_path))
+        if len(images) >= max_pages:
+            break
+    images = images[:max_pages]
+
+    results = {}
+    for backend in ("pytesseract", "tesserocr"):
+        if backend == "tesserocr" and not ocr_backend._load_tesserocr():
+            results[backend] = {"error": "tesserocr is not installed"}
+            continue
+        ocr_backend.OCR_BACKEND = backend
+        latencies = []
+        for image in images:
+            started = time.perf_counter()
+            for angle in (0, 90, 180, 270):
+                ocr_backend.image_to_string(image.rotate(angle, expand=True).convert("L"))
+            latencies.append(time.perf_counter() - started)
+        pct = instrumentation.percentile
+        results[backend] = {
+            "pages": len(latencies),
+            "p50": round(pct(latencies, 50), 4),
+            "p95": round(pct(latencies, 95), 4),
+            "mean": round(sum(latencies) / len(latencies), 4) if latencies else 0.0,
+        }
+    ocr_backend.shutdown()
+
+    # Whole set in one tesseract process (TF_OCR_BATCH); only a per-page mean exists
+    started = time.perf_counter()
+    batched = ocr_backend.best_rotation_batch(image.convert("L") for image in images)
+    if batched is None:
+        results["pytesseract_batch"] = {"error": "batch tesseract run failed"}
+    else:
+        mean = (time.perf_counter() - started) / len(images) if images else 0.0
+        results["pytesseract_batch"] = {"pages": len(images), "p50": None, "p95": None, "mean": round(mean, 4)}
+
+    before, after = results.get("pytesseract", {}), results.get("tesserocr", {})
+    if before.get("mean") and after.get("mean"):
+        results["speedup"] = round(before["mean"] / after["mean"], 2)
+    return results
+
+
+# split_by_form_azure sends pages with less Tesseract text than this to Azure
+FALLBACK_MIN_CHARS = 20
+
+
+def compare_preprocessing(pdfs: List[str], max_pages: int) -> Dict:
+    """Rotation-search OCR per page on raw grayscale vs preprocess.py output."""
+    sys.path.insert(0, PYTHON_DIR)
+    from pdf2image import convert_from_path
+    import instrumentation
+    import ocr_backend
+    import preprocess
+
+    images = []
+    for pdf_path in pdfs:
+        images.extend(convert_from_path(pdf_path))
+        if len(images) >= max_pages:
+            break
+    images = images[:max_pages]
+
+    def best_rotation(image):
+        return max((ocr_backend.image_to_string(image.rotate(angle, expand=True)).strip()
+                    for angle in (0, 90, 180, 270)), key=len)
+
+    results = {}
+    skews = []
+    for mode in ("raw", "preprocessed"):
+        ocr_seconds, prep_seconds, fallbacks, chars = [], [], 0, 0
+        for image in images:
+            started = time.perf_counter()
+            if mode == "raw":
+                prepared = image.convert("L")
+            else:
+                prepared, info = preprocess.preprocess_with_info(image)
+                skews.append(info.get("skew", 0.0))
+            prep_seconds.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            text = best_rotation(prepared)
+            ocr_seconds.append(time.perf_counter() - started)
+            chars += len(text)
+            fallbacks += len(text) < FALLBACK_MIN_CHARS
+        pct = instrumentation.percentile
+        results[mode] = {
+            "pages": len(images),
+            "prepare_mean": round(sum(prep_seconds) / len(prep_seconds), 4) if images else 0.0,
+            "ocr_p50": round(pct(ocr_seconds, 50), 4),
+            "ocr_p95": round(pct(ocr_seconds, 95), 4),
+            "ocr_mean": round(sum(ocr_seconds) / len(ocr_seconds), 4) if images else 0.0,
+            "fallback_rate": round(fallbacks / len(images), 4) if images else 0.0,
+            "chars_per_page": round(chars / len(images), 1) if images else 0.0,
+        }
+    ocr_backend.shutdown()
+
+    results["deskewed_pages"] = sum(1 for angle in skews if abs(angle) >= preprocess.MIN_SKEW)
+    raw, prepared = results["raw"], results["preprocessed"]
+    if raw["ocr_mean"] and prepared["ocr_mean"]:
+        total = prepared["ocr_mean"] + prepared["prepare_mean"]
+        results["ocr_time_change"] = round(total / (raw["ocr_mean"] + raw["prepare_mean"]) - 1, 4)
+    results["fallback_rate_change"] = round(prepared["fallback_rate"] - raw["fallback_rate"], 4)
+    return results
+
+
+def run_script(script: str, workdir: str, pdfs: List[str], latency: float) -> Dict:
+    os.makedirs(workdir, exist_ok=True)
+    result_path = os.path.join(workdir, f"{script}.result.json")
+    cmd = [sys.executable, os.path.abspath(__file__), "--worker", script,
+           "--result", result_path, "--latency", str(latency)] + pdfs
+    env = dict(os.environ, TF_SEARCH_DB=os.path.join(workdir, "search_index.sqlite3"))
+    proc = subprocess.run(cmd, cwd=workdir, env=env, capture_output=True, text=True, encoding="utf-8",
+                          errors="replace")
+    if proc.returncode != 0 or not os.path.exists(result_path):
+        return {"script": script, "error": (proc.stderr or proc.stdout)[-2000:]}
+    with open(result_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compare(current: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Regressions beyond `tolerance` (fractional) against a stored baseline."""
+    regressions = []
+    for script, result in current["scripts"].items():
+        base = baseline.get("scripts", {}).get(script)
+        if not base or "error" in base or "error" in result:
+            continue
+        checks = [
+            ("pages_per_sec", result["pages_per_sec"], base["pages_per_sec"], False),
+            ("page_latency.p95", result["page_latency"]["p95"], base["page_latency"]["p95"], True),
+            ("peak_rss_mb", result["peak_rss_mb"], base["peak_rss_mb"], True),
+        ]
+        for name, now, before, higher_is_worse in checks:
+            if not now or not before:
+                continue
+            change = (now - before) / before
+            if (higher_is_worse and change > tolerance) or (not higher_is_worse and -change > tolerance):
+                regressions.append(f"{script}.{name}: {before} -> {now} ({change:+.1%})")
+
+    for module, result in current.get("imports", {}).items():
+        if result.get("eager_heavy_imports"):
+            regressions.append(f"{module}.import: eagerly imports {', '.join(result['eager_heavy_imports'])}")
+        before = baseline.get("imports", {}).get(module, {}).get("ms")
+        now = result.get("ms")
+        if now and before and (now - before) / before > tolerance:
+            regressions.append(f"{module}.import_ms: {before} -> {now} ({(now - before) / before:+.1%})")
+    return regressions
+
+
+def print_import_report(imports: Dict):
+    print(f"\n{'module':<22}{'import ms':>11}  eager heavy imports")
+    for module, r in imports.items():
+        if "error" in r:
+            print(f"{module:<22} FAILED: {r['error'].strip().splitlines()[-1] if r['error'].strip() else 'no output'}")
+            continue
+        print(f"{module:<22}{r['ms']:>11}  {', '.join(r['eager_heavy_imports']) or '-'}")
+
+
+def print_report(results: Dict):
+    print(f"\n{'script':<22}{'docs':>6}{'pages':>7}{'pages/s':>10}{'p50 page':>11}{'p95 page':>11}{'peak MB':>10}")
+    for script, r in results["scripts"].items():
+        if "error" in r:
+            print(f"{script:<22} FAILED: {r['error'].strip().splitlines()[-1] if r['error'].strip() else 'no output'}")
+            continue
+        print(f"{script:<22}{r['documents']:>6}{r['pages']:>7}{r['pages_per_sec']:>10}"
+              f"{r['page_latency']['p50']:>11}{r['page_latency']['p95']:>11}{str(r['peak_rss_mb']):>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline OCR pipeline benchmark")
+    parser.add_argument("pdfs", nargs="*", help=argparse.SUPPRESS)
+    parser.add_argument("--corpus", nargs="+", default=DEFAULT_CORPUS)
+    parser.add_argument("--limit", type=int, default=0, help="Only benchmark the first N PDFs")
+    parser.add_argument("--scripts", nargs="+", default=[name for name, _ in SCRIPTS])
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated Azure round-trip seconds")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--imports-only", action="store_true", help="Only run the cold-start import check")
+    parser.add_argument("--ocr-backends", action="store_true", help="Only compare OCR backend latency")
+    parser.add_argument("--preprocess", action="store_true", help="Only compare OCR with and without preprocessing")
+    parser.add_argument("--ocr-pages", type=int, default=10, help="Pages used by --ocr-backends / --preprocess")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        result = run_worker(args.worker, args.pdfs, args.latency)
+        with open(args.result, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        return
+
+    if args.ocr_backends:
+        pdfs = find_corpus(args.corpus, args.limit)
+        if not pdfs:
+            print("No PDFs found in corpus.")
+            sys.exit(1)
+        backends = compare_ocr_backends(pdfs, args.ocr_pages)
+        print(f"\n{'backend':<14}{'pages':>7}{'p50 page':>11}{'p95 page':>11}{'mean':>9}")
+        for name in ("pytesseract", "tesserocr", "pytesseract_batch"):
+            r = backends[name]
+            if "error" in r:
+                print(f"{name:<14} {r['error']}")
+            else:
+                print(f"{name:<14}{r['pages']:>7}{str(r['p50'] or '-'):>11}{str(r['p95'] or '-'):>11}{r['mean']:>9}")
+        if "speedup" in backends:
+            print(f"\ntesserocr speedup: {backends['speedup']}x")
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        result_path = os.path.join(RESULTS_DIR, f"ocr-backends-{time.strftime('%Y%m%d-%H%M%S')}.json")
+        with open(result_path, "w", encoding="utf-8") as f:
+            json.dump(backends, f, indent=2)
+        print(f"Results written to {result_path}")
+        return
+
+    if args.preprocess:
+        pdfs = find_corpus(args.corpus, args.limit)
+        if not pdfs:
+            print("No PDFs found in corpus.")
+            sys.exit(1)
+        report = compare_preprocessing(pdfs, args.ocr_pages)
+        print(f"\n{'mode':<14}{'pages':>7}{'prepare':>9}{'p50 ocr':>10}{'p95 ocr':>10}{'mean ocr':>10}{'fallback':>10}")
+        for mode in ("raw", "preprocessed"):
+            r = report[mode]
+            print(f"{mode:<14}{r['pages']:>7}{r['prepare_mean']:>9}{r['ocr_p50']:>10}{r['ocr_p95']:>10}"
+                  f"{r['ocr_mean']:>10}{r['fallback_rate']:>10.1%}")
+        if "ocr_time_change" in report:
+            print(f"\nOCR time incl. preprocessing: {report['ocr_time_change']:+.1%}, "
+                  f"fallback rate: {report['fallback_rate_change']:+.1%}, "
+                  f"deskewed pages: {report['deskewed_pages']}")
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        result_path = os.path.join(RESULTS_DIR, f"preprocess-{time.strftime('%Y%m%d-%H%M%S')}.json")
+        with open(result_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {result_path}")
+        return
+
+    pdfs = [] if args.imports_only else find_corpus(args.corpus, args.limit)
+    if not pdfs and not args.imports_only:
+        print("No PDFs found in corpus.")
+        sys.exit(1)
+
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "corpus": [os.path.relpath(p, ROOT_DIR) for p in pdfs],
+        "latency": args.latency,
+        "scripts": {},
+        "imports": check_imports(IMPORT_MODULES),
+    }
+    print_import_report(results["imports"])
+
+    if pdfs:
+        print(f"\nBenchmarking {len(pdfs)} PDFs with simulated Azure latency {args.latency}s")
+        with tempfile.TemporaryDirectory(prefix="tf-bench-") as tmp:
+            for script, workdir in SCRIPTS:
+                if script not in args.scripts:
+                    continue
+                print(f" Running {script}...")
+                results["scripts"][script] = run_script(script, os.path.join(tmp, workdir), pdfs, args.latency)
+        print_report(results)
+
+    if not args.imports_only:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        result_path = os.path.join(RESULTS_DIR, f"results-{time.strftime('%Y%m%d-%H%M%S')}.json")
+        with open(result_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {result_path}")
+
+    regressions = []
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\nRegressions against baseline:")
+            for line in regressions:
+                print(f"  {line}")
+        else:
+            print("\nNo regressions against baseline.")
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline updated: {args.baseline}")
+
+    failed = [name for name, r in list(results["scripts"].items()) + list(results["imports"].items()) if "error" in r]
+    sys.exit(1 if regressions or failed else 0)
+
+
+if __name__ == "__main__":
+    main()
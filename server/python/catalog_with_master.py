@@ -2,6 +2,8 @@ import os
 import difflib
 import uuid
 from db_utils import get_sql_server_connection
+from instrumentation import span, profile_run
+from artifact_reuse import CATALOG_TABLES, try_record, try_reuse
 
 def get_master_documents(conn):
     query = "SELECT * FROM Attributes_TF_Document"
@@ -23,8 +25,10 @@ def read_grouped_text(folder_path):
                 return f.read().strip()
     return ""
 
-def catalog_grouped_text(conn, session_id, document_id, folder_name, text_content):
-    master_docs = get_master_documents(conn)
+def catalog_grouped_text(conn, session_id, document_id, folder_name, text_content, master_docs=None):
+    if master_docs is None:
+        with span("load_master_documents"):
+            master_docs = get_master_documents(conn)
 
     # Clean folder name for better matching
     folder_name_clean = folder_name.replace("_", " ").lower()
@@ -33,14 +37,15 @@ def catalog_grouped_text(conn, session_id, document_id, folder_name, text_conten
     best_match_id = None
     best_score = 0.0
 
-    for doc in master_docs:
-        master_name = doc.get("DocumentName", "").lower()
-        score = difflib.SequenceMatcher(None, folder_name_clean, master_name).ratio()
+    with span("catalog_match", group=folder_name):
+        for doc in master_docs:
+            master_name = doc.get("DocumentName", "").lower()
+            score = difflib.SequenceMatcher(None, folder_name_clean, master_name).ratio()
 
-        if score > best_score:
-            best_score = score
-            best_match_name = doc.get("DocumentName")
-            best_match_id = doc.get("DocumentID")
+            if score > best_score:
+                best_score = score
+                best_match_name = doc.get("DocumentName")
+                best_match_id = doc.get("DocumentID")
 
     if best_score < 0.3:
         best_match_name = None
@@ -65,16 +70,17 @@ def catalog_grouped_text(conn, session_id, document_id, folder_name, text_conten
         )
         VALUES (?, ?, ?, ?, ?, ?, GETDATE())
     """
-    cursor = conn.cursor()
-    cursor.execute(query, (
-        session_uuid,
-        document_uuid,
-        folder_name,
-        best_match_name,
-        matched_uuid,
-        best_score
-    ))
-    conn.commit()
+    with span("sql_write", group=folder_name):
+        cursor = conn.cursor()
+        cursor.execute(query, (
+            session_uuid,
+            document_uuid,
+            folder_name,
+            best_match_name,
+            matched_uuid,
+            best_score
+        ))
+        conn.commit()
 
     print(f"[ Cataloged] '{folder_name}' -> '{best_match_name}' (score: {round(best_score, 2)})")
 
@@ -84,7 +90,7 @@ def catalog_grouped_text(conn, session_id, document_id, folder_name, text_conten
 
 
 
-def catalog_all_grouped_documents(session_id, document_id):
+def catalog_all_grouped_documents(session_id, document_id, conn=None):
     base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
     grouped_path = os.path.join(base_dir, "grouped", str(session_id), str(document_id))
 
@@ -99,11 +105,22 @@ def catalog_all_grouped_documents(session_id, document_id):
 
     print(f"[Catalog Success]:  Found {len(folders)} grouped folders")
 
-    conn = get_sql_server_connection()
+    owns_conn = conn is None
+    if owns_conn:
+        conn = get_sql_server_connection()
+    if try_reuse(conn, "catalog", CATALOG_TABLES, session_id, document_id):
+        if owns_conn:
+            conn.close()
+        return
+    with span("load_master_documents"):
+        master_docs = get_master_documents(conn)
     for folder in folders:
-        content = read_grouped_text(os.path.join(grouped_path, folder))
-        catalog_grouped_text(conn, session_id, document_id, folder, content)
-    conn.close()
+        with span("read_grouped_text", group=folder):
+            content = read_grouped_text(os.path.join(grouped_path, folder))
+        catalog_grouped_text(conn, session_id, document_id, folder, content, master_docs)
+    try_record(conn, "catalog", session_id, document_id)
+    if owns_conn:
+        conn.close()
 
 if __name__ == "__main__":
     import sys
@@ -117,4 +134,5 @@ if __name__ == "__main__":
             print("Invalid UUIDs")
             sys.exit(1)
 
-        catalog_all_grouped_documents(session_id, document_id)
+        with profile_run("catalog_with_master"):
+            catalog_all_grouped_documents(session_id, document_id)
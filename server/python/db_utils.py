@@ -2,13 +2,22 @@ import sys
 import os
 import re
 import json
+import hashlib
 from typing import Dict
 import os
+import queue
+import threading
+from contextlib import contextmanager
+from field_index import FIELD_INDEX_ENABLED, save_field_index
+from line_items import save_line_items
+from layout_fields import cap_tables
+import search_index
+from storage_codec import decode_json, decode_text, encode_json, encode_ocr_text
 from dotenv import load_dotenv
 from pathlib import Path
-import pyodbc
 
 def get_sql_server_connection():
+    import pyodbc  # loaded on first connection, not when helpers are imported
     env_path = Path("C:/Users/SANDHIYA/Downloads/0207/project-bolt-github-sdfj7e6k - 0207/project/.env")
     load_dotenv(dotenv_path=env_path)
 
@@ -30,27 +39,122 @@ def get_sql_server_connection():
         raise
 
 
-def save_cleaned_text_to_db(conn, session_id, document_id, form_type, text_data):
+class ConnectionPool:
     """
-    Save raw OCR text directly to database.
+    Fixed-size pool of SQL Server connections for worker threads.
+    pyodbc connections must not be used by two threads at once, so each
+    borrower gets exclusive use until the `connection()` block exits.
+    """
+
+    def __init__(self, size: int, factory=get_sql_server_connection):
+        self.size = size
+        self._factory = factory
+        self._idle = queue.Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._all = []
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    conn = self._factory()
+                except Exception:
+                    self._created -= 1
+                    raise
+                self._all.append(conn)
+                return conn
+        return self._idle.get()
+
+    @contextmanager
+    def connection(self):
+        conn = self._acquire()
+        try:
+            yield conn
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            raise
+        finally:
+            self._idle.put(conn)
+
+    def close_all(self):
+        for conn in self._all:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        self._all = []
+
+
+def save_cleaned_text_to_db(conn, session_id, document_id, form_type, text_data, partial=False):
+    """
+    Save raw OCR text directly to database. `partial` marks header-band-only
+    text (pipeline.py header_classify) until its deferred full OCR runs.
     """
     query = """
     INSERT INTO TF_ingestion_CleanedOCR (session_id, document_id, form_type, ocr_text, created_at)
     VALUES (?, ?, ?, ?, GETDATE())
     """
+    params = (session_id, document_id, form_type, encode_ocr_text(text_data))
+    if partial:
+        query = """
+        INSERT INTO TF_ingestion_CleanedOCR (session_id, document_id, form_type, ocr_text, is_partial, created_at)
+        VALUES (?, ?, ?, ?, 1, GETDATE())
+        """
     cursor = conn.cursor()
     try:
-        cursor.execute(query, (session_id, document_id, form_type, text_data))
+        try:
+            cursor.execute(query, params)
+        except Exception as e:
+            if not partial:
+                raise
+            # is_partial comes from migrations/008; keep the text without the flag
+            conn.rollback()
+            print(f"[PartialOCR] Flag not stored for {form_type}: {e}")
+            cursor.execute("INSERT INTO TF_ingestion_CleanedOCR (session_id, document_id, form_type, ocr_text, "
+                           "created_at) VALUES (?, ?, ?, ?, GETDATE())", params)
         conn.commit()
         print(" OCR text saved to DB successfully.")
     except Exception as e:
         print(f" Failed to save OCR text to DB: {e}")
+        return
     finally:
         cursor.close()
+    index_for_search(session_id, document_id, "page", form_type, text_data)
+
+def complete_cleaned_text_in_db(conn, session_id, document_id, form_type, text_data):
+    """Replace a partial page's header-band text with its full OCR text."""
+    cursor = conn.cursor()
+    cursor.execute(
+        "UPDATE TF_ingestion_CleanedOCR SET ocr_text = ?, is_partial = 0 "
+        "WHERE session_id = ? AND document_id = ? AND form_type = ?",
+        (encode_ocr_text(text_data), session_id, document_id, form_type),
+    )
+    conn.commit()
+    index_for_search(session_id, document_id, "page", form_type, text_data)
+
+def index_for_search(session_id, document_id, kind, name, text):
+    """Feed the full-text index (search_index.py); never fails the DB write."""
+    try:
+        search_index.index_text(session_id, document_id, kind, name, text,
+                                form_type=name if kind == "group" else None)
+    except Exception as e:
+        print(f"[Search] Not indexed {kind} {name}: {e}")
 
-def save_cleaned_pdf_to_db(conn, session_id, document_id, form_type, pdf_path):
-    with open(pdf_path, 'rb') as f_pdf:
-        pdf_data = f_pdf.read()
+def save_cleaned_pdf_to_db(conn, session_id, document_id, form_type, pdf_path, data=None):
+    if data is not None:
+        pdf_data = data
+    else:
+        with open(pdf_path, 'rb') as f_pdf:
+            pdf_data = f_pdf.read()
 
     query = """
     INSERT INTO TF_ingestion_CleanedPDF (session_id, document_id, form_type, file_data, created_at)
@@ -60,7 +164,7 @@ def save_cleaned_pdf_to_db(conn, session_id, document_id, form_type, pdf_path):
     cursor.execute(query, (session_id, document_id, form_type, pdf_data))
     conn.commit()
 
-def save_extracted_fields_to_db(conn, session_id, document_id, form_type, fields_dict):
+def save_extracted_fields_to_db(conn, session_id, document_id, form_type, fields_dict, index=True):
     cursor = conn.cursor()
 
     now = "GETDATE()"  # Use server time
@@ -75,6 +179,7 @@ def save_extracted_fields_to_db(conn, session_id, document_id, form_type, fields
     VALUES (?, ?, ?, ?, ?, GETDATE())
     """
 
+    fields_dict = cap_tables(fields_dict)
     for key, value in fields_dict.items():
         # Save key only to TF_fields_delta
         cursor.execute(delta_query, (session_id, document_id, form_type, key))
@@ -83,6 +188,14 @@ def save_extracted_fields_to_db(conn, session_id, document_id, form_type, fields
         cursor.execute(kv_query, (session_id, document_id, form_type, key, str(value)))
 
     conn.commit()
+
+    # Canonical, typed copy for cross-document checks (migrations/002)
+    if FIELD_INDEX_ENABLED and index:
+        try:
+            save_field_index(conn, session_id, document_id, form_type, fields_dict)
+        except Exception as e:
+            conn.rollback()
+            print(f"[FieldIndex] Skipped {form_type}: {e}")
     
     
     
@@ -115,8 +228,8 @@ def get_cleaned_split_data(conn, session_id, document_id):
         result.append({
             "form_type": row.form_type,
             "pdf_data": row.pdf_data,
-            "ocr_text": row.ocr_text,
-            "fields_json": json.loads(row.fields_json)
+            "ocr_text": decode_text(row.ocr_text),
+            "fields_json": decode_json(row.fields_json)
         })
 
     return result
@@ -124,29 +237,128 @@ def get_cleaned_split_data(conn, session_id, document_id):
 
 # Grouped Docs
 
-def save_grouped_pdf_to_db(conn, session_id, document_id, form_type, pdf_path):
-    with open(pdf_path, "rb") as f:
-        data = f.read()
-    query = "INSERT INTO TF_ingestion_mGroupsPDF (session_id, document_id, form_type, file_data, created_at) VALUES (?, ?, ?, ?, GETDATE())"
+# Grouped PDFs larger than this are sent in chunks instead of one parameter
+PDF_STREAM_THRESHOLD = int(os.getenv("TF_PDF_STREAM_THRESHOLD", 8 * 1024 * 1024))
+PDF_STREAM_CHUNK_SIZE = 1024 * 1024
+
+def check_pdf_digest(form_type, expected, actual):
+    if expected and actual != expected:
+        raise ValueError(f"Grouped PDF {form_type} changed on disk: sha256 {actual}, expected {expected}")
+
+def save_grouped_pdf_to_db(conn, session_id, document_id, form_type, pdf_path, data=None, sha256=None):
+    """
+    Store a grouped PDF with its SHA-256 (file_sha256, migrations/007).
+    `sha256` is the digest pdf_stream computed while writing the file; the
+    bytes stored must match it.
+    """
+    if data is None and os.path.getsize(pdf_path) > PDF_STREAM_THRESHOLD:
+        return stream_grouped_pdf_to_db(conn, session_id, document_id, form_type, pdf_path, sha256=sha256)
+    if data is None:
+        with open(pdf_path, "rb") as f:
+            data = f.read()
+    digest = hashlib.sha256(data).hexdigest()
+    check_pdf_digest(form_type, sha256, digest)
+    query = "INSERT INTO TF_ingestion_mGroupsPDF (session_id, document_id, form_type, file_data, file_sha256, created_at) VALUES (?, ?, ?, ?, ?, GETDATE())"
     cursor = conn.cursor()
-    cursor.execute(query, (session_id, document_id, form_type, data))
+    cursor.execute(query, (session_id, document_id, form_type, data, digest))
     conn.commit()
 
-def save_grouped_text_to_db(conn, session_id, document_id, form_type, text_path):
-    with open(text_path, "r", encoding="utf-8") as f:
-        text = f.read()
+def stream_grouped_pdf_to_db(conn, session_id, document_id, form_type, pdf_path, chunk_size=PDF_STREAM_CHUNK_SIZE,
+                             sha256=None):
+    """
+    Insert an empty blob, then append the file with varbinary(max) .WRITE
+    chunks addressed by the row's identity id (migrations/007). The chunks
+    are hashed as they are sent and the stored length is read back; either
+    mismatch rolls the row back.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "INSERT INTO TF_ingestion_mGroupsPDF (session_id, document_id, form_type, file_data, file_sha256, created_at) "
+            "OUTPUT INSERTED.id VALUES (?, ?, ?, 0x, ?, GETDATE())",
+            (session_id, document_id, form_type, sha256),
+        )
+        row_id = cursor.fetchone()[0]
+        digest, size = hashlib.sha256(), 0
+        with open(pdf_path, "rb") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                size += len(chunk)
+                cursor.execute(
+                    "UPDATE TF_ingestion_mGroupsPDF SET file_data.WRITE(?, NULL, NULL) WHERE id = ?",
+                    (chunk, row_id),
+                )
+        check_pdf_digest(form_type, sha256, digest.hexdigest())
+        cursor.execute("SELECT DATALENGTH(file_data) FROM TF_ingestion_mGroupsPDF WHERE id = ?", (row_id,))
+        stored = cursor.fetchone()[0]
+        if stored != size:
+            raise ValueError(f"Grouped PDF {form_type} stored {stored} of {size} bytes")
+        if sha256 is None:
+            cursor.execute("UPDATE TF_ingestion_mGroupsPDF SET file_sha256 = ? WHERE id = ?",
+                           (digest.hexdigest(), row_id))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+def save_grouped_text_to_db(conn, session_id, document_id, form_type, text_path, text=None):
+    if text is None:
+        with open(text_path, "r", encoding="utf-8") as f:
+            text = f.read()
     query = "INSERT INTO TF_ingestion_mGroupsOCR (session_id, document_id, form_type, ocr_text, created_at) VALUES (?, ?, ?, ?, GETDATE())"
     cursor = conn.cursor()
-    cursor.execute(query, (session_id, document_id, form_type, text))
+    cursor.execute(query, (session_id, document_id, form_type, encode_ocr_text(text)))
     conn.commit()
+    index_for_search(session_id, document_id, "group", form_type, text)
+
+def replace_grouped_text_in_db(conn, session_id, document_id, form_type, text):
+    cursor = conn.cursor()
+    cursor.execute(
+        "UPDATE TF_ingestion_mGroupsOCR SET ocr_text = ? WHERE session_id = ? AND document_id = ? AND form_type = ?",
+        (encode_ocr_text(text), session_id, document_id, form_type),
+    )
+    conn.commit()
+    index_for_search(session_id, document_id, "group", form_type, text)
 
 def save_grouped_fields_to_db(conn, session_id, document_id, form_type, fields):
-    json_data = json.dumps(fields, ensure_ascii=False)
+    if isinstance(fields, dict):
+        fields = cap_tables(fields)
+    else:
+        fields = [cap_tables(page_fields) if isinstance(page_fields, dict) else page_fields for page_fields in fields]
+    json_data = encode_json(fields)
     query = "INSERT INTO TF_ingestion_mGroupsFields (session_id, document_id, form_type, fields_json, created_at) VALUES (?, ?, ?, ?, GETDATE())"
     cursor = conn.cursor()
     cursor.execute(query, (session_id, document_id, form_type, json_data))
     conn.commit()
 
+def save_page_previews_to_db(conn, session_id, document_id, entries):
+    """Index page_previews.write_previews() entries (file names only; images stay on disk)."""
+    if not entries:
+        return
+    query = """
+    INSERT INTO TF_page_previews (session_id, document_id, page_name, kind, file_name, image_format, width, height, byte_size, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, GETDATE())
+    """
+    cursor = conn.cursor()
+    cursor.executemany(query, [
+        (session_id, document_id, e["page"], e["kind"], e["file"], e["format"], e["width"], e["height"], e["bytes"])
+        for e in entries
+    ])
+    conn.commit()
+
+def save_line_items_to_db(conn, session_id, document_id, page_name, parsed):
+    """Rows from line_items.extract_line_items() for one page (or full_document)."""
+    if not parsed:
+        return
+    try:
+        save_line_items(conn, session_id, document_id, page_name, parsed)
+    except Exception as e:
+        conn.rollback()
+        print(f"[LineItems] Skipped {page_name}: {e}")
+
 
 
 
@@ -0,0 +1,357 @@
+import json
+import argparse
+from typing import Dict, List, Optional
+import numpy as np
+from db_utils import get_sql_server_connection
+from field_index import index_fields, load_session_index
+from line_items import ItemFrame, load_session_items
+from instrumentation import span, profile_run
+
+# Session-wide discrepancy checks over the field index.
+#
+# All indexed fields of a session are loaded once (field_index.
+# load_session_index) into a columnar FieldFrame: parallel NumPy arrays of
+# document, role, key, number, date and normalized text codes. Each rule is
+# a handful of masked array comparisons against the reference document
+# (the LC when present, otherwise the session's consensus value), so a
+# session with thousands of fields is checked in milliseconds instead of
+# nested loops over documents x fields. Only invoice and draft amounts are
+# held to the credit amount (insurance must cover 110%, UCP600 art. 28),
+# and only in the credit's currency (or with none stated). Copies found by
+# page_dedup are not indexed (split_OCR.write_page), so quantities are
+# summed per page; a value repeated under two keys of one page counts once.
+#
+#   python discrepancy.py <session_id> [--json report.json]
+
+# Document roles from the grouped form type
+ROLE_LC, ROLE_INVOICE, ROLE_PACKING, ROLE_TRANSPORT, ROLE_DRAFT, ROLE_OTHER = range(6)
+ROLE_NAMES = ["letter_of_credit", "invoice", "packing_list", "transport_document", "draft", "other"]
+ROLE_PATTERNS = [
+    (ROLE_LC, ("letter_of_credit", "documentary_credit", "lc", "mt700")),
+    (ROLE_INVOICE, ("invoice",)),
+    (ROLE_DRAFT, ("bill_of_exchange", "exchange", "draft")),
+    (ROLE_PACKING, ("packing",)),
+    (ROLE_TRANSPORT, ("lading", "bl", "waybill", "awb", "transport")),
+]
+
+AMOUNT_ROLES = [ROLE_INVOICE, ROLE_DRAFT]     # drawing documents held to the credit amount
+AMOUNT_TOLERANCE = 0.0          # drawings above the credit amount (UCP600 art. 18/30)
+QUANTITY_TOLERANCE = 0.05       # +/-5% for bulk quantities (UCP600 art. 30(b))
+WEIGHT_TOLERANCE = 0.01
+LINE_TOTAL_TOLERANCE = 0.005    # summed line items vs stated totals (rounding per line)
+MATCH_KEYS = ["lc_number", "beneficiary", "applicant", "port_of_loading", "port_of_discharge", "currency"]
+
+
+def role_for(form_type: Optional[str]) -> int:
+    name = (form_type or "").lower()
+    tokens = set(name.replace("-", "_").split("_"))
+    for role, patterns in ROLE_PATTERNS:
+        if any(p in tokens or (len(p) > 3 and p in name) for p in patterns):
+            return role
+    return ROLE_OTHER
+
+
+# ---------------------- Columnar frame ----------------------
+
+class FieldFrame:
+    """Parallel arrays, one element per indexed field of a session."""
+
+    def __init__(self, index: Dict[str, List[Dict]]):
+        rows = [(key, row) for key, key_rows in index.items() for row in key_rows]
+        self.size = len(rows)
+
+        self.keys, key_codes = np.unique(np.array([k for k, _ in rows] or [""], dtype=object), return_inverse=True)
+        self.key = key_codes[:self.size]
+
+        documents = [str(r["document_id"]) for _, r in rows]
+        self.documents, doc_codes = np.unique(np.array(documents or [""], dtype=object), return_inverse=True)
+        self.document = doc_codes[:self.size]
+
+        pages = [r.get("page_name") or "" for _, r in rows]
+        self.pages, page_codes = np.unique(np.array(pages or [""], dtype=object), return_inverse=True)
+        self.page = page_codes[:self.size]
+
+        form_types = [r.get("form_type") or "" for _, r in rows]
+        self.form_types, form_codes = np.unique(np.array(form_types or [""], dtype=object), return_inverse=True)
+        self.form_type = form_codes[:self.size]
+        # Role is decided once per distinct form type, then broadcast
+        self.role = np.array([role_for(f) for f in self.form_types], dtype=np.int8)[self.form_type]
+
+        self.number = np.array(
+            [float(r["value_number"]) if r.get("value_number") is not None else np.nan for _, r in rows],
+            dtype=np.float64)
+        self.date = np.array(
+            [str(r["value_date"])[:10] if r.get("value_date") else "NaT" for _, r in rows],
+            dtype="datetime64[D]")
+
+        texts = [r.get("value_text") or "" for _, r in rows]
+        self.texts, text_codes = np.unique(np.array(texts or [""], dtype=object), return_inverse=True)
+        self.text = text_codes[:self.size]
+        self.has_text = np.array([bool(t) for t in texts], dtype=bool)
+
+        units = [r.get("unit") or "" for _, r in rows]
+        self.units, unit_codes = np.unique(np.array(units or [""], dtype=object), return_inverse=True)
+        self.unit = unit_codes[:self.size]
+
+        self.currency = np.array([r.get("currency") or "" for _, r in rows] or [], dtype=object)
+
+    def key_mask(self, key: str) -> np.ndarray:
+        position = np.searchsorted(self.keys, key)
+        if position >= len(self.keys) or self.keys[position] != key:
+            return np.zeros(self.size, dtype=bool)
+        return self.key == position
+
+    def finding(self, rule: str, key: str, i: int, expected, found, message: str) -> Dict:
+        return {
+            "rule": rule,
+            "field": key,
+            "document_id": self.documents[self.document[i]],
+            "form_type": self.form_types[self.form_type[i]],
+            "expected": expected,
+            "found": found,
+            "message": message,
+        }
+
+
+# ---------------------- Rules ----------------------
+
+def _date_str(value) -> Optional[str]:
+    return None if np.isnat(value) else str(value)
+
+
+def credit_amount(frame: FieldFrame):
+    """(largest LC amount, its currency or ""), or (None, "") without an LC amount."""
+    lc = np.flatnonzero(frame.key_mask("amount") & ~np.isnan(frame.number) & (frame.role == ROLE_LC))
+    if not lc.size:
+        return None, ""
+    i = lc[np.argmax(frame.number[lc])]
+    currency = frame.currency[i]
+    if not currency:
+        # "Amount: 10,000.00" with the currency in its own LC field
+        codes = frame.text[frame.key_mask("currency") & (frame.role == ROLE_LC) & frame.has_text]
+        currency = frame.texts[codes[0]] if codes.size else ""
+    return frame.number[i], currency
+
+
+def rule_amount_tolerance(frame: FieldFrame) -> List[Dict]:
+    """Invoice / draft amounts in the credit's currency (or none stated) must not exceed the credit amount."""
+    credit, currency = credit_amount(frame)
+    if credit is None:
+        return []
+    limit = credit * (1 + AMOUNT_TOLERANCE)
+    amount = frame.key_mask("amount") & ~np.isnan(frame.number) & np.isin(frame.role, AMOUNT_ROLES)
+    if currency:
+        amount &= (frame.currency == currency) | (frame.currency == "")
+    over = np.flatnonzero(amount & (frame.number > limit + 0.005))
+    return [frame.finding("amount_tolerance", "amount", i, round(limit, 2), frame.number[i],
+                          f"Amount {frame.number[i]:,.2f} exceeds credit amount {limit:,.2f} {currency}".rstrip())
+            for i in over]
+
+
+def rule_date_order(frame: FieldFrame) -> List[Dict]:
+    """Shipment no later than the latest shipment date; documents dated before expiry."""
+    findings = []
+    lc = frame.role == ROLE_LC
+    for later_key, limit_key, message in (
+        ("shipment_date", "latest_shipment_date", "Shipment {found} after latest shipment date {expected}"),
+        ("shipment_date", "expiry_date", "Shipment {found} after credit expiry {expected}"),
+        ("issue_date", "expiry_date", "Document dated {found} after credit expiry {expected}"),
+    ):
+        limits = frame.date[frame.key_mask(limit_key) & lc & ~np.isnat(frame.date)]
+        if not limits.size:
+            continue
+        limit = limits.min()
+        candidates = frame.key_mask(later_key) & ~lc & ~np.isnat(frame.date)
+        for i in np.flatnonzero(candidates & (frame.date > limit)):
+            expected, found = _date_str(limit), _date_str(frame.date[i])
+            findings.append(frame.finding("date_order", later_key, i, expected, found,
+                                          message.format(found=found, expected=expected)))
+    return findings
+
+
+def rule_field_match(frame: FieldFrame) -> List[Dict]:
+    """Ports, parties, LC number and currency must agree with the LC (or the session consensus)."""
+    findings = []
+    for key in MATCH_KEYS:
+        mask = frame.key_mask(key) & frame.has_text
+        if not mask.any():
+            continue
+        lc = mask & (frame.role == ROLE_LC)
+        reference_codes = frame.text[lc] if lc.any() else frame.text[mask]
+        counts = np.bincount(reference_codes)
+        reference = int(np.argmax(counts))
+        if not lc.any() and counts[reference] < 2:
+            continue                      # no LC and no consensus to compare against
+        for i in np.flatnonzero(mask & ~(frame.role == ROLE_LC) & (frame.text != reference)):
+            expected, found = frame.texts[reference], frame.texts[frame.text[i]]
+            findings.append(frame.finding("field_match", key, i, expected, found,
+                                          f"{key} '{found}' does not match '{expected}'"))
+    return findings
+
+
+def _sums_by_role(frame: FieldFrame, key: str) -> Dict:
+    """(role, unit) -> summed quantity, via one bincount over combined codes."""
+    rows = np.flatnonzero(frame.key_mask(key) & ~np.isnan(frame.number))
+    if not rows.size:
+        return {}
+    # The same value under two keys of one page ("Quantity", "Total Quantity") counts once
+    _, first = np.unique(np.stack([frame.document[rows], frame.form_type[rows], frame.page[rows],
+                                   frame.unit[rows], frame.number[rows]], axis=1), axis=0, return_index=True)
+    rows = rows[np.sort(first)]
+    combined = frame.role[rows].astype(np.int64) * len(frame.units) + frame.unit[rows]
+    totals = np.bincount(combined, weights=frame.number[rows])
+    present = np.bincount(combined)
+    return {
+        (int(code // len(frame.units)), frame.units[code % len(frame.units)]): totals[code]
+        for code in np.flatnonzero(present)
+    }
+
+
+def rule_quantity_sums(frame: FieldFrame) -> List[Dict]:
+    """Packing list and transport document totals must agree with the invoice within tolerance."""
+    findings = []
+    for key, tolerance, reference_role, compared_roles in (
+        ("quantity", QUANTITY_TOLERANCE, ROLE_INVOICE, (ROLE_PACKING, ROLE_TRANSPORT)),
+        ("gross_weight", WEIGHT_TOLERANCE, ROLE_PACKING, (ROLE_TRANSPORT,)),
+        ("net_weight", WEIGHT_TOLERANCE, ROLE_PACKING, (ROLE_INVOICE,)),
+    ):
+        sums = _sums_by_role(frame, key)
+        for (role, unit), total in sums.items():
+            if role not in compared_roles:
+                continue
+            expected = sums.get((reference_role, unit))
+            if expected is None or not expected:
+                continue
+            if abs(total - expected) / expected > tolerance:
+                findings.append({
+                    "rule": "quantity_sum",
+                    "field": key,
+                    "document_id": None,
+                    "form_type": ROLE_NAMES[role],
+                    "expected": round(float(expected), 3),
+                    "found": round(float(total), 3),
+                    "message": f"{ROLE_NAMES[role]} {key} total {total:,.3f} {unit} differs from "
+                               f"{ROLE_NAMES[reference_role]} {expected:,.3f} {unit} by more than {tolerance:.0%}",
+                })
+    return findings
+
+
+RULES = [rule_amount_tolerance, rule_date_order, rule_field_match, rule_quantity_sums]
+
+
+# ---------------------- Line item rules ----------------------
+
+def _field_values(frame: FieldFrame, key: str) -> Dict:
+    """(document_id, form_type) -> largest value of `key` in that document."""
+    values = {}
+    for i in np.flatnonzero(frame.key_mask(key) & ~np.isnan(frame.number)):
+        doc = (str(frame.documents[frame.document[i]]), frame.form_types[frame.form_type[i]])
+        values[doc] = max(values.get(doc, -np.inf), frame.number[i])
+    return values
+
+
+def _item_finding(items: ItemFrame, rule: str, key: str, code: int, expected, found, message: str) -> Dict:
+    document_id, form_type = items.document_key(code)
+    pages = items.pages(code)
+    return {"rule": rule, "field": key, "document_id": document_id, "form_type": form_type,
+            "expected": round(float(expected), 3), "found": round(float(found), 3),
+            "message": f"{pages}: {message}" if pages else message}
+
+
+def rule_line_item_totals(frame: FieldFrame, items: ItemFrame) -> List[Dict]:
+    """Summed line items must equal the document's stated total (its Total row, else its field)."""
+    findings = []
+    for column in ("amount", "quantity", "net_weight", "gross_weight"):
+        summed = items.sums(column)
+        stated = items.stated(column)
+        fields = _field_values(frame, column)
+        if fields:
+            from_fields = np.array([fields.get(items.document_key(code), np.nan)
+                                    for code in range(len(items.documents))])
+            stated = np.where(np.isnan(stated), from_fields, stated)
+        checked = ~np.isnan(summed) & ~np.isnan(stated)
+        off = checked & (np.abs(summed - stated) > np.maximum(0.01, LINE_TOTAL_TOLERANCE * np.abs(stated)))
+        for code in np.flatnonzero(off):
+            findings.append(_item_finding(items, "line_item_total", column, code, stated[code], summed[code],
+                                          f"Line items sum to {summed[code]:,.3f} {column}, "
+                                          f"document states {stated[code]:,.3f}"))
+    return findings
+
+
+def rule_line_item_credit(frame: FieldFrame, items: ItemFrame) -> List[Dict]:
+    """Invoiced line items in the credit's currency (or none stated) must not exceed the credit amount."""
+    credit, currency = credit_amount(frame)
+    if credit is None or not items.size:
+        return []
+    limit = credit * (1 + AMOUNT_TOLERANCE)
+    roles = np.array([role_for(items.document_key(code)[1]) for code in range(len(items.documents))])
+    mask = (items.currency == currency) | (items.currency == "") if currency else None
+    summed = items.sums("amount", mask)
+    over = np.flatnonzero((roles == ROLE_INVOICE) & ~np.isnan(summed) & (summed > limit + 0.005))
+    return [_item_finding(items, "line_item_credit", "amount", code, limit, summed[code],
+                          f"Invoice line items total {summed[code]:,.2f} exceeds credit amount {limit:,.2f}")
+            for code in over]
+
+
+ITEM_RULES = [rule_line_item_totals, rule_line_item_credit]
+
+
+# ---------------------- Entry points ----------------------
+
+def load_frame(conn, session_id) -> FieldFrame:
+    index = load_session_index(conn, session_id)
+    if not index:
+        # Sessions processed before the field index existed: index on the fly
+        cursor = conn.cursor()
+        cursor.execute("SELECT document_id, form_type, field_key, field_value FROM TF_fields_KeyValuePair "
+                       "WHERE session_id = ?", (str(session_id),))
+        for document_id, form_type, key, value in cursor.fetchall():
+            for row in index_fields({key: value}):
+                index.setdefault(row.pop("canonical_key"), []).append(
+                    dict(row, document_id=document_id, form_type=form_type))
+    return FieldFrame(index)
+
+
+def check_session(conn, session_id) -> List[Dict]:
+    with span("discrepancy_load"):
+        frame = load_frame(conn, session_id)
+    findings = []
+    for rule in RULES:
+        with span("discrepancy_rule", rule=rule.__name__):
+            findings.extend(rule(frame))
+    try:
+        with span("discrepancy_load"):
+            items = ItemFrame(load_session_items(conn, session_id))
+    except Exception as e:
+        conn.rollback()
+        print(f"[LineItems] Skipped line item checks: {e}")
+        items = None
+    if items is not None and items.size:
+        for rule in ITEM_RULES:
+            with span("discrepancy_rule", rule=rule.__name__):
+                findings.extend(rule(frame, items))
+    for finding in findings:
+        for field in ("expected", "found"):
+            if isinstance(finding[field], np.generic):
+                finding[field] = finding[field].item()
+    return findings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check a session's documents against each other")
+    parser.add_argument("session_id")
+    parser.add_argument("--json", help="Write findings to this path")
+    args = parser.parse_args()
+
+    with profile_run("discrepancy"):
+        conn = get_sql_server_connection()
+        findings = check_session(conn, args.session_id)
+        conn.close()
+
+    for f in findings:
+        print(f"[{f['rule']}] {f['form_type']} {f['document_id'] or ''}: {f['message']}")
+    print(f"\n {len(findings)} discrepancies in session {args.session_id}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as out:
+            json.dump(findings, out, indent=2, default=str)
@@ -0,0 +1,271 @@
+import os
+import re
+import json
+import shutil
+import argparse
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional
+from storage_codec import decode_text
+from instrumentation import span, profile_run
+
+# Columnar export of extracted fields, line items, page text and catalog matches.
+#
+# Quality analytics and classifier training otherwise page through
+# TF_fields_KeyValuePair / TF_mdocs_mgroups row by row on the production
+# SQL Server. export_session() streams one session's rows (fetchmany) into
+# Parquet files with a fixed Arrow schema per dataset, partitioned Hive
+# style so readers can prune by session:
+#
+#   exports/<dataset>/session_id=<id>/part-0.parquet
+#
+# Each partition is written to a staging directory and swapped in, so
+# re-exporting a session (after re-ingestion) replaces it whole; a re-export
+# that finds no rows keeps the old partition. Sessions that already have a
+# partition are skipped unless --overwrite is given, and datasets whose
+# tables do not exist (field_index / line_items before their migrations)
+# are skipped.
+# Strings are dictionary-encoded and files zstd-compressed by the Parquet
+# writer; OCR text is stored decoded (storage_codec).
+#
+# pyarrow is only needed here and in read_dataset(); the pipeline does not
+# import this module.
+#
+#   python export_parquet.py [--sessions <id> ...] [--datasets fields catalog]
+#                            [--out exports/] [--overwrite]
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+EXPORT_DIR = os.getenv("TF_EXPORT_DIR", os.path.join(ROOT_DIR, "exports"))
+SCHEMA_VERSION = "1"
+FETCH_ROWS = 5000              # rows per fetchmany() and per Arrow record batch
+ROW_GROUP_ROWS = 100_000
+COMPRESSION = "zstd"
+PART_FILE = "part-0.parquet"
+
+_pa = None
+
+
+def _load_pyarrow():
+    global _pa
+    if _pa is None:
+        try:
+            import pyarrow
+            import pyarrow.parquet  # noqa: F401  (registers pyarrow.parquet)
+            _pa = pyarrow
+        except ImportError:
+            raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow)")
+    return _pa
+
+
+# ---------------------- Datasets ----------------------
+
+def _timestamp(value):
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    return value
+
+
+def _date(value):
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+
+def _number(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def _text(value):
+    return None if value is None else str(value)
+
+
+# dataset -> (query whose ? placeholders all take the session id,
+#             [(column, arrow type name, converter)])
+# Column order and types are the stable schema; add columns at the end and
+# bump SCHEMA_VERSION when changing them.
+DATASETS = {
+    "fields": (
+        "SELECT document_id, form_type, field_key, field_value, extracted_at "
+        "FROM TF_fields_KeyValuePair WHERE session_id = ? ORDER BY document_id, id",
+        [("document_id", "string", _text), ("form_type", "string", _text), ("field_key", "string", _text),
+         ("field_value", "string", _text), ("extracted_at", "timestamp", _timestamp)],
+    ),
+    "field_index": (
+        "SELECT document_id, page_name, form_type, canonical_key, value_type, raw_key, raw_value, "
+        "value_text, value_number, value_date, currency, unit, extracted_at "
+        "FROM TF_field_index WHERE session_id = ? ORDER BY document_id, id",
+        [("document_id", "string", _text), ("page_name", "string", _text), ("form_type", "string", _text),
+         ("canonical_key", "string", _text), ("value_type", "string", _text), ("raw_key", "string", _text),
+         ("raw_value", "string", _text), ("value_text", "string", _text), ("value_number", "float64", _number),
+         ("value_date", "date", _date), ("currency", "string", _text), ("unit", "string", _text),
+         ("extracted_at", "timestamp", _timestamp)],
+    ),
+    "line_items": (
+        "SELECT document_id, page_name, form_type, row_index, is_total, description, quantity, unit, "
+        "unit_price, amount, currency, net_weight, gross_weight, packages, extracted_at "
+        "FROM TF_line_items WHERE session_id = ? ORDER BY document_id, id",
+        [("document_id", "string", _text), ("page_name", "string", _text), ("form_type", "string", _text),
+         ("row_index", "int32", None), ("is_total", "bool", bool), ("description", "string", _text),
+         ("quantity", "float64", _number), ("unit", "string", _text), ("unit_price", "float64", _number),
+         ("amount", "float64", _number), ("currency", "string", _text), ("net_weight", "float64", _number),
+         ("gross_weight", "float64", _number), ("packages", "float64", _number),
+         ("extracted_at", "timestamp", _timestamp)],
+    ),
+    "pages": (
+        "SELECT document_id, 'page' AS kind, form_type AS name, ocr_text, created_at "
+        "FROM TF_ingestion_CleanedOCR WHERE session_id = ? "
+        "UNION ALL "
+        "SELECT document_id, 'group' AS kind, form_type AS name, ocr_text, created_at "
+        "FROM TF_ingestion_mGroupsOCR WHERE session_id = ? "
+        "ORDER BY document_id, kind, name",
+        [("document_id", "string", _text), ("kind", "string", _text), ("name", "string", _text),
+         ("ocr_text", "string", decode_text), ("created_at", "timestamp", _timestamp)],
+    ),
+    "catalog": (
+        "SELECT document_id, grouped_form_type, matched_document_name, matched_document_id, "
+        "confidence_score, cataloged_at "
+        "FROM TF_mdocs_mgroups WHERE session_id = ? ORDER BY document_id, id",
+        [("document_id", "string", _text), ("grouped_form_type", "string", _text),
+         ("matched_document_name", "string", _text), ("matched_document_id", "string", _text),
+         ("confidence_score", "float64", _number), ("cataloged_at", "timestamp", _timestamp)],
+    ),
+}
+
+
+def arrow_schema(dataset: str):
+    pa = _load_pyarrow()
+    types = {"string": pa.string(), "float64": pa.float64(), "int32": pa.int32(), "bool": pa.bool_(),
+             "date": pa.date32(), "timestamp": pa.timestamp("ms")}
+    fields = [pa.field(name, types[type_name]) for name, type_name, _ in DATASETS[dataset][1]]
+    return pa.schema(fields, metadata={"tf_dataset": dataset, "tf_schema_version": SCHEMA_VERSION})
+
+
+def partition_dir(out_dir: str, dataset: str, session_id) -> str:
+    return os.path.join(out_dir, dataset, f"session_id={session_id}")
+
+
+def _record_batch(schema, columns, rows):
+    pa = _load_pyarrow()
+    arrays = [
+        pa.array([row[i] if convert is None else convert(row[i]) for row in rows], type=schema.field(i).type)
+        for i, (_, _, convert) in enumerate(columns)
+    ]
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def export_dataset(conn, dataset: str, session_id, out_dir: str = EXPORT_DIR) -> int:
+    """Write one session's partition of `dataset`; returns the row count (0 writes nothing)."""
+    pa = _load_pyarrow()
+    query, columns = DATASETS[dataset]
+    schema = arrow_schema(dataset)
+    cursor = conn.cursor()
+    cursor.execute(query, (str(session_id),) * query.count("?"))
+
+    target = partition_dir(out_dir, dataset, session_id)
+    staging = target + ".tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    writer, count = None, 0
+    try:
+        while True:
+            rows = cursor.fetchmany(FETCH_ROWS)
+            if not rows:
+                break
+            if writer is None:
+                os.makedirs(staging)
+                writer = pa.parquet.ParquetWriter(os.path.join(staging, PART_FILE), schema,
+                                                  compression=COMPRESSION, use_dictionary=True)
+            writer.write_batch(_record_batch(schema, columns, rows), row_group_size=ROW_GROUP_ROWS)
+            count += len(rows)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if count:
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(staging, target)
+    return count
+
+
+def available_datasets(conn, datasets: Iterable[str]) -> List[str]:
+    """`datasets` minus those reading a table missing from this database (migration not applied)."""
+    cursor = conn.cursor()
+    available = []
+    for dataset in datasets:
+        missing = []
+        for table in sorted(set(re.findall(r"\bFROM (\w+)", DATASETS[dataset][0]))):
+            cursor.execute("SELECT OBJECT_ID(?, 'U')", (table,))
+            row = cursor.fetchone()
+            if not row or row[0] is None:
+                missing.append(table)
+        if missing:
+            print(f"[Export] {dataset} skipped: {', '.join(missing)} does not exist")
+        else:
+            available.append(dataset)
+    return available
+
+
+def export_session(conn, session_id, datasets: Iterable[str] = None, out_dir: str = EXPORT_DIR,
+                   overwrite: bool = False) -> Dict[str, Optional[int]]:
+    """{dataset: rows written, or None when an existing partition was kept}; missing datasets are left out."""
+    counts = {}
+    for dataset in available_datasets(conn, datasets or DATASETS):
+        if not overwrite and os.path.isdir(partition_dir(out_dir, dataset, session_id)):
+            counts[dataset] = None
+            continue
+        with span("export_parquet", dataset=dataset):
+            counts[dataset] = export_dataset(conn, dataset, session_id, out_dir)
+    return counts
+
+
+def list_sessions(conn) -> List[str]:
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT CAST(session_id AS NVARCHAR(64)) FROM TF_fields_KeyValuePair "
+        "UNION SELECT CAST(session_id AS NVARCHAR(64)) FROM TF_ingestion_CleanedOCR "
+        "UNION SELECT CAST(session_id AS NVARCHAR(64)) FROM TF_ingestion_mGroupsOCR "
+        "UNION SELECT CAST(session_id AS NVARCHAR(64)) FROM TF_mdocs_mgroups"
+    )
+    return sorted(str(row[0]) for row in cursor.fetchall() if row[0] is not None)
+
+
+# ---------------------- Reading ----------------------
+
+def read_dataset(dataset: str, out_dir: str = EXPORT_DIR, session_ids: Iterable = None, columns: List[str] = None):
+    """Arrow table of an exported dataset, with session_id from the partition path."""
+    pa = _load_pyarrow()
+    import pyarrow.dataset as ds
+    partitioning = ds.partitioning(pa.schema([pa.field("session_id", pa.string())]), flavor="hive")
+    data = ds.dataset(os.path.join(out_dir, dataset), format="parquet", partitioning=partitioning,
+                      schema=arrow_schema(dataset).append(pa.field("session_id", pa.string())))
+    flt = None
+    if session_ids is not None:
+        flt = ds.field("session_id").isin([str(s) for s in session_ids])
+    return data.to_table(columns=columns, filter=flt)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export fields, page text and catalog matches to Parquet")
+    parser.add_argument("--sessions", nargs="+", help="Session ids (default: every session in the database)")
+    parser.add_argument("--datasets", nargs="+", choices=list(DATASETS), default=list(DATASETS))
+    parser.add_argument("--out", default=EXPORT_DIR)
+    parser.add_argument("--overwrite", action="store_true", help="Re-export sessions that already have partitions")
+    args = parser.parse_args()
+
+    from db_utils import get_sql_server_connection
+    with profile_run("export_parquet"):
+        conn = get_sql_server_connection()
+        sessions = args.sessions or list_sessions(conn)
+        totals = dict.fromkeys(args.datasets, 0)
+        for session_id in sessions:
+            counts = export_session(conn, session_id, args.datasets, args.out, args.overwrite)
+            for dataset, count in counts.items():
+                totals[dataset] += count or 0
+            print(f"{session_id}: " + ", ".join(
+                f"{d}={'kept' if c is None else c}" for d, c in counts.items()))
+        conn.close()
+
+    print(json.dumps({"out": args.out, "sessions": len(sessions), "rows": totals}))
@@ -0,0 +1,186 @@
+import io
+import time
+import uuid
+import sqlite3
+from datetime import datetime
+from types import SimpleNamespace
+from PyPDF2 import PdfReader
+
+# Local stand-ins for Azure Document Intelligence, Azure OpenAI and SQL Server.
+# Used by the offline benchmark so pipeline scripts run without network access
+# or database credentials.
+
+
+# ---------------------- Document Intelligence ----------------------
+
+class FakeAnalyzePoller:
+    def __init__(self, result):
+        self._result = result
+
+    def result(self):
+        return self._result
+
+
+class FakeDocumentIntelligenceClient:
+    """Mimics `begin_analyze_document` using the PDF's embedded text layer."""
+
+    def __init__(self, *args, latency: float = 0.0, **kwargs):
+        self.latency = latency
+
+    def begin_analyze_document(self, model_id, body, **kwargs):
+        data = body.read() if hasattr(body, "read") else body
+        if self.latency:
+            time.sleep(self.latency)
+
+        pages, pairs = [], []
+        for number, page in enumerate(PdfReader(io.BytesIO(data)).pages, start=1):
+            text = page.extract_text() or ""
+            lines = [SimpleNamespace(content=line.strip()) for line in text.splitlines() if line.strip()]
+            pages.append(SimpleNamespace(page_number=number, lines=lines, selection_marks=[]))
+            # "Key: value" lines stand in for the keyValuePairs add-on
+            if "keyValuePairs" in (kwargs.get("features") or []):
+                regions = [SimpleNamespace(page_number=number)]
+                for line in lines:
+                    key, sep, value = line.content.partition(":")
+                    if sep and key.strip() and value.strip():
+                        pairs.append(SimpleNamespace(
+                            key=SimpleNamespace(content=key, bounding_regions=regions, spans=[]),
+                            value=SimpleNamespace(content=value, bounding_regions=regions, spans=[]),
+                            confidence=0.9))
+        return FakeAnalyzePoller(SimpleNamespace(pages=pages, key_value_pairs=pairs, tables=[], content="\n".join(
+            "\n".join(line.content for line in page.lines) for page in pages
+        )))
+
+
+# ---------------------- Azure OpenAI ----------------------
+
+# Keyword -> label used to answer classification prompts deterministically
+CLASSIFICATION_KEYWORDS = [
+    ("bill of lading", "Bill of Lading"),
+    ("packing list", "Packing List"),
+    ("invoice", "Commercial Invoice"),
+    ("certificate of origin", "Certificate of Origin"),
+    ("insurance", "Insurance Certificate"),
+    ("bill of exchange", "Bill of Exchange"),
+    ("letter of credit", "Letter of Credit"),
+    ("documentary credit", "Letter of Credit"),
+]
+
+
+class _FakeCompletions:
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def create(self, model=None, messages=None, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+
+        prompt_parts = []
+        has_image = False
+        for message in messages or []:
+            # Instructions (system) name example types; only classify the page text
+            if message.get("role") == "system":
+                continue
+            content = message.get("content")
+            if isinstance(content, str):
+                prompt_parts.append(content)
+            else:
+                for part in content or []:
+                    if part.get("type") == "text":
+                        prompt_parts.append(part.get("text", ""))
+                    elif part.get("type") == "image_url":
+                        has_image = True
+
+        if has_image:
+            # No local vision model: an empty answer makes callers fall back to
+            # Document Intelligence / Tesseract text, as they do in production
+            # when the content filter blocks a page.
+            answer = ""
+        else:
+            prompt = "\n".join(prompt_parts).lower()
+            answer = "Unclassified Document"
+            for keyword, label in CLASSIFICATION_KEYWORDS:
+                if keyword in prompt:
+                    answer = label
+                    break
+
+        message = SimpleNamespace(content=answer, role="assistant")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason="stop")])
+
+
+class FakeAzureOpenAI:
+    def __init__(self, *args, latency: float = 0.0, **kwargs):
+        self.chat = SimpleNamespace(completions=_FakeCompletions(latency))
+
+
+# ---------------------- SQL Server ----------------------
+
+OFFLINE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS TF_ingestion_CleanedOCR (id INTEGER PRIMARY KEY, session_id TEXT, document_id TEXT, form_type TEXT, ocr_text TEXT, is_partial INTEGER NOT NULL DEFAULT 0, created_at TEXT);
+CREATE TABLE IF NOT EXISTS TF_ingestion_CleanedPDF (id INTEGER PRIMARY KEY, session_id TEXT, document_id TEXT, form_type TEXT, file_data BLOB, created_at TEXT);
+CREATE TABLE IF NOT EXISTS TF_fields_delta (id INTEGER PRIMARY KEY, session_id TEXT, document_id TEXT, form_type TEXT, field_key TEXT, extracted_at TEXT);
+CREATE TABLE IF NOT EXISTS TF_fields_KeyValuePair (id INTEGER PRIMARY KEY, session_id TEXT, document_id TEXT, form_type TEXT, field_key TEXT, field_value TEXT, extracted_at TEXT);
+CREATE TABLE IF NOT EXISTS TF_field_index (id INTEGER PRIMARY KEY, session_id TEXT, document_id TEXT, page_name TEXT, form_type TEXT, canonical_key TEXT, value_type TEXT, raw_key TEXT, raw_value TEXT, value_text TEXT, value_number REAL, value_date TEXT, currency TEXT, unit TEXT, extracted_at TEXT);
+CREATE TABLE IF NOT EXISTS ingestion_fields_new (id INTEGER PRIMARY KEY, session_id TEXT, document_id TEXT, form_type TEXT, fields_json TEXT);
+CREATE TABLE IF NOT EXISTS TF_ingestion_mGroupsPDF (id INTEGER PRIMARY KEY, session_id TEXT, document_id TEXT, form_type TEXT, file_data BLOB, file_sha256 TEXT, created_at TEXT);
+CREATE TABLE IF NOT EXISTS TF_ingestion_mGroupsOCR (id INTEGER PRIMARY KEY, session_id TEXT, document_id TEXT, form_type TEXT, ocr_text TEXT, created_at TEXT);
+CREATE TABLE IF NOT EXISTS TF_ingestion_mGroupsFields (id INTEGER PRIMARY KEY, session_id TEXT, document_id TEXT, form_type TEXT, fields_json TEXT, created_at TEXT);
+CREATE TABLE IF NOT EXISTS TF_mdocs_mgroups (id INTEGER PRIMARY KEY, session_id TEXT, document_id TEXT, grouped_form_type TEXT, matched_document_name TEXT, matched_document_id TEXT, confidence_score REAL, cataloged_at TEXT);
+CREATE TABLE IF NOT EXISTS TF_line_items (id INTEGER PRIMARY KEY, session_id TEXT, document_id TEXT, page_name TEXT, form_type TEXT, row_index INTEGER, is_total INTEGER, description TEXT, quantity REAL, unit TEXT, unit_price REAL, amount REAL, currency TEXT, net_weight REAL, gross_weight REAL, packages REAL, extracted_at TEXT);
+CREATE TABLE IF NOT EXISTS TF_page_previews (id INTEGER PRIMARY KEY, session_id TEXT, document_id TEXT, page_name TEXT, kind TEXT, file_name TEXT, image_format TEXT, width INTEGER, height INTEGER, byte_size INTEGER, created_at TEXT);
+CREATE TABLE IF NOT EXISTS TF_pipeline_runs (id INTEGER PRIMARY KEY, file_hash TEXT, engine_config TEXT, stage TEXT, session_id TEXT, document_id TEXT, output_path TEXT, completed_at TEXT);
+CREATE TABLE IF NOT EXISTS Attributes_TF_Document (DocumentID TEXT, DocumentName TEXT);
+"""
+
+MASTER_DOCUMENT_NAMES = [
+    "Commercial Invoice",
+    "Bill of Lading",
+    "Packing List",
+    "Letter of Credit",
+    "LC Application",
+    "Certificate of Origin",
+    "Insurance Certificate",
+    "Bill of Exchange",
+]
+
+
+class FakeRow(tuple):
+    """Row supporting both index and attribute access, like pyodbc.Row."""
+
+    def __new__(cls, names, values):
+        row = super().__new__(cls, values)
+        row._names = names
+        return row
+
+    def __getattr__(self, name):
+        try:
+            return self[self._names.index(name)]
+        except ValueError:
+            raise AttributeError(name)
+
+
+def _row_factory(cursor, row):
+    return FakeRow([column[0] for column in cursor.description], row)
+
+
+sqlite3.register_adapter(uuid.UUID, str)
+
+
+def sqlite_connection(path: str = ":memory:", seed_master: bool = True):
+    """SQLite connection exposing the pyodbc surface the pipeline uses."""
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.row_factory = _row_factory
+    conn.create_function("GETDATE", 0, lambda: datetime.now().isoformat(sep=" "))
+    conn.create_function("OBJECT_ID", 2, lambda name, kind: conn.execute(
+        "SELECT MAX(rowid) FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone()[0])
+    conn.create_function("COL_LENGTH", 2, lambda table, column: conn.execute(
+        "SELECT MAX(1) FROM pragma_table_info(?) WHERE name = ?", (table, column)).fetchone()[0])
+    conn.executescript(OFFLINE_SCHEMA)
+    already_seeded = conn.execute("SELECT COUNT(*) FROM Attributes_TF_Document").fetchone()[0]
+    if seed_master and not already_seeded:
+        conn.executemany(
+            "INSERT INTO Attributes_TF_Document (DocumentID, DocumentName) VALUES (?, ?)",
+            [(str(uuid.uuid5(uuid.NAMESPACE_URL, name)), name) for name in MASTER_DOCUMENT_NAMES]
+        )
+        conn.commit()
+    return conn
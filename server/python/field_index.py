@@ -0,0 +1,272 @@
+import os
+import re
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from typing import Dict, List, Optional, Tuple
+from rapidfuzz import fuzz, process
+
+# Normalized field index over extracted key/value pairs.
+#
+# extract_fields() produces free-form keys ("Total Amount", "AMOUNT USD",
+# "L/C No.") with string values. index_fields() maps each key to a canonical
+# name and parses the value into a typed form: amounts with currency,
+# dates, numbers with units, and upper-cased, punctuation-free text for
+# ports and parties. Rows land in TF_field_index (migrations/002) next to
+# TF_fields_KeyValuePair, keyed by (session_id, canonical_key), so "the
+# invoice amount vs the LC amount" is an index seek across the session.
+
+FIELD_INDEX_ENABLED = os.getenv("TF_FIELD_INDEX", "true").lower() not in ("0", "false", "no")
+FUZZY_KEY_THRESHOLD = 92
+
+# canonical key -> (value type, aliases). Aliases are compared after
+# normalize_key(), so punctuation and case do not matter.
+CANONICAL_FIELDS: Dict[str, Tuple[str, List[str]]] = {
+    "lc_number": ("text", ["lc no", "l c no", "lc number", "l c number", "documentary credit number",
+                           "credit number", "dc no", "letter of credit no", "lc ref"]),
+    "invoice_number": ("text", ["invoice no", "invoice number", "inv no", "invoice ref"]),
+    "bl_number": ("text", ["bl no", "b l no", "bill of lading no", "bill of lading number", "bl number"]),
+    "amount": ("amount", ["amount", "total amount", "invoice amount", "invoice value", "total value",
+                          "grand total", "total", "credit amount", "lc amount", "currency code amount",
+                          "amount usd", "amount in usd", "total invoice value"]),
+    "currency": ("text", ["currency", "curr"]),
+    "quantity": ("quantity", ["quantity", "qty", "total quantity", "total qty", "no of packages",
+                              "number of packages", "total packages", "packages"]),
+    "gross_weight": ("quantity", ["gross weight", "gross wt", "g w", "total gross weight"]),
+    "net_weight": ("quantity", ["net weight", "net wt", "n w", "total net weight"]),
+    "issue_date": ("date", ["date", "date of issue", "issue date", "invoice date", "dated"]),
+    "shipment_date": ("date", ["date of shipment", "shipment date", "shipped on board", "on board date",
+                               "shipped on board date", "bl date", "date of loading"]),
+    "latest_shipment_date": ("date", ["latest shipment date", "latest date of shipment", "latest shipment"]),
+    "expiry_date": ("date", ["expiry date", "date of expiry", "date and place of expiry", "expiry"]),
+    "port_of_loading": ("port", ["port of loading", "loading port", "pol", "from port", "port of shipment"]),
+    "port_of_discharge": ("port", ["port of discharge", "discharge port", "pod", "destination port",
+                                   "port of destination", "final destination"]),
+    "vessel": ("text", ["vessel", "vessel name", "ocean vessel", "vessel voyage", "vessel voy"]),
+    "beneficiary": ("party", ["beneficiary", "seller", "exporter"]),
+    "applicant": ("party", ["applicant", "buyer", "importer"]),
+    "shipper": ("party", ["shipper", "consignor"]),
+    "consignee": ("party", ["consignee"]),
+    "notify_party": ("party", ["notify party", "notify"]),
+    "goods_description": ("text", ["description of goods", "goods description", "description",
+                                   "commodity"]),
+    "incoterm": ("text", ["incoterm", "incoterms", "terms of delivery", "trade terms"]),
+}
+
+_ALIASES = {alias: canonical for canonical, (_, aliases) in CANONICAL_FIELDS.items() for alias in aliases}
+_ALIAS_LIST = list(_ALIASES)
+
+CURRENCY_SYMBOLS = {"$": "USD", "US$": "USD", "€": "EUR", "£": "GBP", "¥": "JPY", "₹": "INR"}
+_CURRENCY_RE = re.compile(r"\b(USD|EUR|GBP|JPY|CNY|INR|AED|SGD|HKD|CHF|AUD|CAD|SAR|MYR|THB|IDR|BDT|PKR|LKR)\b")
+_NUMBER_RE = re.compile(r"-?\d[\d.,' ]*\d|-?\d")
+_UNIT_RE = re.compile(r"\b(KGS?|KILOS?|MT|TONS?|LBS?|PCS|PIECES|CTNS?|CARTONS?|BAGS?|UNITS?|SETS?|PKGS?|PACKAGES|CBM|M3)\b",
+                      re.IGNORECASE)
+_UNIT_CANON = {"KG": "KG", "KGS": "KG", "KILO": "KG", "KILOS": "KG", "MT": "MT", "TON": "MT", "TONS": "MT",
+               "LB": "LB", "LBS": "LB", "PCS": "PCS", "PIECES": "PCS", "CTN": "CTN", "CTNS": "CTN",
+               "CARTON": "CTN", "CARTONS": "CTN", "BAG": "BAG", "BAGS": "BAG", "UNIT": "UNIT", "UNITS": "UNIT",
+               "SET": "SET", "SETS": "SET", "PKG": "PKG", "PKGS": "PKG", "PACKAGES": "PKG", "CBM": "CBM", "M3": "CBM"}
+DATE_FORMATS = ["%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%Y-%m-%d", "%Y/%m/%d", "%d %b %Y", "%d %B %Y",
+                "%d-%b-%Y", "%d-%b-%y", "%b %d %Y", "%B %d %Y", "%d%b%Y", "%d/%m/%y", "%y%m%d"]
+_PARTY_NOISE_RE = re.compile(r"\b(M/S|MESSRS|CO|LTD|LIMITED|LLC|INC|CORP|CORPORATION|PVT|PLC|GMBH)\b\.?")
+
+
+# ---------------------- Parsing ----------------------
+
+def normalize_key(key: str) -> str:
+    return re.sub(r"\s+", " ", re.sub(r"[^a-z0-9]+", " ", (key or "").lower())).strip()
+
+
+def canonical_key(raw_key: str) -> Optional[str]:
+    key = normalize_key(raw_key)
+    if not key:
+        return None
+    if key in _ALIASES:
+        return _ALIASES[key]
+    match = process.extractOne(key, _ALIAS_LIST, scorer=fuzz.ratio, score_cutoff=FUZZY_KEY_THRESHOLD)
+    return _ALIASES[match[0]] if match else None
+
+
+def parse_number(text: str) -> Optional[Decimal]:
+    """First number in `text`; handles 1,234.56 / 1.234,56 / 1 234,56 / 1'234.56."""
+    match = _NUMBER_RE.search(text or "")
+    if not match:
+        return None
+    number = match.group(0).replace(" ", "").replace("'", "")
+    if "," in number and "." in number:
+        if number.rfind(",") > number.rfind("."):
+            number = number.replace(".", "").replace(",", ".")
+        else:
+            number = number.replace(",", "")
+    elif "," in number:
+        head, _, tail = number.rpartition(",")
+        number = number.replace(",", "") if len(tail) == 3 else head.replace(",", "") + "." + tail
+    try:
+        return Decimal(number)
+    except InvalidOperation:
+        return None
+
+
+def parse_currency(text: str) -> Optional[str]:
+    upper = (text or "").upper()
+    match = _CURRENCY_RE.search(upper)
+    if match:
+        return match.group(1)
+    for symbol, code in CURRENCY_SYMBOLS.items():
+        if symbol in upper:
+            return code
+    return None
+
+
+def parse_unit(text: str) -> Optional[str]:
+    unit = _UNIT_RE.search(text or "")
+    return _UNIT_CANON.get(unit.group(1).upper()) if unit else None
+
+
+def parse_date(text: str) -> Optional[date]:
+    value = re.sub(r"\s+", " ", re.sub(r"(\d)(st|nd|rd|th)\b", r"\1", (text or "").strip(), flags=re.IGNORECASE))
+    value = value.replace(",", "")
+    candidates = [value] + re.findall(r"\d{1,4}[/.\- ][A-Za-z0-9]{1,9}[/.\- ]\d{2,4}|\b\d{6}\b", value)
+    for candidate in candidates:
+        for fmt in DATE_FORMATS:
+            try:
+                parsed = datetime.strptime(candidate.strip(), fmt).date()
+            except ValueError:
+                continue
+            if 1990 <= parsed.year <= 2100:
+                return parsed
+    return None
+
+
+def normalize_text_value(text: str) -> str:
+    return re.sub(r"\s+", " ", re.sub(r"[^A-Z0-9 ]+", " ", (text or "").upper())).strip()
+
+
+def normalize_party(text: str) -> str:
+    # First line / clause is the name; addresses vary between documents
+    name = re.split(r"[\n,;]", text or "", maxsplit=1)[0]
+    return normalize_text_value(_PARTY_NOISE_RE.sub(" ", name.upper()))
+
+
+def typed_value(value_type: str, raw_value: str) -> Dict:
+    """Typed columns for one value; unparseable values keep only value_text."""
+    raw_value = str(raw_value or "").strip()
+    row = {"value_text": normalize_text_value(raw_value)[:400], "value_number": None,
+           "value_date": None, "currency": None, "unit": None}
+    if value_type == "amount":
+        row["value_number"] = parse_number(raw_value)
+        row["currency"] = parse_currency(raw_value)
+    elif value_type == "quantity":
+        row["value_number"] = parse_number(raw_value)
+        row["unit"] = parse_unit(raw_value)
+    elif value_type == "date":
+        row["value_date"] = parse_date(raw_value)
+    elif value_type == "party":
+        row["value_text"] = normalize_party(raw_value)[:400]
+    elif value_type == "port":
+        # "Chennai, India" and "CHENNAI PORT" index as CHENNAI
+        port = re.split(r"[\n,;/(]", raw_value, maxsplit=1)[0]
+        row["value_text"] = re.sub(r"\s+(SEA ?PORT|PORT|HARBOU?R)$", "", normalize_text_value(port))[:400]
+    elif value_type == "text" and row["value_text"]:
+        currency = parse_currency(raw_value)
+        if currency and len(row["value_text"]) <= 3:
+            row["value_text"] = currency
+    return row
+
+
+def index_fields(fields: Dict) -> List[Dict]:
+    """Canonical, typed rows for the recognised keys of one extract_fields() dict."""
+    rows = []
+    seen = set()
+    for raw_key, raw_value in (fields or {}).items():
+        canonical = canonical_key(raw_key)
+        if not canonical or canonical in seen:
+            continue
+        value_type = CANONICAL_FIELDS[canonical][0]
+        row = {"canonical_key": canonical, "value_type": value_type,
+               "raw_key": str(raw_key)[:255], "raw_value": str(raw_value)[:1000]}
+        row.update(typed_value(value_type, raw_value))
+        if value_type == "amount" and not row["currency"] and parse_unit(str(raw_value)):
+            continue  # "Total: 25,000 KGS" on a packing list is a weight, not money
+        seen.add(canonical)
+        rows.append(row)
+    return rows
+
+
+# ---------------------- Storage ----------------------
+
+def save_field_index(conn, session_id, document_id, page_name, fields: Dict):
+    rows = index_fields(fields)
+    if not rows:
+        return 0
+    query = """
+    INSERT INTO TF_field_index (session_id, document_id, page_name, form_type, canonical_key, value_type,
+                                raw_key, raw_value, value_text, value_number, value_date, currency, unit, extracted_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, GETDATE())
+    """
+    cursor = conn.cursor()
+    cursor.executemany(query, [
+        (str(session_id), str(document_id), page_name, page_name, r["canonical_key"], r["value_type"],
+         r["raw_key"], r["raw_value"], r["value_text"],
+         str(r["value_number"]) if r["value_number"] is not None else None,
+         r["value_date"].isoformat() if r["value_date"] else None, r["currency"], r["unit"])
+        for r in rows
+    ])
+    conn.commit()
+    return len(rows)
+
+
+def relabel_pages(conn, session_id, document_id, page_names: List[str], form_type: str):
+    """Give index rows of grouped pages their document type (e.g. commercial_invoice)."""
+    if not page_names:
+        return
+    placeholders = ",".join("?" for _ in page_names)
+    cursor = conn.cursor()
+    cursor.execute(
+        f"UPDATE TF_field_index SET form_type = ? "
+        f"WHERE session_id = ? AND document_id = ? AND page_name IN ({placeholders})",
+        (form_type, str(session_id), str(document_id), *page_names),
+    )
+    conn.commit()
+
+
+# ---------------------- Lookups ----------------------
+
+def _rows(cursor) -> List[Dict]:
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def session_values(conn, session_id, canonical_key: str) -> List[Dict]:
+    """Every document's value for one canonical key in a session."""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT document_id, page_name, form_type, value_type, value_text, value_number, value_date, currency, unit
+        FROM TF_field_index
+        WHERE session_id = ? AND canonical_key = ?
+    """, (str(session_id), canonical_key))
+    return _rows(cursor)
+
+
+def documents_with_value(conn, session_id, canonical_key: str, value: str) -> List[Dict]:
+    """Inverted lookup: which documents of the session carry this value."""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT DISTINCT document_id, form_type
+        FROM TF_field_index
+        WHERE session_id = ? AND canonical_key = ? AND value_text = ?
+    """, (str(session_id), canonical_key, normalize_text_value(value)))
+    return _rows(cursor)
+
+
+def load_session_index(conn, session_id) -> Dict[str, List[Dict]]:
+    """canonical_key -> rows for a whole session, in one round trip."""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT canonical_key, document_id, page_name, form_type, value_type,
+               value_text, value_number, value_date, currency, unit
+        FROM TF_field_index
+        WHERE session_id = ?
+    """, (str(session_id),))
+    index: Dict[str, List[Dict]] = {}
+    for row in _rows(cursor):
+        index.setdefault(row.pop("canonical_key"), []).append(row)
+    return index
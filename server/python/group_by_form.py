@@ -1,21 +1,28 @@
 import os
+import io
 import json
 import re
-from PyPDF2 import PdfMerger
 from db_utils import (
     save_grouped_pdf_to_db,
     save_grouped_text_to_db,
     save_grouped_fields_to_db,
     get_sql_server_connection
 )
-from openai import AzureOpenAI
+from azure_clients import openai_client
 from dotenv import load_dotenv
 from rapidfuzz import fuzz, process  # For fuzzy matching
+from page_dedup import DUPLICATES_FILENAME
+from pdf_stream import write_merged_sources, write_pages_from_original
+from segmentation import SEGMENTATION_ENABLED, segment_pages
+from prompt_builder import build_messages, memoized
+from field_index import FIELD_INDEX_ENABLED, relabel_pages
+from line_items import LINE_ITEMS_ENABLED, relabel_pages as relabel_item_pages
+import search_index
+from artifact_reuse import GROUP_TABLES, try_record, try_reuse
+from instrumentation import span, profile_run
 
 # Load credentials
 load_dotenv()
-AZURE_API_KEY = os.getenv("AZURE_OPENAI_KEY")
-AZURE_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
 DEPLOYMENT_NAME = os.getenv("AZURE_DEPLOYMENT_NAME")
 
 
@@ -62,43 +69,38 @@ def classify_form_type(text: str, document_names: list) -> str:
         return "empty_text"
 
     # 1st attempt: DB-based matching
-    db_match = db_based_classification(text, document_names)
+    with span("classify_db_match"):
+        db_match = db_based_classification(text, document_names)
     if db_match:
         print(f"[Classifier] DB match: {db_match}")
         return db_match
 
-    # 2nd attempt: fallback to Azure OpenAI
-    try:
-        prompt = f"""
-You are a trade finance document classifier.
+    # 2nd attempt: fallback to Azure OpenAI (memoized by normalized text)
+    return memoized("group_by_form", text, lambda t: classify_with_openai(t, document_names),
+                    model=DEPLOYMENT_NAME, keywords=document_names)
+
 
-Below is extracted text. Identify its document type.
+# Identical on every call so the prefix can be served from the prompt cache
+CLASSIFIER_SYSTEM_PROMPT = """You are a trade finance document classifier.
+
+The user message contains extracted text between --- lines. Identify its document type.
 
 Your output must be:
 - A clear document type (e.g., "Commercial Invoice", "Packing List").
 - Guess based on the content if unsure.
 
----
-{text}
----
-Return ONLY the document type name.
-"""
-
-        client = AzureOpenAI(
-            api_key=AZURE_API_KEY,
-            azure_endpoint=AZURE_ENDPOINT,
-            api_version="2024-10-21"
-        )
-
-        response = client.chat.completions.create(
-            model=DEPLOYMENT_NAME,
-            messages=[
-                {"role": "system", "content": "You are a trade document classification expert."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=100,
-            temperature=0.0
-        )
+Return ONLY the document type name."""
+
+
+def classify_with_openai(text: str, document_names: list) -> str:
+    try:
+        with span("classify_openai"):
+            response = openai_client("2024-10-21").chat.completions.create(
+                model=DEPLOYMENT_NAME,
+                messages=build_messages(CLASSIFIER_SYSTEM_PROMPT, text, keywords=document_names),
+                max_tokens=100,
+                temperature=0.0
+            )
 
         form_name = response.choices[0].message.content.strip()
         print(f"[Classifier] OpenAI match: {form_name}")
@@ -111,24 +113,24 @@ Return ONLY the document type name.
 
 # ---------------------- Main Grouping Logic ----------------------
 
-def group_documents(session_id, document_id, conn):
-    document_names = load_document_names_from_db(conn)  # Load DB names once
+def page_sort_key(file_name: str) -> tuple:
+    """Order Page_9 before Page_10 before Page_100 (names without a number last)."""
+    match = re.search(r"(\d+)$", os.path.splitext(file_name)[0])
+    return (0, int(match.group(1)), file_name) if match else (1, 0, file_name)
 
-    base_path = os.path.join("outputs", session_id)
-    subfolders = [f for f in os.listdir(base_path) if document_id in f]
-    if not subfolders:
-        print(f"[ERROR] No folder found for document_id: {document_id}")
-        return
 
-    input_folder = os.path.join(base_path, subfolders[0])
-    grouped_data = {}
-    assigned_pages = set()
+def load_pages_from_folder(input_folder: str) -> list:
+    """Read Page_NN.txt / .fields.json written by the splitter into page dicts."""
+    duplicates = {}
+    duplicates_path = os.path.join(input_folder, DUPLICATES_FILENAME)
+    if os.path.exists(duplicates_path):
+        with open(duplicates_path, "r", encoding="utf-8") as f:
+            duplicates = json.load(f)
 
-    for file in sorted(os.listdir(input_folder)):
+    pages = []
+    for file in sorted(os.listdir(input_folder), key=page_sort_key):
         if not file.endswith(".txt"):
             continue
-        if file in assigned_pages:
-            continue
 
         txt_path = os.path.join(input_folder, file)
         pdf_path = txt_path.replace(".txt", ".pdf")
@@ -137,62 +139,157 @@ def group_documents(session_id, document_id, conn):
         with open(txt_path, "r", encoding="utf-8") as f:
             text = f.read()
 
-        form_type = classify_form_type(text, document_names)
-        form_type_clean = sanitize_form_name(form_type)
+        fields = None
+        if os.path.exists(json_path):
+            try:
+                with open(json_path, "r", encoding="utf-8") as jf:
+                    fields = json.load(jf)
+            except Exception as e:
+                print(f"[Error] Skipping JSON {json_path}: {e}")
 
-        # Handle failed classifications
-        if form_type_clean in ["", "unknown", "openai_failure", "empty_text"]:
-            form_type_clean = "unclassified"
+        page_name = os.path.splitext(file)[0]
+        page_number = re.search(r"(\d+)$", page_name)
+        pages.append({
+            "name": file,
+            "page_number": int(page_number.group(1)) if page_number else None,
+            "text": text,
+            "fields": fields,
+            "pdf_path": pdf_path if os.path.exists(pdf_path) else None,
+            "duplicate_of": duplicates.get(page_name, {}).get("duplicate_of"),
+        })
+    return pages
 
-        if form_type_clean not in grouped_data:
-            grouped_data[form_type_clean] = {
-                "texts": [],
-                "pdfs": [],
-                "jsons": []
-            }
 
-        grouped_data[form_type_clean]["texts"].append(text)
-        if os.path.exists(pdf_path):
-            grouped_data[form_type_clean]["pdfs"].append(pdf_path)
-        if os.path.exists(json_path):
-            grouped_data[form_type_clean]["jsons"].append(json_path)
+def group_pages(pages: list, document_names: list) -> dict:
+    """
+    Classify the first page of each run (see segmentation.py) and bucket the
+    whole run by its sanitized form type.
+    """
+    grouped_data = {}
+    page_form_types = {}
 
-        assigned_pages.add(file)
-        print(f"[Grouped] {file} -> '{form_type_clean}'")
+    if SEGMENTATION_ENABLED:
+        runs = segment_pages(pages, document_names)
+    else:
+        runs = [[index] for index in range(len(pages))]
+
+    for run in runs:
+        head = pages[run[0]]
+        primary = head.get("duplicate_of")
+
+        if primary in page_form_types:
+            # Copies (DUPLICATE / TRIPLICATE) stay in their primary page's group
+            form_type_clean = page_form_types[primary]
+        else:
+            with span("classify", page=head["name"]):
+                form_type = classify_form_type(head["text"], document_names)
+            form_type_clean = sanitize_form_name(form_type)
+
+            # Handle failed classifications
+            if form_type_clean in ["", "unknown", "openai_failure", "empty_text"]:
+                form_type_clean = "unclassified"
+
+        for index in run:
+            page = pages[index]
+            page_form_types[os.path.splitext(page["name"])[0]] = form_type_clean
+            grouped_data.setdefault(form_type_clean, []).append(page)
+            if index == run[0]:
+                print(f"[Grouped] {page['name']} -> '{form_type_clean}'")
+            else:
+                print(f"[Grouped] {page['name']} -> '{form_type_clean}' (continues {head['name']}: {page['segment_reason']})")
+
+    print(f"[Grouped] {len(pages)} pages in {len(runs)} runs")
+    return grouped_data
+
+
+def save_grouped_outputs(session_id, document_id, grouped_data, conn, output_base="grouped", original_pdf=None) -> dict:
+    """
+    Write grouped text/PDF/fields to disk and DB; returns form_type -> text.
+    With `original_pdf`, each group's PDF is copied page-by-page out of it.
+    """
+    group_texts = {}
 
-    # Save grouped outputs
-    for form_type, data in grouped_data.items():
-        out_dir = os.path.join("grouped", session_id, document_id, form_type)
+    for form_type, pages in grouped_data.items():
+        out_dir = os.path.join(output_base, session_id, document_id, form_type)
         os.makedirs(out_dir, exist_ok=True)
 
         # Save combined text
+        text = "\n\n".join(page["text"] for page in pages)
         txt_path = os.path.join(out_dir, "text.txt")
         with open(txt_path, "w", encoding="utf-8") as f:
-            f.write("\n\n".join(data["texts"]))
-        save_grouped_text_to_db(conn, session_id, document_id, form_type, txt_path)
-
-        # Merge and save PDF
-        if data["pdfs"]:
-            pdf_path = os.path.join(out_dir, "document.pdf")
-            merger = PdfMerger()
-            for pdf in data["pdfs"]:
-                merger.append(pdf)
-            merger.write(pdf_path)
-            merger.close()
-            save_grouped_pdf_to_db(conn, session_id, document_id, form_type, pdf_path)
+            f.write(text)
+        with span("sql_write", group=form_type):
+            save_grouped_text_to_db(conn, session_id, document_id, form_type, txt_path, text=text)
+        group_texts[form_type] = text
+
+        # Build the group PDF from page references into the original when
+        # possible; otherwise merge the in-memory page bytes / Page_NN.pdf files
+        pdf_path = os.path.join(out_dir, "document.pdf")
+        page_numbers = [page.get("page_number") for page in pages]
+        digest = None
+        with span("merge_pdf", group=form_type):
+            if original_pdf and os.path.exists(original_pdf) and all(page_numbers):
+                digest, size = write_pages_from_original(original_pdf, page_numbers, pdf_path)
+            else:
+                sources = [
+                    io.BytesIO(page["pdf_bytes"]) if page.get("pdf_bytes") else page.get("pdf_path")
+                    for page in pages
+                ]
+                sources = [src for src in sources if src]
+                if sources:
+                    digest, size = write_merged_sources(sources, pdf_path)
+        if digest:
+            print(f"[Merged] {form_type}: {len(pages)} pages, {size} bytes, sha256 {digest}")
+            with span("sql_write", group=form_type):
+                save_grouped_pdf_to_db(conn, session_id, document_id, form_type, pdf_path, sha256=digest)
 
         # Merge and save fields
-        all_fields = []
-        for json_path in data["jsons"]:
+        all_fields = [page["fields"] for page in pages if page.get("fields") is not None]
+        if all_fields:
+            with span("sql_write", group=form_type):
+                save_grouped_fields_to_db(conn, session_id, document_id, form_type, all_fields)
+
+        # Field index and search entries were written per page; label them with the group
+        page_names = [os.path.splitext(page["name"])[0] for page in pages]
+        if FIELD_INDEX_ENABLED:
             try:
-                with open(json_path, "r", encoding="utf-8") as jf:
-                    fields = json.load(jf)
-                    all_fields.append(fields)
+                relabel_pages(conn, session_id, document_id, page_names, form_type)
             except Exception as e:
-                print(f"[Error] Skipping JSON {json_path}: {e}")
+                conn.rollback()
+                print(f"[FieldIndex] Relabel skipped for {form_type}: {e}")
+        if LINE_ITEMS_ENABLED:
+            try:
+                relabel_item_pages(conn, session_id, document_id, page_names, form_type)
+            except Exception as e:
+                conn.rollback()
+                print(f"[LineItems] Relabel skipped for {form_type}: {e}")
+        try:
+            search_index.relabel_pages(session_id, document_id, page_names, form_type)
+        except Exception as e:
+            print(f"[Search] Relabel skipped for {form_type}: {e}")
 
-        if all_fields:
-            save_grouped_fields_to_db(conn, session_id, document_id, form_type, all_fields)
+    return group_texts
+
+
+def group_documents(session_id, document_id, conn):
+    document_names = load_document_names_from_db(conn)  # Load DB names once
+
+    base_path = os.path.join("outputs", session_id)
+    subfolders = [f for f in os.listdir(base_path) if document_id in f]
+    if not subfolders:
+        print(f"[ERROR] No folder found for document_id: {document_id}")
+        return
+
+    grouped_dir = os.path.join("grouped", session_id, document_id)
+    if try_reuse(conn, "group", GROUP_TABLES, session_id, document_id, grouped_dir):
+        return
+
+    input_folder = os.path.join(base_path, subfolders[0])
+    pages = load_pages_from_folder(input_folder)
+    grouped_data = group_pages(pages, document_names)
+    save_grouped_outputs(session_id, document_id, grouped_data, conn,
+                         original_pdf=os.path.join(input_folder, "original.pdf"))
+    try_record(conn, "group", session_id, document_id, grouped_dir)
 
     print("\nDocument grouping complete.")
 
@@ -206,5 +303,6 @@ if __name__ == "__main__":
     else:
         session_id = sys.argv[1]
         document_id = sys.argv[2]
-        conn = get_sql_server_connection()
-        group_documents(session_id, document_id, conn)
+        with profile_run("group_by_form"):
+            conn = get_sql_server_connection()
+            group_documents(session_id, document_id, conn)
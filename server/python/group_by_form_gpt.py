@@ -3,6 +3,7 @@ import json
 import re
 import openai
 from PyPDF2 import PdfMerger
+from prompt_builder import build_messages, memoized
 from db_utils import (
     save_grouped_pdf_to_db,
     save_grouped_text_to_db,
@@ -12,15 +13,17 @@ from db_utils import (
 
 #  Set your OpenAI API key using environment variable
 openai.api_key = os.getenv("OPENAI_API_KEY")
+FORM_TYPE_MODEL = "gpt-4"
 
 
-def detect_form_type(text):
-    """
-    Detects document form type using GPT-4 by classifying the given OCR-extracted text.
-    """
-    try:
-        prompt = f"""
-You are an expert in trade finance documentation. Given the following extracted text from a scanned document, identify the type of document.
+VALID_FORM_TYPES = [
+    "LC", "Invoice", "BL", "AWB", "Packing List", "Certificate of Origin",
+    "Insurance", "Draft", "Inspection", "Shipping Advice"
+]
+
+# Fixed instructions sent as the system message on every call
+FORM_TYPE_SYSTEM_PROMPT = """You classify trade finance documents.
+You are an expert in trade finance documentation. The user message contains extracted text from a scanned document between --- lines; identify the type of document.
 
 Possible types include:
 - LC (Letter of Credit)
@@ -35,28 +38,27 @@ Possible types include:
 - Shipping Advice
 - UNKNOWN (if none of the above)
 
-Respond with only the document type from the above list. No extra explanation.
+Respond with only the document type from the above list. No extra explanation."""
 
-Text:
-{text[:3000]}
-        """
 
+def detect_form_type(text):
+    """
+    Detects document form type using GPT-4 by classifying the given OCR-extracted text.
+    """
+    return memoized("group_by_form_gpt", text, _detect_form_type, model=FORM_TYPE_MODEL, keywords=VALID_FORM_TYPES)
+
+
+def _detect_form_type(text):
+    try:
         response = openai.ChatCompletion.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You classify trade finance documents."},
-                {"role": "user", "content": prompt}
-            ],
+            model=FORM_TYPE_MODEL,
+            messages=build_messages(FORM_TYPE_SYSTEM_PROMPT, text, keywords=VALID_FORM_TYPES),
             temperature=0.2,
             max_tokens=10,
         )
 
         form_type = response.choices[0].message['content'].strip()
-        valid_types = [
-            "LC", "Invoice", "BL", "AWB", "Packing List", "Certificate of Origin",
-            "Insurance", "Draft", "Inspection", "Shipping Advice"
-        ]
-        return form_type if form_type in valid_types else "UNKNOWN"
+        return form_type if form_type in VALID_FORM_TYPES else "UNKNOWN"
 
     except Exception as e:
         print(f" GPT-4 form detection failed: {e}")
@@ -0,0 +1,62 @@
+import os
+from PIL import Image
+from typing import List
+from ocr_backend import batch_enabled, image_data_batch, image_to_string
+
+# Header-band OCR for fast classification.
+#
+# Classifying a page only needs its title block (and the footer, for page
+# numbering used by segmentation.py), so this pre-pass OCRs the top and
+# bottom bands of the rasterized page at reduced resolution. Groups whose
+# form type needs no field extraction (attachments, supporting copies)
+# then skip full-page OCR entirely; see pipeline.run_pipeline.
+
+HEADER_CLASSIFY_ENABLED = os.getenv("TF_HEADER_CLASSIFY", "false").lower() in ("1", "true", "yes")
+HEADER_BAND = 0.18         # top fraction of the page
+FOOTER_BAND = 0.08         # bottom fraction, for "Page 2 of 3"
+BAND_SCALE = 0.5           # 200 DPI rasters -> ~100 DPI bands
+
+# Sanitized form types (group_by_form.sanitize_form_name) kept as header text only
+NO_EXTRACTION_FORMS = {
+    name.strip()
+    for name in os.getenv(
+        "TF_NO_EXTRACTION_FORMS",
+        "attachment,attachments,supporting_document,supporting_documents,copy,cover_letter",
+    ).split(",")
+    if name.strip()
+}
+
+
+def _band(image: Image.Image, top: float, bottom: float) -> Image.Image:
+    width, height = image.size
+    band = image.convert("L").crop((0, int(height * top), width, int(height * bottom)))
+    if BAND_SCALE != 1.0:
+        band = band.resize((max(1, int(band.width * BAND_SCALE)), max(1, int(band.height * BAND_SCALE))),
+                           Image.BILINEAR)
+    return band
+
+
+def header_text(image: Image.Image) -> str:
+    """Title block followed by footer text of one rasterized page."""
+    header = image_to_string(_band(image, 0.0, HEADER_BAND), config="--psm 6").strip()
+    footer = image_to_string(_band(image, 1.0 - FOOTER_BAND, 1.0), config="--psm 6").strip()
+    return "\n".join(part for part in (header, footer) if part)
+
+
+def header_texts(images: List[Image.Image]) -> List[str]:
+    """header_text() for every page; one tesseract process for all bands in batch mode."""
+    if batch_enabled():
+        bands = (_band(image, top, bottom) for image in images
+                 for top, bottom in ((0.0, HEADER_BAND), (1.0 - FOOTER_BAND, 1.0)))
+        try:
+            results = image_data_batch(bands, config="--psm 6")
+            return ["\n".join(part for part in (results[2 * i]["text"].strip(), results[2 * i + 1]["text"].strip())
+                               if part)
+                    for i in range(len(images))]
+        except Exception as e:
+            print(f"[OCR] Batch header OCR failed, OCR page by page: {e}")
+    return [header_text(image) for image in images]
+
+
+def needs_full_ocr(form_type: str) -> bool:
+    return form_type not in NO_EXTRACTION_FORMS
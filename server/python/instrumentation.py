@@ -0,0 +1,204 @@
+import os
+import time
+import json
+import threading
+import functools
+import contextlib
+from typing import Dict, List, Optional
+
+# ---------------------- Configuration ----------------------
+#
+# TF_METRICS_JSON   path of a JSON file receiving spans + per-stage summary
+# TF_METRICS_PROM   path of a Prometheus textfile (node_exporter textfile collector)
+# TF_PROFILE        "cprofile" or "tracemalloc" to capture a single document run
+# TF_PROFILE_DIR    where profile output is written (default ./profiles)
+
+METRICS_JSON_PATH = os.getenv("TF_METRICS_JSON")
+METRICS_PROM_PATH = os.getenv("TF_METRICS_PROM")
+PROFILE_MODE = (os.getenv("TF_PROFILE") or "").lower()
+PROFILE_DIR = os.getenv("TF_PROFILE_DIR", "profiles")
+
+# Histogram bucket upper bounds in seconds (Prometheus "le" labels)
+BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+_lock = threading.Lock()
+_spans: List[Dict] = []
+_histograms: Dict[str, Dict] = {}
+
+
+# ---------------------- Recording ----------------------
+
+def record(stage: str, seconds: float, page=None, **labels):
+    """Record one timed span for a pipeline stage (and optionally a page)."""
+    entry = {"stage": stage, "seconds": round(seconds, 6)}
+    if page is not None:
+        entry["page"] = page
+    entry.update(labels)
+
+    with _lock:
+        _spans.append(entry)
+        hist = _histograms.get(stage)
+        if hist is None:
+            hist = {"count": 0, "sum": 0.0, "buckets": [0] * len(BUCKETS), "values": []}
+            _histograms[stage] = hist
+        hist["count"] += 1
+        hist["sum"] += seconds
+        hist["values"].append(seconds)
+        for idx, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                hist["buckets"][idx] += 1
+
+
+@contextlib.contextmanager
+def span(stage: str, page=None, **labels):
+    """Context manager timing the enclosed block as `stage`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start, page=page, **labels)
+
+
+def timed(stage: str):
+    """Decorator timing every call of the wrapped function as `stage`."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def reset():
+    with _lock:
+        _spans.clear()
+        _histograms.clear()
+
+
+# ---------------------- Summaries ----------------------
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100.0
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def get_spans(stage: Optional[str] = None) -> List[Dict]:
+    with _lock:
+        return [dict(s) for s in _spans if stage is None or s["stage"] == stage]
+
+
+def summary() -> Dict[str, Dict]:
+    """Per-stage count/total/min/max/p50/p95 in seconds."""
+    with _lock:
+        stages = {name: list(hist["values"]) for name, hist in _histograms.items()}
+
+    result = {}
+    for name, values in stages.items():
+        result[name] = {
+            "count": len(values),
+            "total": round(sum(values), 6),
+            "min": round(min(values), 6),
+            "max": round(max(values), 6),
+            "p50": round(percentile(values, 50), 6),
+            "p95": round(percentile(values, 95), 6),
+        }
+    return result
+
+
+# ---------------------- Exporters ----------------------
+
+def export_json(path: str, extra: Optional[Dict] = None):
+    payload = {"summary": summary(), "spans": get_spans()}
+    if extra:
+        payload.update(extra)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, indent=2)
+
+
+def export_prometheus(path: str):
+    """Write stage histograms in Prometheus text exposition format.
+
+    Written to a temp file and renamed so the textfile collector never reads
+    a partial file. Per-page spans are folded into the stage histogram to keep
+    label cardinality bounded.
+    """
+    with _lock:
+        snapshot = {
+            name: (hist["count"], hist["sum"], list(hist["buckets"]))
+            for name, hist in _histograms.items()
+        }
+
+    lines = [
+        "# HELP tf_stage_duration_seconds Time spent per OCR pipeline stage.",
+        "# TYPE tf_stage_duration_seconds histogram",
+    ]
+    for name in sorted(snapshot):
+        count, total, buckets = snapshot[name]
+        for bound, bucket_count in zip(BUCKETS, buckets):
+            lines.append(f'tf_stage_duration_seconds_bucket{{stage="{name}",le="{bound}"}} {bucket_count}')
+        lines.append(f'tf_stage_duration_seconds_bucket{{stage="{name}",le="+Inf"}} {count}')
+        lines.append(f'tf_stage_duration_seconds_sum{{stage="{name}"}} {total:.6f}')
+        lines.append(f'tf_stage_duration_seconds_count{{stage="{name}"}} {count}')
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, path)
+
+
+def flush(extra: Optional[Dict] = None):
+    """Export to whichever targets are configured through the environment."""
+    if METRICS_JSON_PATH:
+        export_json(METRICS_JSON_PATH, extra)
+    if METRICS_PROM_PATH:
+        export_prometheus(METRICS_PROM_PATH)
+
+
+# ---------------------- Profiling ----------------------
+
+@contextlib.contextmanager
+def profile_run(name: str):
+    """Wrap a single script run: optional cProfile/tracemalloc, then flush metrics."""
+    profiler = None
+    if PROFILE_MODE == "cprofile":
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    elif PROFILE_MODE == "tracemalloc":
+        import tracemalloc
+        tracemalloc.start(25)
+
+    try:
+        with span("total"):
+            yield
+    finally:
+        if PROFILE_MODE in ("cprofile", "tracemalloc"):
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            stamp = time.strftime("%Y%m%d-%H%M%S")
+
+        if profiler is not None:
+            profiler.disable()
+            out_path = os.path.join(PROFILE_DIR, f"{name}-{stamp}.prof")
+            profiler.dump_stats(out_path)
+            print(f"[Profile] cProfile stats written to {out_path}")
+        elif PROFILE_MODE == "tracemalloc":
+            import tracemalloc
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            out_path = os.path.join(PROFILE_DIR, f"{name}-{stamp}.tracemalloc.txt")
+            with open(out_path, "w", encoding="utf-8") as f:
+                f.write(f"current={current} peak={peak}\n\n")
+                for stat in snapshot.statistics("lineno")[:50]:
+                    f.write(f"{stat}\n")
+            print(f"[Profile] tracemalloc top allocations written to {out_path}")
+
+        flush({"script": name})
@@ -0,0 +1,435 @@
+import os
+import sys
+import json
+import time
+import random
+import socket
+import sqlite3
+import argparse
+import threading
+import multiprocessing
+from typing import Dict, List, Optional
+
+# Durable OCR job queue backed by a local SQLite file.
+#
+# The upload route enqueues a "split" job; a fixed number of worker processes
+# pull jobs by priority, so upload bursts queue up instead of forking one
+# Python/Tesseract process per request. Successful split jobs enqueue the
+# matching "group" job, and group jobs enqueue "catalog" (OCR_Alone splits,
+# used by the upload and /split routes, stop after OCR). "deferred" jobs
+# (queued by pipeline.py) run the full OCR that header classification put
+# off, after all other work.
+#
+#   python job_queue.py enqueue split <pdf_path> <session_id> <document_id> [ocr_method]
+#   python job_queue.py worker --processes 3
+#   python job_queue.py stats
+#
+# A claimed job is invisible to other workers until its visibility timeout
+# expires; a worker that dies mid-job therefore hands the job back
+# automatically, as a new attempt: a job whose lock expires with no attempts
+# left (e.g. one that keeps crashing its worker) is parked as "failed". While a job runs, a heartbeat thread keeps extending the
+# timeout, so long OCR jobs are not handed out twice. complete / fail /
+# extend_visibility only touch a job the calling worker still owns.
+# Failures are retried with exponential backoff up to max_attempts, then
+# parked as "failed".
+#
+# With OCR_JOB_QUEUE=true the Node routes call "enqueue --reuse", which
+# returns the document's existing job (and its status), or the pending
+# split/group job that will chain into it, instead of queueing the same
+# work twice or grouping before the split has finished. --max-depth refuses
+# new jobs (exit 2) once the queue is that deep.
+#
+#   python job_queue.py enqueue group - <session_id> <document_id> --reuse --max-depth 200
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+QUEUE_DB_PATH = os.getenv("TF_JOB_QUEUE_DB", os.path.join(ROOT_DIR, "jobs.sqlite3"))
+
+JOB_KINDS = ("split", "group", "catalog", "deferred")
+DEFAULT_PRIORITY = {"deferred": -5, "split": 0, "group": 5, "catalog": 10}  # finish started work first
+UPSTREAM_KINDS = {"group": ("split",), "catalog": ("group", "split")}    # jobs that chain into a kind
+VISIBILITY_TIMEOUT = int(os.getenv("TF_JOB_VISIBILITY_TIMEOUT", "900"))
+HEARTBEAT_FRACTION = 3         # extend the lock every VISIBILITY_TIMEOUT / 3 seconds
+BACKOFF_BASE = 30
+BACKOFF_MAX = 1800
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    available_at REAL NOT NULL,
+    locked_until REAL,
+    worker TEXT,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS IX_jobs_claim ON jobs (status, priority DESC, available_at, id);
+"""
+
+
+# ---------------------- Queue operations ----------------------
+
+def connect(db_path: str = QUEUE_DB_PATH) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def queue_depth(conn) -> int:
+    return conn.execute("SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')").fetchone()[0]
+
+
+def enqueue(conn, kind: str, payload: Dict, priority: Optional[int] = None, max_attempts: int = 3, delay: float = 0) -> int:
+    if kind not in JOB_KINDS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    now = time.time()
+    cursor = conn.execute(
+        "INSERT INTO jobs (kind, payload, priority, max_attempts, available_at, created_at, updated_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (kind, json.dumps(payload), DEFAULT_PRIORITY[kind] if priority is None else priority,
+         max_attempts, now + delay, now, now)
+    )
+    return cursor.lastrowid
+
+
+def claim(conn, worker: str, kinds: Optional[List[str]] = None, visibility_timeout: int = VISIBILITY_TIMEOUT):
+    """Atomically take the highest-priority runnable job, or None."""
+    now = time.time()
+    kinds = kinds or list(JOB_KINDS)
+    placeholders = ",".join("?" for _ in kinds)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Expired locks whose worker died on the last attempt: park instead of retrying forever
+        conn.execute(
+            "UPDATE jobs SET status = 'failed', locked_until = NULL, updated_at = ?, "
+            "last_error = 'Worker lost: lock expired after ' || attempts || ' attempt(s)' "
+            f"WHERE kind IN ({placeholders}) AND status = 'running' AND locked_until < ? "
+            "AND attempts >= max_attempts",
+            (now, *kinds, now)
+        )
+        row = conn.execute(
+            f"""
+            SELECT * FROM jobs
+            WHERE kind IN ({placeholders})
+              AND ((status = 'queued' AND available_at <= ?)
+                   OR (status = 'running' AND locked_until < ?))
+            ORDER BY priority DESC, available_at, id
+            LIMIT 1
+            """,
+            (*kinds, now, now)
+        ).fetchone()
+        if row is None:
+            conn.execute("COMMIT")
+            return None
+        conn.execute(
+            "UPDATE jobs SET status = 'running', attempts = attempts + 1, locked_until = ?, "
+            "worker = ?, updated_at = ? WHERE id = ?",
+            (now + visibility_timeout, worker, now, row["id"])
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    job = dict(row)
+    job.update(status="running", attempts=job["attempts"] + 1, locked_until=now + visibility_timeout,
+               worker=worker, updated_at=now)
+    job["payload"] = json.loads(job["payload"])
+    return job
+
+
+def extend_visibility(conn, job: Dict, visibility_timeout: int = VISIBILITY_TIMEOUT) -> bool:
+    """Push back the job's lock; False once another worker has taken it over."""
+    now = time.time()
+    cursor = conn.execute(
+        "UPDATE jobs SET locked_until = ?, updated_at = ? WHERE id = ? AND worker = ? AND status = 'running'",
+        (now + visibility_timeout, now, job["id"], job["worker"])
+    )
+    return cursor.rowcount == 1
+
+
+def complete(conn, job: Dict) -> bool:
+    cursor = conn.execute(
+        "UPDATE jobs SET status = 'done', locked_until = NULL, last_error = NULL, updated_at = ? "
+        "WHERE id = ? AND worker = ? AND status = 'running'",
+        (time.time(), job["id"], job["worker"])
+    )
+    return cursor.rowcount == 1
+
+
+def backoff_seconds(attempts: int) -> float:
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * (2 ** max(0, attempts - 1)))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def fail(conn, job: Dict, error: str) -> bool:
+    """Schedule a retry with backoff, or park the job once attempts run out."""
+    now = time.time()
+    if job["attempts"] < job["max_attempts"]:
+        cursor = conn.execute(
+            "UPDATE jobs SET status = 'queued', available_at = ?, locked_until = NULL, last_error = ?, updated_at = ? "
+            "WHERE id = ? AND worker = ? AND status = 'running'",
+            (now + backoff_seconds(job["attempts"]), error[-4000:], now, job["id"], job["worker"])
+        )
+    else:
+        cursor = conn.execute(
+            "UPDATE jobs SET status = 'failed', locked_until = NULL, last_error = ?, updated_at = ? "
+            "WHERE id = ? AND worker = ? AND status = 'running'",
+            (error[-4000:], now, job["id"], job["worker"])
+        )
+    return cursor.rowcount == 1
+
+
+def find_job(conn, kind: str, session_id, document_id, splitter: Optional[str] = None) -> Optional[Dict]:
+    """Most recent `kind` job for a document (split jobs also match on splitter), or None."""
+    rows = conn.execute(
+        "SELECT * FROM jobs WHERE kind = ? AND json_extract(payload, '$.session_id') = ? "
+        "AND json_extract(payload, '$.document_id') = ? ORDER BY id DESC",
+        (kind, str(session_id), str(document_id))
+    ).fetchall()
+    for row in rows:
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        if splitter is None or job["payload"].get("splitter", "split_OCR") == splitter:
+            return job
+    return None
+
+
+def stats(conn) -> Dict[str, Dict[str, int]]:
+    result: Dict[str, Dict[str, int]] = {}
+    for row in conn.execute("SELECT kind, status, COUNT(*) AS n FROM jobs GROUP BY kind, status"):
+        result.setdefault(row["kind"], {})[row["status"]] = row["n"]
+    return result
+
+
+def requeue_failed(conn) -> int:
+    cursor = conn.execute(
+        "UPDATE jobs SET status = 'queued', attempts = 0, available_at = ?, updated_at = ? WHERE status = 'failed'",
+        (time.time(), time.time())
+    )
+    return cursor.rowcount
+
+
+class Heartbeat(threading.Thread):
+    """Extends a running job's lock until stopped or until the job is lost."""
+
+    def __init__(self, job: Dict, db_path: str = QUEUE_DB_PATH, visibility_timeout: int = VISIBILITY_TIMEOUT):
+        super().__init__(name=f"heartbeat-{job['id']}", daemon=True)
+        self.job = job
+        self.db_path = db_path
+        self.visibility_timeout = visibility_timeout
+        self.interval = max(1.0, visibility_timeout / HEARTBEAT_FRACTION)
+        self.lost = False
+        self._done = threading.Event()
+
+    def run(self):
+        conn = connect(self.db_path)    # sqlite connections stay on their own thread
+        try:
+            while not self._done.wait(self.interval):
+                if not extend_visibility(conn, self.job, self.visibility_timeout):
+                    self.lost = True
+                    print(f"[Worker {self.job['worker']}] lost job {self.job['id']} to another worker")
+                    return
+        finally:
+            conn.close()
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+
+def chains(job: Dict) -> bool:
+    """Whether `job` enqueues its follow-up when done (OCR_Alone splits stop after OCR)."""
+    payload = job["payload"]
+    if job["kind"] == "split" and payload.get("splitter", "split_OCR") == "OCR_Alone":
+        return False
+    return payload.get("chain", True)
+
+
+def lookup_job(conn, kind: str, session_id, document_id, splitter: Optional[str] = None) -> Optional[Dict]:
+    """
+    The job that already covers `kind` for a document: its own latest job
+    unless that failed, else a queued/running upstream job that will chain
+    into it. None when a new job should be queued.
+    """
+    job = find_job(conn, kind, session_id, document_id, splitter)
+    if job is not None and job["status"] != "failed":
+        return job
+    for upstream in UPSTREAM_KINDS.get(kind, ()):
+        job = find_job(conn, upstream, session_id, document_id)
+        if job is not None and job["status"] in ("queued", "running") and chains(job):
+            return job
+    return None
+
+
+# ---------------------- Job handlers ----------------------
+
+def run_job(job: Dict, sql_conn) -> Optional[tuple]:
+    """Execute one job; return the (kind, payload) follow-up job, if any."""
+    payload = job["payload"]
+    session_id, document_id = payload["session_id"], payload["document_id"]
+
+    if job["kind"] == "split":
+        splitter = payload.get("splitter", "split_OCR")
+        ocr_method = payload.get("ocr_method", "tesseract")
+        if splitter == "OCR_Alone":
+            import OCR_Alone
+            OCR_Alone.process_pdf(payload["pdf_path"], session_id, document_id, ocr_method, conn=sql_conn)
+        elif splitter == "split_by_form_azure":
+            import split_by_form_azure
+            split_by_form_azure.split_pdf_by_form_type(payload["pdf_path"], session_id, document_id, sql_conn, ocr_method=ocr_method)
+        else:
+            import split_OCR
+            split_OCR.split_pdf_by_form_type(payload["pdf_path"], session_id, document_id, sql_conn, ocr_method=ocr_method)
+        return ("group", payload) if chains(job) else None
+
+    if job["kind"] == "group":
+        import group_by_form
+        group_by_form.group_documents(session_id, document_id, sql_conn)
+        return ("catalog", payload) if chains(job) else None
+
+    if job["kind"] == "catalog":
+        import catalog_with_master
+        catalog_with_master.catalog_all_grouped_documents(session_id, document_id, sql_conn)
+        return None
+
+    if job["kind"] == "deferred":
+        import pipeline
+        pipeline.complete_deferred(payload["pdf_path"], session_id, document_id, sql_conn)
+        return None
+
+    raise ValueError(f"Unknown job kind: {job['kind']}")
+
+
+def worker_loop(worker_name: str, kinds: Optional[List[str]] = None, poll_interval: float = 2.0,
+                db_path: str = QUEUE_DB_PATH, max_jobs: int = 0):
+    from db_utils import get_sql_server_connection
+
+    os.chdir(ROOT_DIR)  # outputs/ and grouped/ are resolved from the repo root, as under Node
+    conn = connect(db_path)
+    sql_conn = None
+    processed = 0
+    print(f"[Worker {worker_name}] started (kinds: {', '.join(kinds or JOB_KINDS)})")
+
+    while not max_jobs or processed < max_jobs:
+        job = claim(conn, worker_name, kinds)
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+
+        print(f"[Worker {worker_name}] job {job['id']} {job['kind']} attempt {job['attempts']}/{job['max_attempts']}")
+        heartbeat = Heartbeat(job, db_path)
+        heartbeat.start()
+        try:
+            if sql_conn is None:
+                sql_conn = get_sql_server_connection()
+            follow_up = run_job(job, sql_conn)
+            heartbeat.stop()
+            if not complete(conn, job):
+                print(f"[Worker {worker_name}] job {job['id']} finished after another worker took it over; "
+                      f"result not recorded")
+            elif follow_up:
+                enqueue(conn, follow_up[0], follow_up[1])
+        except Exception as e:
+            heartbeat.stop()
+            print(f"[Worker {worker_name}] job {job['id']} failed: {e}")
+            if not fail(conn, job, repr(e)):
+                print(f"[Worker {worker_name}] job {job['id']} is owned by another worker; failure not recorded")
+            # Drop a connection that may be broken; a fresh one is opened next job
+            try:
+                if sql_conn is not None:
+                    sql_conn.close()
+            except Exception:
+                pass
+            sql_conn = None
+        processed += 1
+
+
+def run_workers(processes: int, kinds: Optional[List[str]] = None, poll_interval: float = 2.0):
+    host = socket.gethostname()
+    procs = []
+    for idx in range(processes):
+        proc = multiprocessing.Process(
+            target=worker_loop,
+            args=(f"{host}-{os.getpid()}-{idx + 1}", kinds, poll_interval),
+            daemon=False
+        )
+        proc.start()
+        procs.append(proc)
+    try:
+        for proc in procs:
+            proc.join()
+    except KeyboardInterrupt:
+        for proc in procs:
+            proc.terminate()
+
+
+# ---------------------- Entry Point ----------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SQLite-backed OCR job queue")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_enqueue = sub.add_parser("enqueue", help="Queue a split job (chains group and catalog)")
+    p_enqueue.add_argument("kind", choices=JOB_KINDS)
+    p_enqueue.add_argument("pdf_path", help="PDF path for split jobs, '-' otherwise")
+    p_enqueue.add_argument("session_id")
+    p_enqueue.add_argument("document_id")
+    p_enqueue.add_argument("ocr_method", nargs="?", default="tesseract")
+    p_enqueue.add_argument("--splitter", default="split_OCR", choices=("split_OCR", "split_by_form_azure", "OCR_Alone"))
+    p_enqueue.add_argument("--priority", type=int)
+    p_enqueue.add_argument("--max-attempts", type=int, default=3)
+    p_enqueue.add_argument("--no-chain", action="store_true", help="Do not enqueue follow-up group/catalog jobs")
+    p_enqueue.add_argument("--max-depth", type=int, default=0,
+                           help="Refuse (exit 2) when this many jobs are already queued or running")
+    p_enqueue.add_argument("--reuse", action="store_true",
+                           help="Return the document's existing job of this kind unless it failed")
+
+    p_worker = sub.add_parser("worker", help="Run worker processes")
+    p_worker.add_argument("--processes", type=int, default=2)
+    p_worker.add_argument("--kinds", nargs="+", choices=JOB_KINDS)
+    p_worker.add_argument("--poll-interval", type=float, default=2.0)
+
+    sub.add_parser("stats", help="Show job counts by kind and status")
+    sub.add_parser("requeue-failed", help="Retry all parked failed jobs")
+
+    args = parser.parse_args()
+
+    if args.command == "worker":
+        run_workers(max(1, args.processes), args.kinds, args.poll_interval)
+        sys.exit(0)
+
+    queue_conn = connect()
+    if args.command == "enqueue":
+        existing = None
+        if args.reuse:
+            existing = lookup_job(queue_conn, args.kind, args.session_id, args.document_id,
+                                  args.splitter if args.kind == "split" else None)
+        if existing is not None:
+            print(json.dumps({"job_id": existing["id"], "kind": existing["kind"], "status": existing["status"],
+                              "last_error": existing["last_error"], "queue_depth": queue_depth(queue_conn)}))
+            sys.exit(0)
+        if args.max_depth and queue_depth(queue_conn) >= args.max_depth:
+            print(json.dumps({"error": "Job queue is full, try again later"}))
+            sys.exit(2)
+        job_payload = {
+            "pdf_path": os.path.abspath(args.pdf_path) if args.pdf_path != "-" else None,
+            "session_id": args.session_id,
+            "document_id": args.document_id,
+            "ocr_method": args.ocr_method,
+            "splitter": args.splitter,
+            "chain": not args.no_chain,
+        }
+        job_id = enqueue(queue_conn, args.kind, job_payload, args.priority, args.max_attempts)
+        print(json.dumps({"job_id": job_id, "status": "queued", "queue_depth": queue_depth(queue_conn)}))
+    elif args.command == "stats":
+        print(json.dumps(stats(queue_conn), indent=2))
+    elif args.command == "requeue-failed":
+        print(json.dumps({"requeued": requeue_failed(queue_conn)}))
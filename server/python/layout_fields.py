@@ -0,0 +1,218 @@
+import os
+import re
+import json
+from typing import Dict, List
+from azure_clients import document_client
+
+# Fields straight from the Document Intelligence prebuilt-layout result.
+#
+# The splitters used to keep only page.lines from the layout call and then
+# re-derive fields from that text with extract_fields() regexes, dropping
+# the structure the service had already returned. page_fields() maps it
+# into the same {key: value} dicts extract_fields() produces, per page:
+#
+#   - key-value pairs (the keyValuePairs add-on, requested by
+#     analyze_layout()): "L/C No." -> "LC/2024/0815"
+#   - selection marks: checkbox label -> "selected" / "unselected"
+#   - two-column tables without headers (B/L and certificate boxes): one
+#     field per row; other tables: "Table N" -> JSON list of row dicts
+#     keyed by column header
+#
+# Keys are the labels as printed on the document, like extract_fields()
+# keys, so field_index.py canonicalizes both the same way. Callers merge
+# them over extract_fields() with merge_fields(): the layout value wins, and
+# regex fields fill in the keys (by canonical name) the service missed.
+# "Table N" values are cut to TABLE_MAX_CHARS of whole rows when stored
+# (cap_tables); the full rows are in TF_line_items.
+#
+#   TF_LAYOUT_FIELDS=true|false   (default true)
+
+LAYOUT_FIELDS_ENABLED = os.getenv("TF_LAYOUT_FIELDS", "true").lower() not in ("0", "false", "no")
+LAYOUT_FEATURES = ["keyValuePairs"]
+MIN_PAIR_CONFIDENCE = 0.3
+TABLE_KEY = "Table {}"
+TABLE_MAX_CHARS = 4000
+
+_MARK_RE = re.compile(r":(un)?selected:")
+_TABLE_KEY_RE = re.compile(r"^Table \d+$")
+_SPACE_RE = re.compile(r"[ \t]+")
+
+
+def analyze_layout(pdf_path: str):
+    """prebuilt-layout result for a PDF, with key-value pairs when enabled."""
+    with open(pdf_path, "rb") as f:
+        if LAYOUT_FIELDS_ENABLED:
+            poller = document_client().begin_analyze_document("prebuilt-layout", f, features=LAYOUT_FEATURES)
+        else:
+            poller = document_client().begin_analyze_document("prebuilt-layout", f)
+    return poller.result()
+
+
+def clean_key(text: str) -> str:
+    key = _SPACE_RE.sub(" ", _MARK_RE.sub("", text or "").replace("\n", " ")).strip()
+    return key.rstrip(":：").strip()
+
+
+def clean_value(text: str) -> str:
+    value = (text or "").strip()
+    mark = _MARK_RE.fullmatch(value)
+    if mark:
+        return "unselected" if mark.group(1) else "selected"
+    return "\n".join(_SPACE_RE.sub(" ", line).strip() for line in _MARK_RE.sub("", value).splitlines()).strip()
+
+
+def _page_of(element, default: int = 1) -> int:
+    regions = getattr(element, "bounding_regions", None) or []
+    return regions[0].page_number if regions else default
+
+
+def _covered_offsets(elements) -> List[range]:
+    ranges = []
+    for element in elements:
+        for span in getattr(element, "spans", None) or []:
+            ranges.append(range(span.offset, span.offset + span.length))
+    return ranges
+
+
+def key_value_fields(result, pages: List[Dict]):
+    for pair in getattr(result, "key_value_pairs", None) or []:
+        if pair.key is None or (pair.confidence or 0) < MIN_PAIR_CONFIDENCE:
+            continue
+        key = clean_key(pair.key.content)
+        value = clean_value(pair.value.content) if pair.value is not None else ""
+        page = _page_of(pair.key)
+        if key and value and 1 <= page <= len(pages):
+            pages[page - 1].setdefault(key, value)
+
+
+def mark_label(content: str, offset: int, length: int) -> str:
+    """Checkbox label: the text after the mark on its line, else the text before it."""
+    line_end = content.find("\n", offset)
+    after = content[offset + length:line_end if line_end != -1 else len(content)]
+    label = clean_key(after.split(":selected:")[0].split(":unselected:")[0])
+    if label:
+        return label
+    line_start = content.rfind("\n", 0, offset) + 1
+    return clean_key(_MARK_RE.split(content[line_start:offset])[-1])
+
+
+def selection_mark_fields(result, pages: List[Dict]):
+    content = getattr(result, "content", None) or ""
+    # Marks that are the value of a key-value pair are already mapped
+    paired = _covered_offsets(pair.value for pair in getattr(result, "key_value_pairs", None) or []
+                              if pair.value is not None)
+    for number, page in enumerate(result.pages, start=1):
+        for mark in getattr(page, "selection_marks", None) or []:
+            if mark.span is None or any(mark.span.offset in r for r in paired):
+                continue
+            label = mark_label(content, mark.span.offset, mark.span.length)
+            if label:
+                pages[number - 1].setdefault(label, mark.state)
+
+
+def table_grid(table) -> List[List[str]]:
+    grid = [[""] * table.column_count for _ in range(table.row_count)]
+    for cell in table.cells:
+        grid[cell.row_index][cell.column_index] = clean_value(cell.content)
+    return grid
+
+
+def table_records(table) -> List[Dict[str, str]]:
+    """Body rows as {column header: cell}; the first row is the header when none is marked."""
+    grid = table_grid(table)
+    header_rows = sorted({cell.row_index for cell in table.cells if cell.kind == "columnHeader"}) or [0]
+    headers = []
+    for column in range(table.column_count):
+        parts = [grid[r][column] for r in header_rows if grid[r][column]]
+        headers.append(" ".join(dict.fromkeys(parts)) or f"Column {column + 1}")
+    records = []
+    for r, row in enumerate(grid):
+        if r in header_rows or not any(row):
+            continue
+        records.append({header: value for header, value in zip(headers, row) if value})
+    return records
+
+
+def table_fields(result, pages: List[Dict]):
+    counts = [0] * len(pages)
+    for table in getattr(result, "tables", None) or []:
+        page = _page_of(table)
+        if not 1 <= page <= len(pages):
+            continue
+        fields = pages[page - 1]
+        has_header = any(cell.kind == "columnHeader" for cell in table.cells)
+        if table.column_count == 2 and not has_header:
+            for key, value in table_grid(table):
+                key = clean_key(key)
+                if key and value:
+                    fields.setdefault(key, value)
+            continue
+        records = table_records(table)
+        if records:
+            counts[page - 1] += 1
+            fields[TABLE_KEY.format(counts[page - 1])] = json.dumps(records, ensure_ascii=False)
+
+
+def page_fields(result) -> List[Dict[str, str]]:
+    """One extract_fields()-style dict per page of a layout result ({} when disabled)."""
+    pages = [{} for _ in result.pages]
+    if not LAYOUT_FIELDS_ENABLED:
+        return pages
+    key_value_fields(result, pages)
+    selection_mark_fields(result, pages)
+    table_fields(result, pages)
+    return pages
+
+
+def is_table_key(key) -> bool:
+    return bool(_TABLE_KEY_RE.match(str(key)))
+
+
+def merge_page_fields(pages: List[Dict[str, str]]) -> Dict[str, str]:
+    """Whole-document fields (first page wins per key; tables renumbered)."""
+    merged, tables = {}, 0
+    for fields in pages:
+        for key, value in fields.items():
+            if is_table_key(key):
+                tables += 1
+                merged[TABLE_KEY.format(tables)] = value
+            else:
+                merged.setdefault(key, value)
+    return merged
+
+
+def merge_fields(layout: Dict[str, str], regex: Dict[str, str]) -> Dict[str, str]:
+    """Layout fields, plus the extract_fields() keys whose canonical name the layout lacks."""
+    from field_index import canonical_key
+    merged = dict(layout or {})
+    covered = {canonical_key(key) for key in merged} - {None}
+    for key, value in (regex or {}).items():
+        if key in merged:
+            continue
+        canonical = canonical_key(key)
+        if canonical is None or canonical not in covered:
+            merged[key] = value
+    return merged
+
+
+def cap_tables(fields: Dict[str, str], limit: int = TABLE_MAX_CHARS) -> Dict[str, str]:
+    """Fields with each "Table N" value cut to the whole rows that fit in `limit` characters."""
+    if not any(is_table_key(key) and len(str(value)) > limit for key, value in fields.items()):
+        return fields
+    capped = {}
+    for key, value in fields.items():
+        if is_table_key(key) and len(str(value)) > limit:
+            try:
+                records = json.loads(value)
+            except (TypeError, ValueError):
+                value = str(value)[:limit]
+            else:
+                kept, used = [], 2
+                for record in records:
+                    used += len(json.dumps(record, ensure_ascii=False)) + 2
+                    if used > limit:
+                        break
+                    kept.append(record)
+                value = json.dumps(kept, ensure_ascii=False)
+        capped[key] = value
+    return capped
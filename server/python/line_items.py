@@ -0,0 +1,396 @@
+import os
+import re
+import json
+from typing import Dict, List, Optional
+import numpy as np
+from field_index import normalize_key, parse_currency, parse_number, parse_unit
+
+# Line items of invoices and packing lists.
+#
+# extract_fields() only sees "key: value" lines, so the goods table
+# (description, quantity, unit price, amount, weights) is lost. Items come
+# from two sources:
+#
+#   - Document Intelligence tables, already in the page fields as
+#     "Table N" (layout_fields.py)
+#   - otherwise, for pages whose text has a table header, Tesseract word
+#     boxes (image_to_data): header words fix the column x-ranges and the
+#     words of each following line are assigned to the column under them
+#
+# Cells are typed (numbers, unit, currency); "Total" rows are kept apart as
+# the document's stated totals. ItemFrame holds a session's items as
+# parallel NumPy arrays so totals per document are one bincount and
+# discrepancy.py can check them against stated totals and the LC amount.
+# A "document" there is a run of pages of one grouped form type that ends
+# on the page carrying its Total row, so an ORIGINAL and its COPY, or two
+# invoices in one bundle, are summed separately. Copies found by
+# page_dedup.py are not stored at all. Rows land in TF_line_items
+# (migrations/006).
+#
+#   TF_LINE_ITEMS=true|false   (default true)
+
+LINE_ITEMS_ENABLED = os.getenv("TF_LINE_ITEMS", "true").lower() not in ("0", "false", "no")
+NUMERIC_COLUMNS = ["quantity", "unit_price", "amount", "net_weight", "gross_weight", "packages"]
+TEXT_COLUMNS = ["description", "unit", "currency"]
+
+# column -> header aliases, compared after normalize_key(); the longest
+# alias found in a header wins ("unit price usd" -> unit_price, not unit)
+COLUMN_ALIASES: Dict[str, List[str]] = {
+    "description": ["description", "description of goods", "goods description", "goods", "item",
+                    "items", "particulars", "commodity", "product", "article"],
+    "quantity": ["quantity", "qty", "qnty", "quantity pcs", "no of units", "total quantity"],
+    "unit": ["unit", "uom", "unit of measure"],
+    "unit_price": ["unit price", "price", "rate", "unit rate", "price per unit", "u price", "unit value"],
+    "amount": ["amount", "total", "value", "total amount", "total value", "line total", "total price",
+               "invoice value"],
+    "net_weight": ["net weight", "net wt", "n w", "nw", "net"],
+    "gross_weight": ["gross weight", "gross wt", "g w", "gw", "gross"],
+    "packages": ["packages", "no of packages", "pkgs", "cartons", "ctns", "no of cartons", "bales", "bags"],
+}
+_ALIASES = sorted(((f" {alias} ", column) for column, aliases in COLUMN_ALIASES.items() for alias in aliases),
+                  key=lambda item: -len(item[0]))
+_TOTAL_RE = re.compile(r"\b(grand\s+)?(sub\s*)?total\b", re.IGNORECASE)
+_DIGIT_RE = re.compile(r"\d")
+TABLE_FIELD_RE = re.compile(r"^Table \d+$")
+MAX_GAP_LINES = 3              # non-item lines that end an OCR table
+OCR_HEADER_COLUMNS = 3         # recognised headers needed to treat an OCR line as a table header
+PHRASE_GAP = 1.2               # word gap (x line height) that separates two cells
+_PAGE_NUMBER_RE = re.compile(r"(\d+)$")
+
+
+def column_for(header: str) -> Optional[str]:
+    padded = f" {normalize_key(header)} "
+    for alias, column in _ALIASES:
+        if alias in padded:
+            return column
+    return None
+
+
+def header_columns(headers: List[str], min_columns: int = 2) -> Dict[str, str]:
+    """header -> column for a table that looks like a goods table, else {}."""
+    mapping, used = {}, set()
+    for header in headers:
+        column = column_for(header)
+        if column and column not in used:
+            mapping[header] = column
+            used.add(column)
+    numeric = used & set(NUMERIC_COLUMNS)
+    if not numeric or len(used) < min_columns:
+        return {}
+    return mapping
+
+
+def _number(text: str) -> float:
+    value = parse_number(text) if _DIGIT_RE.search(text or "") else None
+    return float(value) if value is not None else np.nan
+
+
+def type_row(record: Dict[str, str], mapping: Dict[str, str]) -> Dict:
+    """One table row -> typed item; NaN for missing numbers."""
+    item = {column: np.nan for column in NUMERIC_COLUMNS}
+    item.update({column: None for column in TEXT_COLUMNS})
+    for header, value in record.items():
+        column = mapping.get(header)
+        if column is None or not value:
+            continue
+        if column in NUMERIC_COLUMNS:
+            item[column] = _number(value)
+            if column in ("quantity", "net_weight", "gross_weight", "packages") and not item["unit"]:
+                item["unit"] = parse_unit(value)
+            if column in ("unit_price", "amount") and not item["currency"]:
+                item["currency"] = parse_currency(value)
+        elif column == "unit":
+            item["unit"] = parse_unit(value) or value.strip().upper()[:16]
+        else:
+            item["description"] = " ".join(value.split())[:1000]
+    return item
+
+
+def parse_records(records: List[Dict[str, str]]) -> Dict[str, List[Dict]]:
+    """{"items": [...], "totals": [...]} from {header: cell} rows, or {} if not a goods table."""
+    headers = list(dict.fromkeys(header for record in records for header in record))
+    mapping = header_columns(headers)
+    if not mapping:
+        return {}
+    items, totals = [], []
+    for record in records:
+        item = type_row(record, mapping)
+        if all(np.isnan(item[column]) for column in NUMERIC_COLUMNS):
+            if item["description"] and items and not any(_TOTAL_RE.search(v or "") for v in record.values()):
+                items[-1]["description"] = f"{items[-1]['description'] or ''} {item['description']}".strip()
+            continue
+        if any(_TOTAL_RE.search(value or "") for value in record.values()):
+            totals.append(item)
+        else:
+            items.append(item)
+    return {"items": items, "totals": totals} if items or totals else {}
+
+
+# ---------------------- Sources ----------------------
+
+def items_from_fields(fields: Dict) -> Dict[str, List[Dict]]:
+    """Goods tables among the "Table N" fields from Document Intelligence."""
+    result = {"items": [], "totals": []}
+    for key, value in (fields or {}).items():
+        if not TABLE_FIELD_RE.match(str(key)):
+            continue
+        try:
+            records = json.loads(value)
+        except (TypeError, ValueError):
+            continue
+        parsed = parse_records(records)
+        result["items"].extend(parsed.get("items", []))
+        result["totals"].extend(parsed.get("totals", []))
+    return result if result["items"] or result["totals"] else {}
+
+
+def looks_tabular(text: str) -> bool:
+    """Some line of the text reads like a goods table header."""
+    for line in (text or "").splitlines():
+        if len(line) <= 200 and header_columns(_line_phrases(line), OCR_HEADER_COLUMNS):
+            return True
+    return False
+
+
+def _line_phrases(line: str) -> List[str]:
+    parts = [p for p in re.split(r"\s{2,}|\t|\|", line) if p.strip()]
+    if len(parts) < 2:
+        parts = line.split()
+    return parts
+
+
+def parse_words(tsv: str) -> List[List[Dict]]:
+    """
+    Tesseract TSV -> visual lines (top to bottom) of words {text, left,
+    right, top, height}. Tesseract often puts table columns in separate
+    blocks, so words are grouped by vertical overlap, not by line number.
+    """
+    words = []
+    for row in tsv.splitlines():
+        cols = row.split("\t")
+        if len(cols) < 12 or cols[0] != "5" or not cols[11].strip():
+            continue
+        left, top, width, height = (int(c) for c in cols[6:10])
+        words.append({"text": cols[11], "left": left, "right": left + width, "top": top, "height": height})
+
+    lines, line_bottom = [], None
+    for word in sorted(words, key=lambda w: w["top"] + w["height"] / 2):
+        middle = word["top"] + word["height"] / 2
+        if lines and middle <= line_bottom:
+            lines[-1].append(word)
+            line_bottom = max(line_bottom, word["top"] + word["height"])
+        else:
+            lines.append([word])
+            line_bottom = word["top"] + word["height"]
+    return [sorted(line, key=lambda w: w["left"]) for line in lines]
+
+
+def _phrases(words: List[Dict]) -> List[Dict]:
+    """Adjacent words closer than PHRASE_GAP line heights, merged into cells."""
+    phrases = []
+    for word in words:
+        last = phrases[-1] if phrases else None
+        if last and word["left"] - last["right"] <= PHRASE_GAP * max(word["height"], 1):
+            last["text"] += " " + word["text"]
+            last["right"] = word["right"]
+        else:
+            phrases.append(dict(word))
+    return phrases
+
+
+def records_from_words(lines: List[List[Dict]]) -> List[Dict[str, str]]:
+    """Rows under the first goods-table header line, cells keyed by header text."""
+    for start, words in enumerate(lines):
+        header = _phrases(words)
+        if header_columns([p["text"] for p in header], OCR_HEADER_COLUMNS):
+            break
+    else:
+        return []
+    centers = [(p["left"] + p["right"]) / 2 for p in header]
+    bounds = [(a + b) / 2 for a, b in zip(centers, centers[1:])]
+    names = [p["text"] for p in header]
+
+    records, gap = [], 0
+    for words in lines[start + 1:]:
+        record = {}
+        for word in words:
+            column = int(np.searchsorted(bounds, (word["left"] + word["right"]) / 2))
+            record[names[column]] = f"{record.get(names[column], '')} {word['text']}".strip()
+        if any(_DIGIT_RE.search(value) for value in record.values()):
+            gap = 0
+        else:
+            gap += 1
+            if gap > MAX_GAP_LINES:
+                break
+        records.append(record)
+        if any(_TOTAL_RE.search(value) for value in record.values()):
+            break
+    return records
+
+
+def items_from_image(image) -> Dict[str, List[Dict]]:
+    from ocr_backend import image_to_data
+    from preprocess import preprocess
+    return parse_records(records_from_words(parse_words(image_to_data(preprocess(image)))))
+
+
+def extract_line_items(fields: Dict, text: str = "", image=None) -> Dict[str, List[Dict]]:
+    """Items and stated totals of one page: Document Intelligence tables first, then word boxes."""
+    if not LINE_ITEMS_ENABLED:
+        return {}
+    parsed = items_from_fields(fields)
+    if not parsed and image is not None and looks_tabular(text):
+        try:
+            parsed = items_from_image(image)
+        except Exception as e:
+            print(f"[LineItems] Word-box extraction failed: {e}")
+    return parsed
+
+
+# ---------------------- Columnar frame ----------------------
+
+def _page_order(page_name) -> tuple:
+    number = _PAGE_NUMBER_RE.search(str(page_name or ""))
+    return (int(number.group(1)) if number else 0, str(page_name or ""))
+
+
+class ItemFrame:
+    """Parallel arrays, one element per line item (or stated total row)."""
+
+    def __init__(self, rows: List[Dict]):
+        self.size = len(rows)
+        self.document, self.documents, self.page_ranges = self._segments(rows)
+        self.is_total = np.array([bool(r.get("is_total")) for r in rows], dtype=bool)
+        for column in NUMERIC_COLUMNS:
+            setattr(self, column, np.array(
+                [float(r[column]) if r.get(column) is not None else np.nan for r in rows], dtype=np.float64))
+        for column in TEXT_COLUMNS:
+            setattr(self, column, np.array([r.get(column) or "" for r in rows] or [], dtype=object))
+
+    @staticmethod
+    def _segments(rows: List[Dict]):
+        """
+        Code each row with its document: consecutive pages of one
+        (document_id, form_type), closed by the page that has Total rows.
+        """
+        order = sorted(range(len(rows)), key=lambda i: (
+            str(rows[i].get("document_id")), rows[i].get("form_type") or "",
+            _page_order(rows[i].get("page_name")), rows[i].get("row_index") or 0))
+        codes = np.zeros(len(rows), dtype=np.int64)
+        documents, page_ranges = [], []
+        group = page = None
+        closed = False
+        for i in order:
+            row = rows[i]
+            row_group = (str(row.get("document_id")), row.get("form_type") or "")
+            row_page = row.get("page_name") or ""
+            if row_group != group or (row_page != page and closed):
+                documents.append(f"{row_group[0]}|{row_group[1]}")
+                page_ranges.append([row_page, row_page])
+                group, closed = row_group, False
+            elif row_page != page:
+                page_ranges[-1][1] = row_page
+            page = row_page
+            closed = closed or bool(row.get("is_total"))
+            codes[i] = len(documents) - 1
+        return codes, np.array(documents or [""], dtype=object), page_ranges
+
+    def sums(self, column: str, where: Optional[np.ndarray] = None) -> np.ndarray:
+        """Per document: sum of `column` over its items (those in `where`); NaN where none has a value."""
+        values = getattr(self, column)
+        mask = ~self.is_total & ~np.isnan(values)
+        if where is not None:
+            mask &= where
+        n = len(self.documents)
+        sums = np.bincount(self.document[mask], weights=values[mask], minlength=n)
+        present = np.bincount(self.document[mask], minlength=n) > 0
+        return np.where(present, sums, np.nan)
+
+    def stated(self, column: str) -> np.ndarray:
+        """Per document: the largest "Total" row value (grand total over sub-totals); NaN if none."""
+        values = getattr(self, column)
+        mask = self.is_total & ~np.isnan(values)
+        result = np.full(len(self.documents), np.nan)
+        np.fmax.at(result, self.document[mask], values[mask])
+        return result
+
+    def document_key(self, code: int):
+        document_id, _, form_type = self.documents[code].partition("|")
+        return document_id, form_type
+
+    def pages(self, code: int) -> str:
+        """Page span of a document, e.g. "Page_03" or "Page_03-Page_04"."""
+        if code >= len(self.page_ranges):
+            return ""
+        first, last = self.page_ranges[code]
+        return first if first == last else f"{first}-{last}"
+
+
+def totals(parsed: Dict[str, List[Dict]]) -> Dict[str, float]:
+    """Summed numeric columns of one page or document's items (columns with no values omitted)."""
+    frame = ItemFrame([dict(item, document_id="", form_type="", row_index=index)
+                       for index, item in enumerate(parsed.get("items", []))])
+    result = {}
+    for column in NUMERIC_COLUMNS:
+        if column == "unit_price":
+            continue
+        value = frame.sums(column)
+        if value.size and not np.isnan(value[0]):
+            result[column] = round(float(value[0]), 4)
+    return result
+
+
+# ---------------------- Storage ----------------------
+
+ITEM_COLUMNS = ["description", "quantity", "unit", "unit_price", "amount", "currency",
+                "net_weight", "gross_weight", "packages"]
+
+
+def _db_value(value):
+    if isinstance(value, float):
+        return None if np.isnan(value) else round(value, 4)
+    return value
+
+
+def save_line_items(conn, session_id, document_id, page_name, parsed: Dict[str, List[Dict]]) -> int:
+    rows = [(item, False) for item in parsed.get("items", [])] + [(item, True) for item in parsed.get("totals", [])]
+    if not rows:
+        return 0
+    query = f"""
+    INSERT INTO TF_line_items (session_id, document_id, page_name, form_type, row_index, is_total,
+                               {", ".join(ITEM_COLUMNS)}, extracted_at)
+    VALUES (?, ?, ?, ?, ?, ?, {", ".join("?" for _ in ITEM_COLUMNS)}, GETDATE())
+    """
+    cursor = conn.cursor()
+    cursor.executemany(query, [
+        (str(session_id), str(document_id), page_name, page_name, index, int(is_total),
+         *(_db_value(item.get(column)) for column in ITEM_COLUMNS))
+        for index, (item, is_total) in enumerate(rows)
+    ])
+    conn.commit()
+    return len(rows)
+
+
+def relabel_pages(conn, session_id, document_id, page_names: List[str], form_type: str):
+    """Give item rows of grouped pages their document type."""
+    if not page_names:
+        return
+    placeholders = ",".join("?" for _ in page_names)
+    cursor = conn.cursor()
+    cursor.execute(
+        f"UPDATE TF_line_items SET form_type = ? "
+        f"WHERE session_id = ? AND document_id = ? AND page_name IN ({placeholders})",
+        (form_type, str(session_id), str(document_id), *page_names),
+    )
+    conn.commit()
+
+
+def load_session_items(conn, session_id) -> List[Dict]:
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT document_id, page_name, form_type, row_index, is_total, {", ".join(ITEM_COLUMNS)}
+        FROM TF_line_items
+        WHERE session_id = ?
+    """, (str(session_id),))
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
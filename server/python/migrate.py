@@ -0,0 +1,106 @@
+import os
+import re
+import sys
+from db_utils import get_sql_server_connection
+
+# Applies server/python/migrations/*.sql in filename order and records each
+# one in TF_schema_migrations so it only runs once. Batches are separated by
+# "GO" lines, as in SSMS / sqlcmd.
+#
+# Each migration runs in one transaction. Statements SQL Server refuses
+# inside a user transaction (CREATE FULLTEXT CATALOG / INDEX) go in a file
+# with a "-- migrate: no-transaction" line: its batches run in autocommit
+# mode, so they must be idempotent (IF NOT EXISTS guards) to survive a
+# re-run after a partial failure.
+#
+#   python migrate.py            # apply pending migrations
+#   python migrate.py --status   # list applied / pending
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+NO_TRANSACTION_RE = re.compile(r"^\s*--\s*migrate:\s*no-transaction\s*$", re.IGNORECASE | re.MULTILINE)
+
+
+def ensure_migrations_table(conn):
+    cursor = conn.cursor()
+    cursor.execute("""
+        IF OBJECT_ID('TF_schema_migrations', 'U') IS NULL
+            CREATE TABLE TF_schema_migrations (
+                name NVARCHAR(255) PRIMARY KEY,
+                applied_at DATETIME NOT NULL DEFAULT GETDATE()
+            )
+    """)
+    conn.commit()
+
+
+def applied_migrations(conn) -> set:
+    cursor = conn.cursor()
+    cursor.execute("SELECT name FROM TF_schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def split_batches(sql_text: str) -> list:
+    batches = re.split(r"^\s*GO\s*$", sql_text, flags=re.IGNORECASE | re.MULTILINE)
+    return [batch.strip() for batch in batches if batch.strip()]
+
+
+def is_transactional(sql_text: str) -> bool:
+    return NO_TRANSACTION_RE.search(sql_text) is None
+
+
+def run_autocommit(conn, batches: list):
+    """Execute batches outside a transaction, restoring the connection mode afterwards."""
+    conn.commit()
+    previous = conn.autocommit
+    conn.autocommit = True
+    try:
+        cursor = conn.cursor()
+        for batch in batches:
+            cursor.execute(batch)
+    finally:
+        conn.autocommit = previous
+
+
+def apply_migrations(conn) -> list:
+    ensure_migrations_table(conn)
+    done = applied_migrations(conn)
+    applied = []
+
+    for name in sorted(os.listdir(MIGRATIONS_DIR)):
+        if not name.endswith(".sql") or name in done:
+            continue
+        with open(os.path.join(MIGRATIONS_DIR, name), "r", encoding="utf-8") as f:
+            sql_text = f.read()
+        batches = split_batches(sql_text)
+
+        cursor = conn.cursor()
+        try:
+            if is_transactional(sql_text):
+                for batch in batches:
+                    cursor.execute(batch)
+            else:
+                run_autocommit(conn, batches)
+            cursor.execute("INSERT INTO TF_schema_migrations (name) VALUES (?)", (name,))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"[Migrate] {name} failed: {e}")
+            raise
+        applied.append(name)
+        print(f"[Migrate] Applied {name}")
+
+    return applied
+
+
+if __name__ == "__main__":
+    conn = get_sql_server_connection()
+    if "--status" in sys.argv:
+        ensure_migrations_table(conn)
+        done = applied_migrations(conn)
+        for name in sorted(os.listdir(MIGRATIONS_DIR)):
+            if name.endswith(".sql"):
+                print(f"{'applied' if name in done else 'pending'}  {name}")
+    else:
+        applied = apply_migrations(conn)
+        if not applied:
+            print("[Migrate] Database is up to date.")
+    conn.close()
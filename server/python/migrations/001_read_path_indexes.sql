@@ -0,0 +1,65 @@
+-- Covering indexes for the session-detail and field lookups.
+-- Every read path filters on document_id (often with session_id) and none of
+-- these tables had a declared index, so each lookup was a full scan.
+-- LOB columns (ocr_text, fields_json, file_data) are deliberately not
+-- INCLUDEd; read_path.py only fetches them on request.
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_TF_fields_KeyValuePair_session_document')
+    CREATE NONCLUSTERED INDEX IX_TF_fields_KeyValuePair_session_document
+        ON TF_fields_KeyValuePair (session_id, document_id, extracted_at)
+        INCLUDE (form_type, field_key, field_value);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_TF_fields_KeyValuePair_document')
+    CREATE NONCLUSTERED INDEX IX_TF_fields_KeyValuePair_document
+        ON TF_fields_KeyValuePair (document_id)
+        INCLUDE (form_type, field_key, field_value);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_TF_ingestion_mGroupsFields_session_document')
+    CREATE NONCLUSTERED INDEX IX_TF_ingestion_mGroupsFields_session_document
+        ON TF_ingestion_mGroupsFields (session_id, document_id, created_at)
+        INCLUDE (form_type);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_TF_ingestion_mGroupsFields_document')
+    CREATE NONCLUSTERED INDEX IX_TF_ingestion_mGroupsFields_document
+        ON TF_ingestion_mGroupsFields (document_id)
+        INCLUDE (form_type);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_TF_ingestion_mGroupsOCR_document')
+    CREATE NONCLUSTERED INDEX IX_TF_ingestion_mGroupsOCR_document
+        ON TF_ingestion_mGroupsOCR (document_id)
+        INCLUDE (session_id, form_type, created_at);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_TF_ingestion_mGroupsPDF_document')
+    CREATE NONCLUSTERED INDEX IX_TF_ingestion_mGroupsPDF_document
+        ON TF_ingestion_mGroupsPDF (document_id)
+        INCLUDE (session_id, form_type, created_at);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_TF_ingestion_CleanedOCR_session_document_form')
+    CREATE NONCLUSTERED INDEX IX_TF_ingestion_CleanedOCR_session_document_form
+        ON TF_ingestion_CleanedOCR (session_id, document_id, form_type)
+        INCLUDE (created_at);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_TF_ingestion_CleanedOCR_document')
+    CREATE NONCLUSTERED INDEX IX_TF_ingestion_CleanedOCR_document
+        ON TF_ingestion_CleanedOCR (document_id)
+        INCLUDE (session_id, form_type, created_at);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_TF_ingestion_CleanedPDF_session_document_form')
+    CREATE NONCLUSTERED INDEX IX_TF_ingestion_CleanedPDF_session_document_form
+        ON TF_ingestion_CleanedPDF (session_id, document_id, form_type)
+        INCLUDE (created_at);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_TF_mdocs_mgroups_session_document')
+    CREATE NONCLUSTERED INDEX IX_TF_mdocs_mgroups_session_document
+        ON TF_mdocs_mgroups (session_id, document_id, cataloged_at)
+        INCLUDE (grouped_form_type, matched_document_name, matched_document_id, confidence_score);
+GO
@@ -0,0 +1,46 @@
+-- Normalized, typed field index (field_index.py).
+-- One row per recognised field with a canonical key and typed value, so
+-- cross-document checks in a session are seeks on (session_id, canonical_key)
+-- instead of string scans over TF_fields_KeyValuePair. Rows are written per
+-- page (page_name = Page_NN) and form_type is relabelled to the grouped
+-- document type once group_by_form has classified the page.
+
+IF OBJECT_ID('TF_field_index', 'U') IS NULL
+    CREATE TABLE TF_field_index (
+        id BIGINT IDENTITY(1,1) PRIMARY KEY,
+        session_id NVARCHAR(64) NOT NULL,
+        document_id NVARCHAR(64) NOT NULL,
+        page_name NVARCHAR(255) NULL,
+        form_type NVARCHAR(255) NULL,
+        canonical_key NVARCHAR(64) NOT NULL,
+        value_type NVARCHAR(16) NOT NULL,
+        raw_key NVARCHAR(255) NULL,
+        raw_value NVARCHAR(1000) NULL,
+        value_text NVARCHAR(400) NULL,
+        value_number DECIMAL(19, 4) NULL,
+        value_date DATE NULL,
+        currency CHAR(3) NULL,
+        unit NVARCHAR(16) NULL,
+        extracted_at DATETIME NOT NULL DEFAULT GETDATE()
+    );
+GO
+
+-- canonical key -> every document's value in the session
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_TF_field_index_session_key')
+    CREATE NONCLUSTERED INDEX IX_TF_field_index_session_key
+        ON TF_field_index (session_id, canonical_key)
+        INCLUDE (document_id, form_type, value_type, value_text, value_number, value_date, currency, unit);
+GO
+
+-- value -> documents carrying it (inverted lookup)
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_TF_field_index_session_value')
+    CREATE NONCLUSTERED INDEX IX_TF_field_index_session_value
+        ON TF_field_index (session_id, canonical_key, value_text)
+        INCLUDE (document_id, form_type);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_TF_field_index_document')
+    CREATE NONCLUSTERED INDEX IX_TF_field_index_document
+        ON TF_field_index (document_id, page_name)
+        INCLUDE (session_id, canonical_key, value_text);
+GO
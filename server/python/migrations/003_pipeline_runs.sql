@@ -0,0 +1,29 @@
+-- Completed pipeline stages keyed by upload hash and engine configuration
+-- (artifact_reuse.py). A new session uploading a file whose FileHash already
+-- went through split / group / catalog with the same settings clones those
+-- results instead of re-running OCR.
+
+IF OBJECT_ID('TF_pipeline_runs', 'U') IS NULL
+    CREATE TABLE TF_pipeline_runs (
+        id BIGINT IDENTITY(1,1) PRIMARY KEY,
+        file_hash NVARCHAR(100) NOT NULL,
+        engine_config NVARCHAR(64) NOT NULL,
+        stage NVARCHAR(16) NOT NULL,
+        session_id NVARCHAR(64) NOT NULL,
+        document_id NVARCHAR(64) NOT NULL,
+        output_path NVARCHAR(500) NULL,
+        completed_at DATETIME NOT NULL DEFAULT GETDATE()
+    );
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_TF_pipeline_runs_hash')
+    CREATE NONCLUSTERED INDEX IX_TF_pipeline_runs_hash
+        ON TF_pipeline_runs (file_hash, engine_config, stage, completed_at)
+        INCLUDE (session_id, document_id, output_path);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_TF_pipeline_runs_document')
+    CREATE NONCLUSTERED INDEX IX_TF_pipeline_runs_document
+        ON TF_pipeline_runs (session_id, document_id, stage)
+        INCLUDE (file_hash, engine_config);
+GO
@@ -0,0 +1,25 @@
+-- Page thumbnails / previews written by the split stage (page_previews.py).
+-- Images live next to Page_NN.pdf under outputs/; rows index them so the UI
+-- can list a session's pages without opening any PDF.
+
+IF OBJECT_ID('TF_page_previews', 'U') IS NULL
+    CREATE TABLE TF_page_previews (
+        id BIGINT IDENTITY(1,1) PRIMARY KEY,
+        session_id NVARCHAR(64) NOT NULL,
+        document_id NVARCHAR(64) NOT NULL,
+        page_name NVARCHAR(255) NOT NULL,
+        kind NVARCHAR(16) NOT NULL,
+        file_name NVARCHAR(255) NOT NULL,
+        image_format NVARCHAR(8) NOT NULL,
+        width INT NOT NULL,
+        height INT NOT NULL,
+        byte_size INT NOT NULL,
+        created_at DATETIME NOT NULL DEFAULT GETDATE()
+    );
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_TF_page_previews_document')
+    CREATE NONCLUSTERED INDEX IX_TF_page_previews_document
+        ON TF_page_previews (session_id, document_id, page_name)
+        INCLUDE (kind, file_name, width, height);
+GO
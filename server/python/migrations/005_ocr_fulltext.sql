@@ -0,0 +1,42 @@
+-- Optional SQL Server full-text index over OCR text, used by
+-- search_index.py when TF_SEARCH_BACKEND=sqlserver. Skipped entirely on
+-- instances without the Full-Text Search feature (the default SQLite FTS5
+-- index needs nothing here).
+--
+-- The index only sees plain ocr_text. Rows written with TF_STORAGE_CODEC=
+-- zlib while another search backend was active hold "~z1:" base64 and are
+-- not searchable; with TF_SEARCH_BACKEND=sqlserver db_utils keeps ocr_text
+-- uncompressed (storage_codec.encode_ocr_text).
+--
+-- CREATE FULLTEXT CATALOG / INDEX cannot run inside a user transaction, so
+-- migrate.py applies this file in autocommit mode; every batch is guarded
+-- to be safe to re-run.
+-- migrate: no-transaction
+
+IF FULLTEXTSERVICEPROPERTY('IsFullTextInstalled') = 1
+   AND NOT EXISTS (SELECT 1 FROM sys.fulltext_catalogs WHERE name = 'TF_ocr_catalog')
+    EXEC('CREATE FULLTEXT CATALOG TF_ocr_catalog');
+GO
+
+-- Full-text indexes need a single-column unique key index
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'UX_TF_ingestion_CleanedOCR_id')
+    CREATE UNIQUE NONCLUSTERED INDEX UX_TF_ingestion_CleanedOCR_id ON TF_ingestion_CleanedOCR (id);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'UX_TF_ingestion_mGroupsOCR_id')
+    CREATE UNIQUE NONCLUSTERED INDEX UX_TF_ingestion_mGroupsOCR_id ON TF_ingestion_mGroupsOCR (id);
+GO
+
+IF FULLTEXTSERVICEPROPERTY('IsFullTextInstalled') = 1
+   AND NOT EXISTS (SELECT 1 FROM sys.fulltext_indexes WHERE object_id = OBJECT_ID('TF_ingestion_CleanedOCR'))
+    EXEC('CREATE FULLTEXT INDEX ON TF_ingestion_CleanedOCR (ocr_text LANGUAGE 1033)
+          KEY INDEX UX_TF_ingestion_CleanedOCR_id ON TF_ocr_catalog
+          WITH CHANGE_TRACKING AUTO');
+GO
+
+IF FULLTEXTSERVICEPROPERTY('IsFullTextInstalled') = 1
+   AND NOT EXISTS (SELECT 1 FROM sys.fulltext_indexes WHERE object_id = OBJECT_ID('TF_ingestion_mGroupsOCR'))
+    EXEC('CREATE FULLTEXT INDEX ON TF_ingestion_mGroupsOCR (ocr_text LANGUAGE 1033)
+          KEY INDEX UX_TF_ingestion_mGroupsOCR_id ON TF_ocr_catalog
+          WITH CHANGE_TRACKING AUTO');
+GO
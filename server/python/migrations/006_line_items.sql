@@ -0,0 +1,32 @@
+-- Line items of invoices / packing lists (line_items.py), one row per goods
+-- table row; is_total = 1 marks the document's own "Total" rows. Rows are
+-- written per page and form_type is relabelled to the grouped document type,
+-- as in TF_field_index.
+
+IF OBJECT_ID('TF_line_items', 'U') IS NULL
+    CREATE TABLE TF_line_items (
+        id BIGINT IDENTITY(1,1) PRIMARY KEY,
+        session_id NVARCHAR(64) NOT NULL,
+        document_id NVARCHAR(64) NOT NULL,
+        page_name NVARCHAR(255) NULL,
+        form_type NVARCHAR(255) NULL,
+        row_index INT NOT NULL,
+        is_total BIT NOT NULL DEFAULT 0,
+        description NVARCHAR(1000) NULL,
+        quantity DECIMAL(19, 4) NULL,
+        unit NVARCHAR(16) NULL,
+        unit_price DECIMAL(19, 4) NULL,
+        amount DECIMAL(19, 4) NULL,
+        currency CHAR(3) NULL,
+        net_weight DECIMAL(19, 4) NULL,
+        gross_weight DECIMAL(19, 4) NULL,
+        packages DECIMAL(19, 4) NULL,
+        extracted_at DATETIME NOT NULL DEFAULT GETDATE()
+    );
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_TF_line_items_session')
+    CREATE NONCLUSTERED INDEX IX_TF_line_items_session
+        ON TF_line_items (session_id, document_id, form_type)
+        INCLUDE (is_total, quantity, unit, amount, currency, net_weight, gross_weight, packages);
+GO
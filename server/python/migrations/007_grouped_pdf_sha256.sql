@@ -0,0 +1,19 @@
+-- Grouped PDFs are stored with the SHA-256 pdf_stream.HashingWriter computed
+-- while writing them (db_utils.save_grouped_pdf_to_db), and large ones are
+-- appended in chunks by row id (stream_grouped_pdf_to_db). Both need the
+-- columns below; id already exists on databases created by the app, and is
+-- added here for older copies of the table.
+
+IF COL_LENGTH('TF_ingestion_mGroupsPDF', 'id') IS NULL
+    ALTER TABLE TF_ingestion_mGroupsPDF ADD id BIGINT IDENTITY(1,1) NOT NULL;
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'UX_TF_ingestion_mGroupsPDF_id')
+   AND NOT EXISTS (SELECT 1 FROM sys.indexes
+                   WHERE object_id = OBJECT_ID('TF_ingestion_mGroupsPDF') AND is_primary_key = 1)
+    CREATE UNIQUE NONCLUSTERED INDEX UX_TF_ingestion_mGroupsPDF_id ON TF_ingestion_mGroupsPDF (id);
+GO
+
+IF COL_LENGTH('TF_ingestion_mGroupsPDF', 'file_sha256') IS NULL
+    ALTER TABLE TF_ingestion_mGroupsPDF ADD file_sha256 CHAR(64) NULL;
+GO
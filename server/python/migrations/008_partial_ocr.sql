@@ -0,0 +1,8 @@
+-- Pages classified from header-band OCR whose group needs no field extraction
+-- (pipeline.py header_classify) are stored with the band text only. is_partial
+-- = 1 marks them until the deferred full-OCR pass (pipeline.complete_deferred)
+-- replaces the text.
+
+IF COL_LENGTH('TF_ingestion_CleanedOCR', 'is_partial') IS NULL
+    ALTER TABLE TF_ingestion_CleanedOCR ADD is_partial BIT NOT NULL DEFAULT 0;
+GO
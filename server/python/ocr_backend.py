@@ -0,0 +1,265 @@
+import os
+import queue
+import shlex
+import tempfile
+import threading
+import subprocess
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional
+from PIL import Image, TiffImagePlugin
+
+# Tesseract backend used by every OCR call site.
+#
+# pytesseract writes each image to a temp file, forks the tesseract binary
+# (which reloads its traineddata) and reads the text back from disk; the
+# 4-angle rotation search pays that four times per page. When tesserocr is
+# installed, calls go to a pool of persistent in-process TessBaseAPI
+# engines instead: models stay loaded and images are passed from memory.
+# Without tesserocr, or if an engine call fails, image_to_string falls back
+# to pytesseract with the same arguments.
+#
+#
+# Without a persistent engine, best_rotation_batch() OCRs a whole document
+# (every page at every rotation) in a single tesseract process: frames are
+# streamed into one multi-page TIFF and the TSV output (words with page
+# numbers and confidences) is split back per page. Startup and model load
+# are paid once per document instead of 4 x pages times.
+#
+#   TF_OCR_BACKEND=auto|tesserocr|pytesseract   (default auto)
+#   TF_OCR_POOL_SIZE=<engines per lang + config> (default: CPU count)
+#   TF_OCR_BATCH=auto|true|false                (default auto: batch when using pytesseract)
+
+OCR_BACKEND = os.getenv("TF_OCR_BACKEND", "auto").lower()
+POOL_SIZE = int(os.getenv("TF_OCR_POOL_SIZE", os.cpu_count() or 2))
+BATCH_MODE = os.getenv("TF_OCR_BATCH", "auto").lower()
+DEFAULT_LANG = "eng"
+DEFAULT_PSM = 3                # same as the tesseract CLI / pytesseract default
+ROTATIONS = (0, 90, 180, 270)
+
+_pools = {}
+_pools_lock = threading.Lock()
+_tesserocr = None
+
+
+def _load_tesserocr():
+    global _tesserocr
+    if _tesserocr is None:
+        try:
+            import tesserocr
+            _tesserocr = tesserocr
+        except ImportError:
+            _tesserocr = False
+    return _tesserocr
+
+
+def active_backend() -> str:
+    if OCR_BACKEND == "pytesseract":
+        return "pytesseract"
+    if _tesserocr is None and not _load_tesserocr() and OCR_BACKEND == "tesserocr":
+        print("[OCR] tesserocr not installed; falling back to pytesseract")
+    return "tesserocr" if _tesserocr else "pytesseract"
+
+
+def parse_config(config: str):
+    """(psm, {variable: value}) from a pytesseract-style config string."""
+    psm, variables = DEFAULT_PSM, {}
+    tokens = shlex.split(config or "")
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token == "--psm" and i + 1 < len(tokens):
+            psm = int(tokens[i + 1])
+            i += 1
+        elif token == "-c" and i + 1 < len(tokens) and "=" in tokens[i + 1]:
+            name, value = tokens[i + 1].split("=", 1)
+            variables[name] = value
+            i += 1
+        i += 1
+    return psm, variables
+
+
+class EnginePool:
+    """Up to `size` loaded engines for one (lang, psm, variables); created on demand."""
+
+    def __init__(self, lang: str, psm: int, variables: dict, size: int = POOL_SIZE):
+        self.lang = lang
+        self.psm = psm
+        self.variables = variables
+        self.size = max(1, size)
+        self.idle = queue.LifoQueue()
+        self.created = 0
+        self.lock = threading.Lock()
+
+    def _create(self):
+        tesserocr = _load_tesserocr()
+        return tesserocr.PyTessBaseAPI(lang=self.lang, psm=tesserocr.PSM(self.psm), variables=self.variables)
+
+    @contextmanager
+    def engine(self):
+        try:
+            api = self.idle.get_nowait()
+        except queue.Empty:
+            with self.lock:
+                create = self.created < self.size
+                if create:
+                    self.created += 1
+            if create:
+                try:
+                    api = self._create()
+                except Exception:
+                    with self.lock:
+                        self.created -= 1
+                    raise
+            else:
+                api = self.idle.get()
+        try:
+            yield api
+        finally:
+            api.Clear()
+            self.idle.put(api)
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().End()
+            except queue.Empty:
+                break
+        self.created = 0
+
+
+def _pool_for(lang: str, config: str) -> EnginePool:
+    psm, variables = parse_config(config)
+    key = (lang, psm, tuple(sorted(variables.items())))
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = _pools[key] = EnginePool(lang, psm, variables)
+    return pool
+
+
+def _tesserocr_to_string(image: Image.Image, lang: str, config: str) -> str:
+    with _pool_for(lang, config).engine() as api:
+        api.SetImage(image)
+        return api.GetUTF8Text()
+
+
+def image_to_string(image, lang: str = DEFAULT_LANG, config: str = "") -> str:
+    """Drop-in for pytesseract.image_to_string (PIL image or numpy array)."""
+    if not isinstance(image, Image.Image):
+        image = Image.fromarray(image)
+    if active_backend() == "tesserocr":
+        try:
+            return _tesserocr_to_string(image, lang, config)
+        except Exception as e:
+            print(f"[OCR] tesserocr failed, using pytesseract: {e}")
+    import pytesseract
+    return pytesseract.image_to_string(image, lang=lang, config=config)
+
+
+def image_to_data(image, lang: str = DEFAULT_LANG, config: str = "") -> str:
+    """Word boxes as tesseract TSV (pytesseract.image_to_data's default output)."""
+    if not isinstance(image, Image.Image):
+        image = Image.fromarray(image)
+    if active_backend() == "tesserocr":
+        try:
+            with _pool_for(lang, config).engine() as api:
+                api.SetImage(image)
+                return api.GetTSVText(0)
+        except Exception as e:
+            print(f"[OCR] tesserocr failed, using pytesseract: {e}")
+    import pytesseract
+    return pytesseract.image_to_data(image, lang=lang, config=config)
+
+
+# ---------------------- Batch (one process per document) ----------------------
+
+def batch_enabled() -> bool:
+    if BATCH_MODE in ("1", "true", "yes"):
+        return True
+    if BATCH_MODE in ("0", "false", "no"):
+        return False
+    return active_backend() == "pytesseract"
+
+
+def parse_tsv(tsv: str) -> Dict[int, Dict]:
+    """page_num -> {"text", "confidence"} from tesseract TSV output."""
+    pages = {}
+    rows = tsv.splitlines()
+    for row in rows[1:]:
+        cols = row.split("\t")
+        if len(cols) < 12 or cols[0] != "5" or not cols[11].strip():
+            continue
+        page_num = int(cols[1])
+        page = pages.setdefault(page_num, {"lines": {}, "confidences": []})
+        page["lines"].setdefault((int(cols[2]), int(cols[3]), int(cols[4])), []).append(cols[11])
+        if float(cols[10]) >= 0:
+            page["confidences"].append(float(cols[10]))
+
+    results = {}
+    for page_num, page in pages.items():
+        lines, previous = [], None
+        for (block, par, line), words in sorted(page["lines"].items()):
+            if previous is not None and (block, par) != previous:
+                lines.append("")           # blank line between paragraphs, as in text output
+            lines.append(" ".join(words))
+            previous = (block, par)
+        confidences = page["confidences"]
+        results[page_num] = {
+            "text": "\n".join(lines),
+            "confidence": round(sum(confidences) / len(confidences), 2) if confidences else None,
+        }
+    return results
+
+
+def image_data_batch(images: Iterable, lang: str = DEFAULT_LANG, config: str = "") -> List[Dict]:
+    """One tesseract run over all images -> [{"text", "confidence"}] in input order."""
+    import pytesseract
+    with tempfile.TemporaryDirectory(prefix="tf-ocr-") as tmp:
+        tiff_path = os.path.join(tmp, "pages.tif")
+        count = 0
+        # Frames are appended one at a time, so only one page is held in memory
+        with TiffImagePlugin.AppendingTiffWriter(tiff_path, new=True) as tiff:
+            for image in images:
+                if not isinstance(image, Image.Image):
+                    image = Image.fromarray(image)
+                image.convert("L").save(tiff, format="TIFF", compression="tiff_lzw")
+                tiff.newFrame()
+                count += 1
+        if not count:
+            return []
+        out_base = os.path.join(tmp, "out")
+        cmd = [pytesseract.pytesseract.tesseract_cmd, tiff_path, out_base, "-l", lang]
+        cmd += shlex.split(config or "") + ["tsv"]
+        subprocess.run(cmd, check=True, capture_output=True)
+        with open(out_base + ".tsv", "r", encoding="utf-8") as f:
+            pages = parse_tsv(f.read())
+    return [pages.get(i + 1, {"text": "", "confidence": None}) for i in range(count)]
+
+
+def best_rotation_batch(images: List, lang: str = DEFAULT_LANG, config: str = "") -> Optional[List[Dict]]:
+    """
+    The rotation search of the per-page helpers for a whole document in one
+    process: per image, {"text", "confidence", "angle"} of the rotation with
+    the most text. None if the batch run failed (callers OCR page by page).
+    """
+    frames = (image.rotate(angle, expand=True) for image in images for angle in ROTATIONS)
+    try:
+        results = image_data_batch(frames, lang, config)
+    except Exception as e:
+        print(f"[OCR] Batch tesseract run failed, OCR page by page: {e}")
+        return None
+    best = []
+    for i in range(0, len(results), len(ROTATIONS)):
+        candidates = [dict(result, text=result["text"].strip(), angle=angle)
+                      for angle, result in zip(ROTATIONS, results[i:i + len(ROTATIONS)])]
+        best.append(max(candidates, key=lambda c: len(c["text"])))
+    return best
+
+
+def shutdown():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
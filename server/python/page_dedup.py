@@ -0,0 +1,159 @@
+import os
+import re
+import hashlib
+from typing import Dict, List, Optional
+from PIL import Image
+
+# Near-duplicate page detection for trade bundles.
+#
+# Bundles routinely carry ORIGINAL / DUPLICATE / TRIPLICATE copies of the same
+# bill of lading that differ only by a stamp. A 256-bit difference hash of the
+# rasterized page finds candidates; a single cheap Tesseract pass (no rotation
+# search, no Azure, no GPT-4o) of the candidate is then compared with MinHash
+# over word shingles to the same quick pass of the primary page, run once
+# the first time a candidate hits it. Comparing like with like (same engine,
+# same line breaks) keeps a genuine ORIGINAL / COPY pair well above
+# MIN_TEXT_SIMILARITY, while a different document on a similar layout
+# (another B/L, an invoice from the same shipper) stays far below it.
+# Confirmed copies reuse the primary page's OCR text and fields, and the
+# lines that differ (usually the stamp) are kept as diff_lines.
+# Cross-references (source page, hash distance, text similarity) are written
+# to duplicates.json next to the Page_NN files so grouping can keep copies
+# with their primary.
+
+DEDUP_ENABLED = os.getenv("TF_PAGE_DEDUP", "true").lower() not in ("0", "false", "no")
+HASH_SIZE = 16                 # 16x16 gradient grid -> 256-bit hash
+MAX_HASH_DISTANCE = 20         # bits out of 256
+MIN_TEXT_SIMILARITY = 0.85     # estimated Jaccard of word shingles, quick OCR vs quick OCR
+NUM_PERMUTATIONS = 64
+SHINGLE_SIZE = 2
+DUPLICATES_FILENAME = "duplicates.json"
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+# ---------------------- Hashing ----------------------
+
+def dhash(image: Image.Image, size: int = HASH_SIZE) -> int:
+    """Difference hash: sign of horizontal gradients on a downscaled page."""
+    small = image.convert("L").resize((size + 1, size), Image.BILINEAR)
+    pixels = list(small.getdata())
+    bits = 0
+    for row in range(size):
+        offset = row * (size + 1)
+        for col in range(size):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return bits
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def tokens(text: str) -> List[str]:
+    return _TOKEN_RE.findall((text or "").lower())
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> set:
+    words = tokens(text)
+    if len(words) < size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def minhash(text: str, num_perm: int = NUM_PERMUTATIONS) -> List[int]:
+    values = shingles(text)
+    if not values:
+        return []
+    signature = []
+    for seed in range(num_perm):
+        salt = seed.to_bytes(8, "little")
+        signature.append(min(
+            int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8, salt=salt).digest(), "little")
+            for value in values
+        ))
+    return signature
+
+
+def minhash_similarity(a: List[int], b: List[int]) -> float:
+    if not a or not b:
+        return 0.0
+    return sum(1 for x, y in zip(a, b) if x == y) / len(a)
+
+
+# ---------------------- Tracker ----------------------
+
+class PageDeduplicator:
+    """Tracks primary pages of one document and matches later pages to them."""
+
+    def __init__(self, max_distance: int = MAX_HASH_DISTANCE, min_similarity: float = MIN_TEXT_SIMILARITY):
+        self.max_distance = max_distance
+        self.min_similarity = min_similarity
+        self.primaries: List[Dict] = []
+        self.cross_references: Dict[str, Dict] = {}
+
+    def register(self, image_hash: int, page: Dict, image: Optional[Image.Image] = None):
+        """
+        Remember a fully OCR'd page as a possible primary for later copies.
+        `image` is kept until a candidate needs the primary's quick OCR;
+        without it, candidates are compared to the full OCR text.
+        """
+        self.primaries.append({
+            "hash": image_hash,
+            "page": page,
+            "image": image,
+            "signature": minhash(page["text"]),
+            "tokens": set(tokens(page["text"])),
+        })
+
+    @staticmethod
+    def _quick_reference(primary: Dict, quick_ocr):
+        """Signature and tokens of the primary's quick OCR, computed on first use."""
+        if primary["image"] is not None:
+            quick_text = quick_ocr(primary["image"])
+            primary["signature"] = minhash(quick_text)
+            primary["tokens"] = set(tokens(quick_text))
+            primary["image"] = None
+        return primary["signature"], primary["tokens"]
+
+    def match(self, image: Image.Image, image_hash: int, quick_ocr) -> Optional[Dict]:
+        """
+        Return a page dict reusing a primary's OCR, or None when the page must
+        go through full OCR. `quick_ocr(image)` is the lightweight diff pass.
+        """
+        best, best_distance = None, None
+        for primary in self.primaries:
+            distance = hamming(image_hash, primary["hash"])
+            if distance <= self.max_distance and (best_distance is None or distance < best_distance):
+                best, best_distance = primary, distance
+        if best is None:
+            return None
+
+        quick_text = quick_ocr(image)
+        reference_signature, reference_tokens = self._quick_reference(best, quick_ocr)
+        similarity = minhash_similarity(minhash(quick_text), reference_signature)
+        if similarity < self.min_similarity:
+            return None
+
+        diff_lines = [
+            line.strip() for line in quick_text.splitlines()
+            if line.strip() and any(tok not in reference_tokens for tok in tokens(line))
+        ]
+        primary_page = best["page"]
+        return {
+            "text": primary_page["text"],
+            "fields": dict(primary_page["fields"]),
+            "duplicate_of": primary_page["name"],
+            "hash_distance": best_distance,
+            "text_similarity": round(similarity, 3),
+            "diff_lines": diff_lines,
+        }
+
+    def record(self, page: Dict):
+        if page.get("duplicate_of"):
+            self.cross_references[page["name"]] = {
+                "duplicate_of": page["duplicate_of"],
+                "hash_distance": page["hash_distance"],
+                "text_similarity": page["text_similarity"],
+                "diff_lines": page["diff_lines"],
+            }
@@ -0,0 +1,96 @@
+import io
+import os
+import json
+from typing import Dict, List
+from PIL import Image, features
+
+# Thumbnails and mid-size previews for each split page.
+#
+# The split stage already rasterizes every page for OCR; here those images
+# are downscaled and encoded (WebP, JPEG when Pillow lacks WebP) next to
+# Page_NN.pdf as Page_NN.thumb.<ext> and Page_NN.preview.<ext>. The session
+# UI can list and show pages from these few-KB images instead of fetching
+# and rendering each page PDF. previews.json in the page folder and
+# TF_page_previews index them.
+#
+#   TF_PAGE_PREVIEWS=true|false    (default true)
+#   TF_PREVIEW_FORMAT=webp|jpeg    (default webp)
+
+PREVIEWS_ENABLED = os.getenv("TF_PAGE_PREVIEWS", "true").lower() not in ("0", "false", "no")
+PREVIEWS_FILENAME = "previews.json"
+
+# kind -> (longest edge in px, encoder quality)
+PREVIEW_SIZES = {
+    "thumb": (int(os.getenv("TF_THUMBNAIL_SIZE", 256)), 60),
+    "preview": (int(os.getenv("TF_PREVIEW_SIZE", 1024)), 75),
+}
+
+
+def preview_format() -> str:
+    requested = os.getenv("TF_PREVIEW_FORMAT", "webp").lower()
+    if requested == "webp" and not features.check("webp"):
+        return "jpeg"
+    return "webp" if requested == "webp" else "jpeg"
+
+
+def render_previews(image: Image.Image) -> Dict[str, Dict]:
+    """Encoded thumbnail and preview of one rasterized page, in memory."""
+    if not PREVIEWS_ENABLED:
+        return {}
+    fmt = preview_format()
+    source = image if image.mode in ("RGB", "L") else image.convert("RGB")
+    previews = {}
+    # Largest first, so each smaller size is scaled from the previous one
+    for kind, (edge, quality) in sorted(PREVIEW_SIZES.items(), key=lambda item: -item[1][0]):
+        scaled = source.copy()
+        # reducing_gap does a cheap integer reduce before the resampling pass
+        scaled.thumbnail((edge, edge), Image.LANCZOS, reducing_gap=2.0)
+        buffer = io.BytesIO()
+        if fmt == "webp":
+            scaled.save(buffer, "WEBP", quality=quality, method=4)
+        else:
+            scaled.save(buffer, "JPEG", quality=quality, optimize=True, progressive=True)
+        previews[kind] = {
+            "format": fmt,
+            "width": scaled.width,
+            "height": scaled.height,
+            "data": buffer.getvalue(),
+        }
+        source = scaled
+    return previews
+
+
+def preview_filename(page_name: str, kind: str, fmt: str) -> str:
+    return f"{page_name}.{kind}.{'webp' if fmt == 'webp' else 'jpg'}"
+
+
+def write_previews(output_dir: str, page_name: str, previews: Dict[str, Dict]) -> List[Dict]:
+    """Write render_previews() output next to the page; returns manifest entries."""
+    entries = []
+    for kind, preview in previews.items():
+        file_name = preview_filename(page_name, kind, preview["format"])
+        with open(os.path.join(output_dir, file_name), "wb") as f:
+            f.write(preview["data"])
+        entries.append({
+            "page": page_name,
+            "kind": kind,
+            "file": file_name,
+            "format": preview["format"],
+            "width": preview["width"],
+            "height": preview["height"],
+            "bytes": len(preview["data"]),
+        })
+    return entries
+
+
+def write_preview_manifest(output_dir: str, entries: List[Dict]):
+    """previews.json: page name -> {kind: entry}."""
+    if not entries:
+        return
+    manifest = {}
+    for entry in entries:
+        manifest.setdefault(entry["page"], {})[entry["kind"]] = {
+            key: value for key, value in entry.items() if key not in ("page", "kind")
+        }
+    with open(os.path.join(output_dir, PREVIEWS_FILENAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
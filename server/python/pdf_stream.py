@@ -0,0 +1,71 @@
+import hashlib
+from typing import Iterable, List, Tuple
+from PyPDF2 import PdfMerger, PdfReader, PdfWriter
+
+# Grouped-PDF assembly without holding whole documents in memory.
+#
+# A group is built from page references into the document's original.pdf
+# (one reader, pages copied by index) rather than by opening every
+# Page_NN.pdf, and the result is written straight to disk through a writer
+# that hashes the bytes as they pass. Storage then streams the file in
+# chunks once it is large (db_utils.stream_grouped_pdf_to_db), so nothing
+# needs the merged PDF as a single bytes object. The original stays open as
+# a file while pages are copied, so PdfReader reads objects from disk on
+# demand instead of loading the whole file. The digest is stored in
+# TF_ingestion_mGroupsPDF.file_sha256 and checked against the bytes sent to
+# SQL Server (migrations/007).
+
+HASH_ALGORITHM = "sha256"
+
+
+class HashingWriter:
+    """File-like wrapper that hashes and counts everything written through it."""
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.digest = hashlib.new(HASH_ALGORITHM)
+        self.size = 0
+
+    def write(self, data) -> int:
+        self.digest.update(data)
+        self.size += len(data)
+        return self.fileobj.write(data)
+
+    def tell(self) -> int:
+        return self.size
+
+    def flush(self):
+        self.fileobj.flush()
+
+    def hexdigest(self) -> str:
+        return self.digest.hexdigest()
+
+
+def write_pages_from_original(original_path: str, page_numbers: Iterable[int], out_path: str) -> Tuple[str, int]:
+    """
+    Copy 1-based `page_numbers` out of `original_path` into `out_path`.
+    Returns (sha256 hex digest, size in bytes) of the written file.
+    """
+    # A path would make PdfReader read the whole file into memory
+    with open(original_path, "rb") as source, open(out_path, "wb") as f:
+        reader = PdfReader(source)
+        writer = PdfWriter()
+        for page_number in page_numbers:
+            writer.add_page(reader.pages[page_number - 1])
+        out = HashingWriter(f)
+        writer.write(out)
+    return out.hexdigest(), out.size
+
+
+def write_merged_sources(sources: List, out_path: str) -> Tuple[str, int]:
+    """Fallback for folders without original.pdf: merge per-page PDFs or streams."""
+    merger = PdfMerger()
+    for src in sources:
+        merger.append(src)
+
+    with open(out_path, "wb") as f:
+        out = HashingWriter(f)
+        merger.write(out)
+    merger.close()
+    return out.hexdigest(), out.size
+
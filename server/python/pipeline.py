@@ -0,0 +1,287 @@
+import os
+import json
+import argparse
+from PyPDF2 import PdfReader
+from pdf2image import convert_from_path
+from db_utils import complete_cleaned_text_in_db, get_sql_server_connection, replace_grouped_text_in_db
+from instrumentation import span, profile_run
+from header_ocr import HEADER_CLASSIFY_ENABLED, header_texts, needs_full_ocr
+from page_dedup import DEDUP_ENABLED, PageDeduplicator
+from page_previews import render_previews, write_preview_manifest
+from split_OCR import (
+    azure_page_fields_cache,
+    azure_page_text_cache,
+    batch_tesseract,
+    tesseract_page_text_cache,
+    ocr_page,
+    output_dir_for,
+    page_text,
+    single_page_pdf,
+    write_duplicate_index,
+    write_original_copy,
+    write_page,
+)
+from group_by_form import load_document_names_from_db, load_pages_from_folder, group_pages, save_grouped_outputs
+from catalog_with_master import get_master_documents, catalog_grouped_text, read_grouped_text
+from artifact_reuse import (
+    CATALOG_TABLES,
+    GROUP_TABLES,
+    REUSE_ENABLED,
+    SPLIT_TABLES,
+    engine_config,
+    file_sha256,
+    try_record,
+    try_reuse,
+)
+
+# Fused split -> group -> catalog run for one PDF.
+#
+# The separate scripts hand pages to each other through the filesystem:
+# group_by_form lists outputs/<session>/ and re-reads every Page_NN file,
+# catalog_with_master re-lists grouped/ and re-reads text.txt. Here page
+# objects (text, fields, single-page PDF bytes) flow in memory from stage to
+# stage and every artifact is written exactly once, after grouping. The
+# on-disk layout and DB rows are identical to running the three scripts.
+#
+# With header_classify (TF_HEADER_CLASSIFY=true / --header-classify) pages are
+# classified from a low-resolution OCR of their header and footer bands
+# first; pages whose group needs no field extraction (header_ocr.
+# NO_EXTRACTION_FORMS) are stored with the band text only, flagged
+# TF_ingestion_CleanedOCR.is_partial = 1 (migrations/008), and listed in
+# deferred.json. Pages whose header is not recognised land in
+# "unclassified", which always gets full OCR and is then classified again
+# from the full text before grouping. complete_deferred() later OCRs
+# the listed pages in full and replaces their page and group text; it runs
+# as a low-priority "deferred" job_queue.py job when TF_DEFERRED_OCR_QUEUE
+# (default: OCR_JOB_QUEUE) is set, or by hand:
+#
+#   python pipeline.py <pdf_path> <session_id> <document_id> --complete-deferred
+#
+# When the same file was already run with the same settings (artifact_reuse.
+# py, keyed by the upload's SHA-256), its outputs and rows are cloned instead.
+
+DEFERRED_FILENAME = "deferred.json"
+UNCLASSIFIED = "unclassified"  # group_pages() label for failed classifications
+DEFERRED_OCR_QUEUE = os.getenv("TF_DEFERRED_OCR_QUEUE", os.getenv("OCR_JOB_QUEUE", "false")).lower() in ("1", "true", "yes")
+
+
+def classify_by_header(images, pdf_path: str, reader: PdfReader, document_names: list, dedup) -> tuple:
+    """Group pages from header-band OCR, then fully OCR only the groups that need fields."""
+    with span("header_ocr", pages=len(images)):
+        heads = [{"name": f"Page_{i + 1:02}", "page_number": i + 1, "text": text}
+                 for i, text in enumerate(header_texts(images))]
+    grouped_heads = group_pages(heads, document_names)
+
+    batch_tesseract(images, pdf_path, [head["page_number"] - 1
+                                       for form_type, group in grouped_heads.items() if needs_full_ocr(form_type)
+                                       for head in group])
+    pages = [None] * len(images)
+    deferred = []
+    for form_type, group in grouped_heads.items():
+        for head in group:
+            i = head["page_number"] - 1
+            if needs_full_ocr(form_type):
+                with span("page", page=i + 1):
+                    pages[i] = ocr_page(images[i], i, pdf_path, reader, dedup)
+            else:
+                pages[i] = dict(head, fields={}, pdf_bytes=single_page_pdf(reader, i),
+                                previews=render_previews(images[i]), partial=True)
+                deferred.append({"page": head["name"], "page_number": head["page_number"], "form_type": form_type})
+
+    grouped_data = {
+        form_type: [pages[head["page_number"] - 1] for head in group]
+        for form_type, group in grouped_heads.items() if form_type != UNCLASSIFIED
+    }
+    # Headers the classifier could not place get a second chance on the full text
+    unclassified = [pages[head["page_number"] - 1] for head in grouped_heads.get(UNCLASSIFIED, [])]
+    if unclassified:
+        with span("reclassify", pages=len(unclassified)):
+            regrouped = group_pages(unclassified, document_names)
+        for form_type, group in regrouped.items():
+            merged = grouped_data.get(form_type, []) + group
+            grouped_data[form_type] = sorted(merged, key=lambda page: page["page_number"])
+    return pages, grouped_data, deferred
+
+
+def enqueue_deferred(pdf_path: str, session_id: str, document_id: str):
+    """Queue the full-OCR pass for deferred pages behind regular work."""
+    try:
+        import job_queue
+        queue_conn = job_queue.connect()
+        job_id = job_queue.enqueue(queue_conn, "deferred", {"pdf_path": os.path.abspath(pdf_path),
+                                                            "session_id": session_id, "document_id": document_id})
+        queue_conn.close()
+        print(f" Deferred full OCR queued as job {job_id}")
+    except Exception as e:
+        print(f"[Deferred] Not queued: {e}")
+
+
+def complete_deferred(pdf_path: str, session_id: str, document_id: str, conn,
+                      output_base: str = "./outputs", grouped_base: str = "grouped") -> int:
+    """
+    Full-OCR the pages listed in deferred.json, replace their header-band
+    text on disk and in the DB (clearing is_partial), and rebuild the text of
+    their groups. Returns the number of pages completed.
+    """
+    output_dir = output_dir_for(pdf_path, session_id, document_id, output_base)
+    deferred_path = os.path.join(output_dir, DEFERRED_FILENAME)
+    if not os.path.exists(deferred_path):
+        return 0
+    with open(deferred_path, "r", encoding="utf-8") as f:
+        deferred = json.load(f)
+
+    group_texts = {}
+    for entry in deferred:
+        page_number = entry["page_number"]
+        with span("page", page=page_number):
+            with span("rasterize"):
+                image = convert_from_path(pdf_path, first_page=page_number, last_page=page_number)[0]
+            text = page_text(image, pdf_path, page_number - 1)
+        with open(os.path.join(output_dir, f"{entry['page']}.txt"), "w", encoding="utf-8") as f:
+            f.write(text)
+        with span("sql_write", page=page_number):
+            complete_cleaned_text_in_db(conn, session_id, document_id, entry["page"], text)
+        group_texts.setdefault(entry["form_type"], []).append(text)
+    azure_page_text_cache.pop(pdf_path, None)
+    azure_page_fields_cache.pop(pdf_path, None)
+
+    # No-extraction groups consist of deferred pages only, in deferred.json order
+    for form_type, texts in group_texts.items():
+        text = "\n\n".join(texts)
+        group_dir = os.path.join(grouped_base, session_id, document_id, form_type)
+        if os.path.isdir(group_dir):
+            with open(os.path.join(group_dir, "text.txt"), "w", encoding="utf-8") as f:
+                f.write(text)
+        with span("sql_write", group=form_type):
+            replace_grouped_text_in_db(conn, session_id, document_id, form_type, text)
+
+    os.remove(deferred_path)
+    print(f" Deferred full OCR done for {len(deferred)} page(s)")
+    return len(deferred)
+
+
+def reuse_previous_run(file_hash: str, config: str, session_id: str, document_id: str, conn,
+                       output_dir: str, grouped_base: str, catalog: bool):
+    """
+    Clone an earlier run of the same file; returns form_type -> [] (page
+    lists are not rebuilt) or None when nothing was reused.
+    """
+    if not try_reuse(conn, "split", SPLIT_TABLES, session_id, document_id, output_dir, file_hash, config):
+        return None
+    grouped_dir = os.path.join(grouped_base, session_id, document_id)
+    if not try_reuse(conn, "group", GROUP_TABLES, session_id, document_id, grouped_dir, file_hash, config):
+        # Pages are there but grouping never finished: group from the cloned pages
+        pages = load_pages_from_folder(output_dir)
+        grouped_data = group_pages(pages, load_document_names_from_db(conn))
+        save_grouped_outputs(session_id, document_id, grouped_data, conn, grouped_base,
+                             original_pdf=os.path.join(output_dir, "original.pdf"))
+        try_record(conn, "group", session_id, document_id, grouped_dir, file_hash, config)
+
+    form_types = sorted(os.listdir(grouped_dir)) if os.path.isdir(grouped_dir) else []
+    if catalog and not try_reuse(conn, "catalog", CATALOG_TABLES, session_id, document_id, None, file_hash, config):
+        master_docs = get_master_documents(conn)
+        for form_type in form_types:
+            text = read_grouped_text(os.path.join(grouped_dir, form_type))
+            catalog_grouped_text(conn, session_id, document_id, form_type, text, master_docs)
+        try_record(conn, "catalog", session_id, document_id, None, file_hash, config)
+
+    print(f"\n Pipeline reused an earlier run: {len(form_types)} groups for session: {session_id}")
+    return {form_type: [] for form_type in form_types}
+
+
+def run_pipeline(pdf_path: str, session_id: str, document_id: str, conn, output_base: str = "./outputs",
+                 grouped_base: str = "grouped", catalog: bool = True,
+                 header_classify: bool = HEADER_CLASSIFY_ENABLED) -> dict:
+    output_dir = output_dir_for(pdf_path, session_id, document_id, output_base)
+    grouped_dir = os.path.join(grouped_base, session_id, document_id)
+    file_hash = config = None
+    if REUSE_ENABLED:
+        file_hash = file_sha256(pdf_path)
+        config = engine_config("pipeline", None, header_classify=bool(header_classify))
+        reused = reuse_previous_run(file_hash, config, session_id, document_id, conn,
+                                    output_dir, grouped_base, catalog)
+        if reused is not None:
+            return reused
+
+    reader = PdfReader(pdf_path)
+
+    print(" Converting all PDF pages to images...")
+    with span("rasterize"):
+        images = convert_from_path(pdf_path)
+
+    document_names = load_document_names_from_db(conn)
+    dedup = PageDeduplicator() if DEDUP_ENABLED else None
+    deferred = []
+
+    if header_classify:
+        # ---- Classify from header bands, full OCR only where fields are needed ----
+        pages, grouped_data, deferred = classify_by_header(images, pdf_path, reader, document_names, dedup)
+    else:
+        # ---- Split + OCR (in memory) ----
+        batch_tesseract(images, pdf_path)
+        pages = []
+        for i, image in enumerate(images):
+            with span("page", page=i + 1):
+                pages.append(ocr_page(image, i, pdf_path, reader, dedup))
+
+        # ---- Group (in memory) ----
+        grouped_data = group_pages(pages, document_names)
+    azure_page_text_cache.pop(pdf_path, None)
+    azure_page_fields_cache.pop(pdf_path, None)
+    tesseract_page_text_cache.pop(pdf_path, None)
+    del images
+
+    # ---- Write page and group artifacts once ----
+    os.makedirs(output_dir, exist_ok=True)
+    write_original_copy(reader, output_dir)
+    previews = []
+    for page in pages:
+        previews.extend(write_page(page, output_dir, session_id, document_id, conn))
+    if dedup is not None:
+        write_duplicate_index(output_dir, dedup)
+    write_preview_manifest(output_dir, previews)
+    if deferred:
+        with open(os.path.join(output_dir, DEFERRED_FILENAME), "w", encoding="utf-8") as f:
+            json.dump(deferred, f, indent=2)
+        print(f" Full OCR deferred for {len(deferred)} page(s) without field extraction")
+
+    try_record(conn, "split", session_id, document_id, output_dir, file_hash, config)
+
+    group_texts = save_grouped_outputs(session_id, document_id, grouped_data, conn, grouped_base, original_pdf=pdf_path)
+    try_record(conn, "group", session_id, document_id, grouped_dir, file_hash, config)
+
+    # ---- Catalog straight from the grouped texts ----
+    if catalog:
+        with span("load_master_documents"):
+            master_docs = get_master_documents(conn)
+        for form_type, text in group_texts.items():
+            catalog_grouped_text(conn, session_id, document_id, form_type, text, master_docs)
+        try_record(conn, "catalog", session_id, document_id, None, file_hash, config)
+
+    if deferred and DEFERRED_OCR_QUEUE:
+        enqueue_deferred(pdf_path, session_id, document_id)
+
+    print(f"\n Pipeline complete: {len(pages)} pages in {len(grouped_data)} groups for session: {session_id}")
+    return {form_type: [page["name"] for page in group] for form_type, group in grouped_data.items()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Split, group and catalog a PDF in one process")
+    parser.add_argument("pdf_path")
+    parser.add_argument("session_id")
+    parser.add_argument("document_id")
+    parser.add_argument("--no-catalog", action="store_true")
+    parser.add_argument("--header-classify", action="store_true",
+                        help="Classify from header-band OCR and skip full OCR where no fields are needed")
+    parser.add_argument("--complete-deferred", action="store_true",
+                        help="Full-OCR the pages a header-classify run deferred, then exit")
+    args = parser.parse_args()
+
+    with profile_run("pipeline"):
+        conn = get_sql_server_connection()
+        if args.complete_deferred:
+            complete_deferred(args.pdf_path, args.session_id, args.document_id, conn)
+        else:
+            run_pipeline(args.pdf_path, args.session_id, args.document_id, conn,
+                         catalog=not args.no_catalog,
+                         header_classify=args.header_classify or HEADER_CLASSIFY_ENABLED)
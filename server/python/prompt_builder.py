@@ -0,0 +1,211 @@
+import os
+import re
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List
+
+# Prompt construction for the LLM classifiers.
+#
+# - The OCR text is cut down to the most discriminative lines that fit a
+#   token budget (titles and keyword lines first, early lines before late
+#   ones), then put back in page order. JSON lines (serialized fields such
+#   as layout "Table N" rows) are never sent.
+# - Instructions live in a fixed system message that is identical on every
+#   call, so the shared prefix is eligible for provider-side prompt caching;
+#   only the page excerpt varies and it always comes last.
+# - Results are memoized by a hash of the normalized text, the model
+#   deployment and the keyword list, so repeated pages (copies, re-runs of
+#   the same bundle) never reach the model twice, while a new model or
+#   document-name list starts from a fresh key. Each
+#   stage runs as its own spawned process, so labels are persisted in a
+#   local SQLite file shared by every process (WAL), with an in-process LRU
+#   in front of it. Bump CACHE_VERSION when a classifier prompt changes.
+#
+#   TF_PROMPT_CACHE_DB=<path>|off   (default <repo>/data/cache/prompt_cache.sqlite3)
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+PROMPT_CACHE_DB = os.getenv("TF_PROMPT_CACHE_DB", os.path.join(ROOT_DIR, "data", "cache", "prompt_cache.sqlite3"))
+TOKEN_BUDGET = int(os.getenv("TF_PROMPT_TOKEN_BUDGET", 600))
+CHARS_PER_TOKEN = 4            # rough average for English / OCR text
+CACHE_SIZE = 4096
+CACHE_VERSION = 1
+
+CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS labels (
+    key TEXT PRIMARY KEY,
+    label TEXT NOT NULL,
+    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+# Classifier outputs that must not be memoized
+UNCACHEABLE_RESULTS = {"openai_failure", "UNKNOWN", "unknown", ""}
+
+_WORD_RE = re.compile(r"[a-z]+")
+_DIGIT_RE = re.compile(r"\d")
+_SPACE_RE = re.compile(r"\s+")
+_JSON_LINE_RE = re.compile(r'^\s*[\[{]\s*[\[{"]')
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // CHARS_PER_TOKEN) if text else 0
+
+
+# ---------------------- Line selection ----------------------
+
+def _line_score(line: str, position: int, keywords: set) -> float:
+    letters = [c for c in line if c.isalpha()]
+    if not letters:
+        return 0.0
+    words = set(_WORD_RE.findall(line.lower()))
+    score = 1.0 / (1 + position * 0.1)                   # earlier lines matter more
+    score += 2.0 * len(words & keywords)                 # names a document type
+    if sum(c.isupper() for c in letters) / len(letters) > 0.7 and len(words) <= 8:
+        score += 1.5                                     # title-like line
+    if len(line) > 200:
+        score *= 0.5                                     # long tables / legal text
+    return score
+
+
+def select_lines(text: str, budget: int = TOKEN_BUDGET, keywords: Iterable[str] = ()) -> str:
+    """Highest-scoring distinct lines of `text` within `budget` tokens, in page order."""
+    text = "\n".join(line for line in (text or "").splitlines() if not _JSON_LINE_RE.match(line))
+    if estimate_tokens(text) <= budget:
+        return text.strip()
+
+    keyword_words = {w for k in keywords for w in _WORD_RE.findall(k.lower()) if len(w) > 2}
+    seen = set()
+    candidates = []
+    for position, raw in enumerate(text.splitlines()):
+        line = raw.strip()
+        key = line.lower()
+        if not line or key in seen:
+            continue
+        seen.add(key)
+        candidates.append((_line_score(line, position, keyword_words), position, line))
+
+    chosen, used = [], 0
+    for score, position, line in sorted(candidates, key=lambda c: (-c[0], c[1])):
+        cost = estimate_tokens(line) + 1
+        if score <= 0 or used + cost > budget:
+            continue
+        chosen.append((position, line))
+        used += cost
+    return "\n".join(line for _, line in sorted(chosen))
+
+
+def build_messages(system_prompt: str, text: str, budget: int = TOKEN_BUDGET,
+                   keywords: Iterable[str] = ()) -> List[Dict]:
+    """Stable system prefix followed by the budgeted page excerpt."""
+    excerpt = select_lines(text, budget, keywords)
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": f"---\n{excerpt}\n---"},
+    ]
+
+
+# ---------------------- Memoization ----------------------
+
+def normalize_text(text: str) -> str:
+    """Case, whitespace and digits folded so copies with new numbers share a key."""
+    return _SPACE_RE.sub(" ", _DIGIT_RE.sub("0", (text or "").lower())).strip()
+
+
+def text_key(namespace: str, text: str, model: str = None, keywords: Iterable[str] = ()) -> str:
+    """Memo key of `text` for one classifier (`namespace`), model deployment and keyword list."""
+    keyword_hash = hashlib.sha256("\n".join(sorted(set(keywords))).encode("utf-8")).hexdigest()[:16]
+    key = f"{CACHE_VERSION}\x00{namespace}\x00{model or ''}\x00{keyword_hash}\x00{normalize_text(text)}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+_local = threading.local()
+
+
+def connect(db_path: str = PROMPT_CACHE_DB) -> sqlite3.Connection:
+    """One connection per thread and path, as in search_index.py."""
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(db_path)
+    if conn is None:
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        conn.executescript(CACHE_SCHEMA)
+        connections[db_path] = conn
+    return conn
+
+
+class ClassificationCache:
+    """Thread-safe LRU of classifier results keyed by text_key(), backed by `db_path` (None: memory only)."""
+
+    def __init__(self, max_size: int = CACHE_SIZE, db_path: str = None):
+        self.max_size = max_size
+        self.db_path = db_path
+        self._items: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _remember(self, key: str, value: str):
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def _load(self, key: str):
+        if not self.db_path:
+            return None
+        try:
+            row = connect(self.db_path).execute("SELECT label FROM labels WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as e:
+            print(f"[Classifier] Cache lookup skipped: {e}")
+            return None
+        return row[0] if row else None
+
+    def get(self, key: str):
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key]
+        value = self._load(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self._remember(key, value)
+            self.hits += 1
+            return value
+
+    def put(self, key: str, value: str):
+        if value in UNCACHEABLE_RESULTS:
+            return
+        with self._lock:
+            self._remember(key, value)
+        if self.db_path:
+            try:
+                connect(self.db_path).execute("INSERT OR REPLACE INTO labels (key, label) VALUES (?, ?)", (key, value))
+            except sqlite3.Error as e:
+                print(f"[Classifier] Cache write skipped: {e}")
+
+
+classification_cache = ClassificationCache(
+    db_path=None if PROMPT_CACHE_DB.lower() in ("", "off", "none") else PROMPT_CACHE_DB)
+
+
+def memoized(namespace: str, text: str, classify: Callable[[str], str],
+             model: str = None, keywords: Iterable[str] = ()) -> str:
+    """Return the cached label for `text` or compute it with `classify(text)`."""
+    key = text_key(namespace, text, model, keywords)
+    cached = classification_cache.get(key)
+    if cached is not None:
+        print(f"[Classifier] Cache hit ({namespace}): {cached}")
+        return cached
+    result = classify(text)
+    classification_cache.put(key, result)
+    return result
@@ -0,0 +1,183 @@
+import json
+from typing import Dict, List, Optional, Sequence
+from storage_codec import decode_text
+
+# Read-side helpers for session-detail and field lookups.
+#
+# Every fetch is paginated (OFFSET/FETCH) and selects only the columns asked
+# for; BLOB/LOB columns (file_data, ocr_text, fields_json) are skipped unless
+# the caller opts in. The queries are shaped to be served by the covering
+# indexes in migrations/001_read_path_indexes.sql.
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def _rows_to_dicts(cursor) -> List[Dict]:
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def _page_params(limit: int, offset: int) -> tuple:
+    limit = max(1, min(int(limit or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+    return max(0, int(offset or 0)), limit
+
+
+def _parse_json(value, default):
+    if value is None:
+        return default
+    try:
+        return json.loads(decode_text(value))
+    except (TypeError, ValueError):
+        return default
+
+
+# ---------------------- Page-level fields ----------------------
+
+def fetch_page_fields(conn, session_id, document_id, keys: Optional[Sequence[str]] = None,
+                      form_type: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE, offset: int = 0) -> List[Dict]:
+    """Key/value rows from TF_fields_KeyValuePair for one document."""
+    where = ["session_id = ?", "document_id = ?"]
+    params: list = [str(session_id), str(document_id)]
+    if form_type:
+        where.append("form_type = ?")
+        params.append(form_type)
+    if keys:
+        where.append(f"field_key IN ({','.join('?' for _ in keys)})")
+        params.extend(keys)
+
+    query = f"""
+        SELECT form_type, field_key, field_value, extracted_at
+        FROM TF_fields_KeyValuePair
+        WHERE {' AND '.join(where)}
+        ORDER BY extracted_at DESC, form_type, field_key
+        OFFSET ? ROWS FETCH NEXT ? ROWS ONLY
+    """
+    cursor = conn.cursor()
+    cursor.execute(query, (*params, *_page_params(limit, offset)))
+    return _rows_to_dicts(cursor)
+
+
+def fetch_cleaned_pages(conn, session_id, document_id, include_text: bool = False, include_pdf: bool = False,
+                        limit: int = DEFAULT_PAGE_SIZE, offset: int = 0) -> List[Dict]:
+    """
+    Per-page rows for a document. Lean replacement for
+    db_utils.get_cleaned_split_data: no PDF blob or OCR text unless asked.
+    """
+    columns = ["ocr.id", "ocr.form_type", "ocr.created_at"]
+    joins = ""
+    if include_text:
+        columns.append("ocr.ocr_text")
+    if include_pdf:
+        columns.append("pdf.file_data AS pdf_data")
+        joins = """
+        LEFT JOIN TF_ingestion_CleanedPDF AS pdf
+            ON pdf.session_id = ocr.session_id AND pdf.document_id = ocr.document_id AND pdf.form_type = ocr.form_type
+        """
+
+    query = f"""
+        SELECT {', '.join(columns)}
+        FROM TF_ingestion_CleanedOCR AS ocr
+        {joins}
+        WHERE ocr.session_id = ? AND ocr.document_id = ?
+        ORDER BY ocr.form_type
+        OFFSET ? ROWS FETCH NEXT ? ROWS ONLY
+    """
+    cursor = conn.cursor()
+    cursor.execute(query, (str(session_id), str(document_id), *_page_params(limit, offset)))
+    rows = _rows_to_dicts(cursor)
+    if include_text:
+        for row in rows:
+            row["ocr_text"] = decode_text(row["ocr_text"])
+    return rows
+
+
+# ---------------------- Grouped artifacts ----------------------
+
+def fetch_grouped_forms(conn, document_id, include_text: bool = False,
+                        limit: int = DEFAULT_PAGE_SIZE, offset: int = 0) -> List[Dict]:
+    """Grouped forms (id, form_type) for a document from TF_ingestion_mGroupsOCR."""
+    columns = ["id", "session_id", "form_type", "created_at"]
+    if include_text:
+        columns.append("ocr_text")
+    query = f"""
+        SELECT {', '.join(columns)}
+        FROM TF_ingestion_mGroupsOCR
+        WHERE document_id = ?
+        ORDER BY form_type, id
+        OFFSET ? ROWS FETCH NEXT ? ROWS ONLY
+    """
+    cursor = conn.cursor()
+    cursor.execute(query, (str(document_id), *_page_params(limit, offset)))
+    rows = _rows_to_dicts(cursor)
+    if include_text:
+        for row in rows:
+            row["ocr_text"] = decode_text(row["ocr_text"])
+    return rows
+
+
+def fetch_grouped_fields(conn, session_id, document_id, form_type: Optional[str] = None,
+                         parse: bool = True, limit: int = DEFAULT_PAGE_SIZE, offset: int = 0) -> List[Dict]:
+    """Grouped field payloads; fields_json is decoded only when `parse` is set."""
+    where = ["session_id = ?", "document_id = ?"]
+    params: list = [str(session_id), str(document_id)]
+    if form_type:
+        where.append("form_type = ?")
+        params.append(form_type)
+
+    query = f"""
+        SELECT id, form_type, fields_json, created_at
+        FROM TF_ingestion_mGroupsFields
+        WHERE {' AND '.join(where)}
+        ORDER BY created_at, id
+        OFFSET ? ROWS FETCH NEXT ? ROWS ONLY
+    """
+    cursor = conn.cursor()
+    cursor.execute(query, (*params, *_page_params(limit, offset)))
+    rows = _rows_to_dicts(cursor)
+    if parse:
+        for row in rows:
+            row["fields_json"] = _parse_json(row["fields_json"], [])
+    return rows
+
+
+def fetch_grouped_pdf(conn, form_id) -> Optional[bytes]:
+    """The merged PDF blob for one grouped form, fetched on demand."""
+    cursor = conn.cursor()
+    cursor.execute("SELECT file_data FROM TF_ingestion_mGroupsPDF WHERE id = ?", (form_id,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def fetch_catalog(conn, session_id, document_id, limit: int = DEFAULT_PAGE_SIZE, offset: int = 0) -> List[Dict]:
+    query = """
+        SELECT id, grouped_form_type, matched_document_name, matched_document_id,
+               confidence_score, cataloged_at
+        FROM TF_mdocs_mgroups
+        WHERE session_id = ? AND document_id = ?
+        ORDER BY cataloged_at DESC, id
+        OFFSET ? ROWS FETCH NEXT ? ROWS ONLY
+    """
+    cursor = conn.cursor()
+    cursor.execute(query, (str(session_id), str(document_id), *_page_params(limit, offset)))
+    return _rows_to_dicts(cursor)
+
+
+# ---------------------- Session summary ----------------------
+
+def fetch_session_summary(conn, session_id) -> List[Dict]:
+    """Per-document page, group and field counts for a session (no LOBs read)."""
+    query = """
+        SELECT d.document_id,
+               (SELECT COUNT(*) FROM TF_ingestion_CleanedOCR o
+                 WHERE o.session_id = d.session_id AND o.document_id = d.document_id) AS page_count,
+               (SELECT COUNT(*) FROM TF_ingestion_mGroupsOCR g
+                 WHERE g.session_id = d.session_id AND g.document_id = d.document_id) AS group_count,
+               (SELECT COUNT(*) FROM TF_fields_KeyValuePair f
+                 WHERE f.session_id = d.session_id AND f.document_id = d.document_id) AS field_count
+        FROM (SELECT DISTINCT session_id, document_id FROM TF_ingestion_CleanedOCR WHERE session_id = ?) AS d
+        ORDER BY d.document_id
+    """
+    cursor = conn.cursor()
+    cursor.execute(query, (str(session_id),))
+    return _rows_to_dicts(cursor)
@@ -0,0 +1,270 @@
+import os
+import re
+import sqlite3
+import argparse
+import threading
+from typing import Dict, List, Optional
+from storage_codec import decode_text
+
+# Full-text search over OCR text.
+#
+# Looking up which page of which session mentions an LC number or vessel
+# otherwise means LIKE scans over TF_ingestion_CleanedOCR / mGroupsOCR or
+# grepping outputs/. db_utils.save_cleaned_text_to_db (kind "page") and
+# save_grouped_text_to_db (kind "group") feed every write into an SQLite
+# FTS5 index keyed by (session_id, document_id, kind, name); re-saving the
+# same page replaces its entry. search() returns BM25-ranked hits with
+# highlighted snippets.
+#
+# With TF_SEARCH_BACKEND=sqlserver the index is SQL Server full-text
+# (migrations/005) over the OCR tables themselves, maintained by the
+# server; writes here are then no-ops and search() queries CONTAINSTABLE.
+# db_utils then stores ocr_text uncompressed even with TF_STORAGE_CODEC=zlib
+# (storage_codec.encode_ocr_text), so the server can index it.
+#
+#   TF_SEARCH_BACKEND=sqlite|sqlserver|off   (default sqlite)
+#   TF_SEARCH_DB=<path>                      (default <repo>/search_index.sqlite3)
+#
+#   python search_index.py "LC/2024/0815" [--session <id>] [--kind page|group]
+#   python search_index.py --rebuild          # backfill from SQL Server
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+SEARCH_BACKEND = os.getenv("TF_SEARCH_BACKEND", "sqlite").lower()
+SEARCH_DB_PATH = os.getenv("TF_SEARCH_DB", os.path.join(ROOT_DIR, "search_index.sqlite3"))
+SNIPPET_TOKENS = 12
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    document_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL,
+    form_type TEXT,
+    UNIQUE (session_id, document_id, kind, name)
+);
+CREATE INDEX IF NOT EXISTS IX_entries_form_type ON entries (session_id, document_id, form_type);
+CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+    text,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '3'
+);
+"""
+
+_local = threading.local()
+_TERM_RE = re.compile(r"\w+(?:\*)?", re.UNICODE)
+
+
+def connect(db_path: str = SEARCH_DB_PATH) -> sqlite3.Connection:
+    """One connection per thread and path (batch_ingest runs documents in threads)."""
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(db_path)
+    if conn is None:
+        conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        conn.executescript(SCHEMA)
+        connections[db_path] = conn
+    return conn
+
+
+# ---------------------- Indexing ----------------------
+
+def _upsert(conn: sqlite3.Connection, key: tuple, form_type: Optional[str], text: str):
+    row = conn.execute("SELECT id FROM entries WHERE session_id = ? AND document_id = ? AND kind = ? AND name = ?",
+                       key).fetchone()
+    if row is None:
+        entry_id = conn.execute("INSERT INTO entries (session_id, document_id, kind, name, form_type) "
+                                "VALUES (?, ?, ?, ?, ?)", key + (form_type,)).lastrowid
+    else:
+        entry_id = row["id"]
+        conn.execute("UPDATE entries SET form_type = COALESCE(?, form_type) WHERE id = ?", (form_type, entry_id))
+        conn.execute("DELETE FROM entries_fts WHERE rowid = ?", (entry_id,))
+    conn.execute("INSERT INTO entries_fts (rowid, text) VALUES (?, ?)", (entry_id, text or ""))
+
+
+def index_text(session_id, document_id, kind: str, name: str, text: str, form_type: str = None,
+               db_path: str = SEARCH_DB_PATH):
+    """Add or replace the entry for one page ("page", Page_NN) or group ("group", form type)."""
+    if SEARCH_BACKEND != "sqlite":
+        return
+    conn = connect(db_path)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        _upsert(conn, (str(session_id), str(document_id), kind, name), form_type, text)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def copy_document(source_session_id, source_document_id, session_id, document_id, kind: str,
+                  db_path: str = SEARCH_DB_PATH) -> int:
+    """Duplicate a document's `kind` entries under another session/document (artifact_reuse clones)."""
+    if SEARCH_BACKEND != "sqlite":
+        return 0
+    conn = connect(db_path)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        rows = conn.execute("SELECT e.name, e.form_type, f.text FROM entries e JOIN entries_fts f ON f.rowid = e.id "
+                            "WHERE e.session_id = ? AND e.document_id = ? AND e.kind = ?",
+                            (str(source_session_id), str(source_document_id), kind)).fetchall()
+        for row in rows:
+            _upsert(conn, (str(session_id), str(document_id), kind, row["name"]), row["form_type"], row["text"])
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return len(rows)
+
+
+def relabel_pages(session_id, document_id, page_names: List[str], form_type: str, db_path: str = SEARCH_DB_PATH):
+    """Tag page entries with the grouped form type once group_by_form has classified them."""
+    if SEARCH_BACKEND != "sqlite" or not page_names:
+        return
+    conn = connect(db_path)
+    placeholders = ", ".join("?" for _ in page_names)
+    conn.execute(f"UPDATE entries SET form_type = ? WHERE session_id = ? AND document_id = ? AND kind = 'page' "
+                 f"AND name IN ({placeholders})", [form_type, str(session_id), str(document_id)] + list(page_names))
+
+
+def delete_session(session_id, db_path: str = SEARCH_DB_PATH):
+    if SEARCH_BACKEND != "sqlite":
+        return
+    conn = connect(db_path)
+    conn.execute("BEGIN IMMEDIATE")
+    conn.execute("DELETE FROM entries_fts WHERE rowid IN (SELECT id FROM entries WHERE session_id = ?)",
+                 (str(session_id),))
+    conn.execute("DELETE FROM entries WHERE session_id = ?", (str(session_id),))
+    conn.execute("COMMIT")
+
+
+# ---------------------- Querying ----------------------
+
+def to_match_query(query: str) -> str:
+    """
+    Free text -> FTS5 MATCH expression. Each whitespace-separated term
+    becomes a quoted phrase of its tokens ("LC/2024/0815" -> "LC 2024 0815"),
+    terms are ANDed, and a trailing * keeps prefix search.
+    """
+    parts = []
+    for term in query.split():
+        tokens = _TERM_RE.findall(term)
+        if not tokens:
+            continue
+        prefix = tokens[-1].endswith("*")
+        words = [t.rstrip("*") for t in tokens]
+        parts.append('"' + " ".join(words) + '"' + ("*" if prefix else ""))
+    return " AND ".join(parts)
+
+
+def search(query: str, session_id=None, document_id=None, kind: str = None, limit: int = 20,
+           conn=None, db_path: str = SEARCH_DB_PATH) -> List[Dict]:
+    """
+    Ranked hits: [{session_id, document_id, kind, name, form_type, score,
+    snippet}]. `conn` is the SQL Server connection for the sqlserver backend.
+    """
+    if SEARCH_BACKEND == "sqlserver":
+        return search_sql_server(conn, query, session_id, document_id, kind, limit)
+    if SEARCH_BACKEND != "sqlite":
+        return []
+    match = to_match_query(query)
+    if not match:
+        return []
+    filters, params = ["entries_fts MATCH ?"], [match]
+    for column, value in (("session_id", session_id), ("document_id", document_id), ("kind", kind)):
+        if value is not None:
+            filters.append(f"e.{column} = ?")
+            params.append(str(value))
+    rows = connect(db_path).execute(f"""
+        SELECT e.session_id, e.document_id, e.kind, e.name, e.form_type,
+               bm25(entries_fts) AS score,
+               snippet(entries_fts, 0, '[', ']', '...', {SNIPPET_TOKENS}) AS snippet
+        FROM entries_fts JOIN entries e ON e.id = entries_fts.rowid
+        WHERE {" AND ".join(filters)}
+        ORDER BY score
+        LIMIT ?
+    """, params + [limit]).fetchall()
+    return [dict(row, score=round(-row["score"], 6)) for row in rows]
+
+
+def search_sql_server(conn, query: str, session_id=None, document_id=None, kind: str = None,
+                      limit: int = 20) -> List[Dict]:
+    """CONTAINSTABLE over the OCR tables (requires migrations/005 and Full-Text Search)."""
+    terms = [" ".join(_TERM_RE.findall(term)).replace("*", "") for term in query.split()]
+    condition = " AND ".join(f'"{term}"' for term in terms if term)
+    if not condition or conn is None:
+        return []
+    tables = [("page", "TF_ingestion_CleanedOCR"), ("group", "TF_ingestion_mGroupsOCR")]
+    hits = []
+    cursor = conn.cursor()
+    for table_kind, table in tables:
+        if kind and kind != table_kind:
+            continue
+        filters, params = [], [limit, condition]
+        for column, value in (("session_id", session_id), ("document_id", document_id)):
+            if value is not None:
+                filters.append(f"AND t.{column} = ?")
+                params.append(str(value))
+        cursor.execute(f"""
+            SELECT TOP (?) t.session_id, t.document_id, t.form_type, ft.RANK, SUBSTRING(t.ocr_text, 1, 200)
+            FROM CONTAINSTABLE({table}, ocr_text, ?) ft
+            JOIN {table} t ON t.id = ft.[KEY]
+            WHERE 1 = 1 {" ".join(filters)}
+            ORDER BY ft.RANK DESC
+        """, params)
+        for session, document, form_type, rank, excerpt in cursor.fetchall():
+            hits.append({
+                "session_id": session, "document_id": document, "kind": table_kind,
+                "name": form_type, "form_type": None if table_kind == "page" else form_type,
+                "score": float(rank), "snippet": excerpt,
+            })
+    return sorted(hits, key=lambda h: -h["score"])[:limit]
+
+
+# ---------------------- Backfill ----------------------
+
+def rebuild_from_sql_server(conn, session_id=None, db_path: str = SEARCH_DB_PATH) -> int:
+    """Index existing CleanedOCR / mGroupsOCR rows (latest row per page or group wins)."""
+    cursor = conn.cursor()
+    count = 0
+    for kind, table in (("page", "TF_ingestion_CleanedOCR"), ("group", "TF_ingestion_mGroupsOCR")):
+        query = f"SELECT session_id, document_id, form_type, ocr_text FROM {table}"
+        params = []
+        if session_id is not None:
+            query += " WHERE session_id = ?"
+            params.append(str(session_id))
+        cursor.execute(query + " ORDER BY created_at", params)
+        for session, document, name, text in cursor.fetchall():
+            text = decode_text(text)
+            index_text(session, document, kind, name, text, None if kind == "page" else name, db_path)
+            count += 1
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Search OCR text across sessions")
+    parser.add_argument("query", nargs="?")
+    parser.add_argument("--session")
+    parser.add_argument("--document")
+    parser.add_argument("--kind", choices=["page", "group"])
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--rebuild", action="store_true", help="Backfill the index from SQL Server")
+    args = parser.parse_args()
+
+    conn = None
+    if args.rebuild or SEARCH_BACKEND == "sqlserver":
+        from db_utils import get_sql_server_connection
+        conn = get_sql_server_connection()
+    if args.rebuild:
+        print(f"Indexed {rebuild_from_sql_server(conn, args.session)} entries")
+    if args.query:
+        for hit in search(args.query, args.session, args.document, args.kind, args.limit, conn=conn):
+            label = hit["form_type"] or ""
+            print(f"{hit['score']:>8}  {hit['session_id']}  {hit['document_id']}  {hit['kind']}:{hit['name']}  "
+                  f"{label}\n          {hit['snippet']}")
+    if conn is not None:
+        conn.close()
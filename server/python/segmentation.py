@@ -0,0 +1,135 @@
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+from rapidfuzz import fuzz, process
+
+# Multi-page document boundary detection.
+#
+# group_by_form used to classify every page on its own, so continuation
+# pages (invoice page 2 with no title block) landed in "unclassified".
+# Here pages are first cut into runs with a cheap continuation detector and
+# only the first page of each run is sent to the classifier; the label is
+# then propagated to the rest of the run. Signals, strongest first:
+#   1. page numbering ("Page 2 of 3", "2/3") continuing the previous page
+#   2. a title in the header band that names a known document -> new run
+#   3. repeated letterhead / header lines
+#   4. similar text layout (line count, line length, numeric density)
+
+SEGMENTATION_ENABLED = os.getenv("TF_SEGMENTATION", "true").lower() not in ("0", "false", "no")
+HEADER_LINES = 6
+TITLE_MATCH_THRESHOLD = 90     # rapidfuzz partial_ratio against document names
+HEADER_SIMILARITY = 80         # token_set_ratio between consecutive headers
+LAYOUT_SIMILARITY = 0.85
+
+_PAGE_OF_RE = re.compile(r"\bpage\s*(\d{1,3})\s*(?:of|/)\s*(\d{1,3})\b", re.IGNORECASE)
+_PAGE_RE = re.compile(r"\bpage\s*(?:no\.?\s*)?(\d{1,3})\b", re.IGNORECASE)
+_FRACTION_RE = re.compile(r"^\s*(\d{1,3})\s*/\s*(\d{1,3})\s*$")
+_NUMERIC_LINE_RE = re.compile(r"^[\d\s.,:/$€£%()-]+$")
+
+
+# ---------------------- Features ----------------------
+
+def page_numbering(lines: List[str]) -> Tuple[Optional[int], Optional[int]]:
+    """(page, total) from "Page 2 of 3" / "2/3" footers, else (page, None) or (None, None)."""
+    for line in lines:
+        match = _PAGE_OF_RE.search(line)
+        if match:
+            return int(match.group(1)), int(match.group(2))
+    for line in lines[:3] + lines[-3:]:
+        match = _FRACTION_RE.match(line)
+        if match and 0 < int(match.group(1)) <= int(match.group(2)):
+            return int(match.group(1)), int(match.group(2))
+    for line in lines:
+        match = _PAGE_RE.search(line)
+        if match:
+            return int(match.group(1)), None
+    return None, None
+
+
+def page_features(text: str) -> Dict:
+    lines = [line.strip() for line in (text or "").splitlines() if line.strip()]
+    page, total = page_numbering(lines)
+    lengths = [len(line) for line in lines]
+    return {
+        "empty": not lines,
+        "header": " ".join(lines[:HEADER_LINES]).lower(),
+        "page": page,
+        "total": total,
+        "line_count": len(lines),
+        "avg_line_length": sum(lengths) / len(lengths) if lengths else 0.0,
+        "numeric_ratio": sum(1 for line in lines if _NUMERIC_LINE_RE.match(line)) / len(lines) if lines else 0.0,
+    }
+
+
+def _ratio(a: float, b: float) -> float:
+    if a == b:
+        return 1.0
+    return min(a, b) / max(a, b) if max(a, b) else 1.0
+
+
+def layout_similarity(a: Dict, b: Dict) -> float:
+    return (
+        _ratio(a["line_count"], b["line_count"])
+        + _ratio(a["avg_line_length"], b["avg_line_length"])
+        + (1.0 - abs(a["numeric_ratio"] - b["numeric_ratio"]))
+    ) / 3
+
+
+def header_title(features: Dict, document_names: List[str]) -> Optional[str]:
+    """A known document name appearing in the header band, if any."""
+    if not document_names or not features["header"]:
+        return None
+    match = process.extractOne(features["header"], document_names, scorer=fuzz.partial_ratio,
+                               processor=str.lower, score_cutoff=TITLE_MATCH_THRESHOLD)
+    return match[0] if match else None
+
+
+# ---------------------- Continuation detector ----------------------
+
+def is_continuation(prev: Dict, current: Dict) -> Tuple[bool, str]:
+    """Decide whether `current` continues the document that `prev` belongs to."""
+    if current["page"] is not None:
+        if current["page"] == 1:
+            return False, "page_one"
+        if prev["page"] is not None and current["page"] == prev["page"] + 1 \
+                and (current["total"] is None or current["total"] == prev["total"]):
+            return True, "page_number"
+
+    if current["empty"]:
+        return True, "blank"
+
+    title = current.get("title")
+    if title and title != prev.get("title"):
+        return False, "title"
+
+    if prev["header"] and fuzz.token_set_ratio(prev["header"], current["header"]) >= HEADER_SIMILARITY:
+        return True, "header"
+
+    if not title and not prev["empty"] and layout_similarity(prev, current) >= LAYOUT_SIMILARITY:
+        return True, "layout"
+
+    return False, "new"
+
+
+def segment_pages(pages: List[Dict], document_names: List[str]) -> List[List[int]]:
+    """Cut pages (dicts with "text") into runs of indexes, one run per document."""
+    runs: List[List[int]] = []
+    prev = None
+    for index, page in enumerate(pages):
+        features = page_features(page.get("text"))
+        features["title"] = header_title(features, document_names)
+        continues, reason = is_continuation(prev, features) if prev else (False, "first")
+        # Copies of an earlier page always start a new run
+        if page.get("duplicate_of"):
+            continues, reason = False, "duplicate"
+        if continues:
+            runs[-1].append(index)
+            # Carry the run's title forward so a repeated title is not a new run
+            features["title"] = features["title"] or prev.get("title")
+        else:
+            runs.append([index])
+        page["segment_reason"] = reason
+        # Blank backs do not reset the features later pages are compared to
+        if not (continues and features["empty"]):
+            prev = features
+    return runs
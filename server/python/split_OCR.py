@@ -1,50 +1,51 @@
 import sys
 import io
-sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
-sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
+sys.stdout.reconfigure(encoding='utf-8')
+sys.stderr.reconfigure(encoding='utf-8')
 import os
 import io
 import re
 import json
-import pyodbc
 import argparse
 from PyPDF2 import PdfReader, PdfWriter
 from collections import defaultdict
 from pdf2image import convert_from_path
-from pytesseract import image_to_string
+from ocr_backend import batch_enabled, best_rotation_batch, image_to_string
+from preprocess import preprocess
 from PIL import Image
 from typing import List, Dict
 from datetime import datetime
 from pathlib import Path
 from dotenv import load_dotenv
 from extract_fields import extract_fields
+from layout_fields import analyze_layout, merge_fields, page_fields
+from line_items import extract_line_items
 from db_utils import (
     save_cleaned_text_to_db,
     save_cleaned_pdf_to_db,
     save_extracted_fields_to_db,
+    save_line_items_to_db,
+    save_page_previews_to_db,
     get_sql_server_connection
     )
+from instrumentation import span, profile_run
+from page_dedup import DEDUP_ENABLED, DUPLICATES_FILENAME, PageDeduplicator, dhash
+from page_previews import render_previews, write_previews, write_preview_manifest
+from artifact_reuse import REUSE_ENABLED, SPLIT_TABLES, engine_config, file_sha256, try_record, try_reuse
 
-# Azure OCR & OpenAI
-from azure.ai.documentintelligence import DocumentIntelligenceClient
-from azure.core.credentials import AzureKeyCredential
-from openai import AzureOpenAI
+# Azure OCR & OpenAI clients are built on first use (azure_clients.py)
+from azure_clients import openai_client
 
 # Load credentials from .env
 load_dotenv()
-key_doc = os.getenv("AZURE_DOC_KEY")
-endpoint_doc = os.getenv("AZURE_DOC_ENDPOINT")
-credential_doc = AzureKeyCredential(key_doc)
-client_doc = DocumentIntelligenceClient(endpoint_doc, credential_doc)
 
-client_openai = AzureOpenAI(
-    api_key=os.getenv("AZURE_OPENAI_KEY"),
-    api_version="2024-12-01-preview",
-    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-)
-
-# Cache for Azure OCR page texts
-azure_page_text_cache = []
+# Cache for Azure OCR page texts, keyed by PDF path so one process can
+# split several documents (see batch_ingest.py)
+azure_page_text_cache = {}
+# Fields mapped from the same layout result (layout_fields.page_fields)
+azure_page_fields_cache = {}
+# Tesseract text per page index from one batch run (ocr_backend.best_rotation_batch)
+tesseract_page_text_cache = {}
 
 def sanitize_form_name(name: str) -> str:
     name = name.upper().strip()
@@ -64,6 +65,7 @@ def classify_form_type(text: str, fallback_name: str) -> str:
 def extract_text_from_image_with_rotation(image: Image.Image) -> str:
     max_text = ""
     max_len = 0
+    image = preprocess(image)  # deskewed, binarized, cropped grayscale
     for angle in [0, 90, 180, 270]:
         rotated = image.rotate(angle, expand=True)
         gray = rotated.convert("L")  # Grayscale improves OCR accuracy
@@ -73,18 +75,32 @@ def extract_text_from_image_with_rotation(image: Image.Image) -> str:
             max_len = len(text)
     return max_text
 
+
+def batch_tesseract(images: List[Image.Image], pdf_path: str, indices: List[int] = None):
+    """Rotation-search OCR of the given pages in one tesseract process, cached for ocr_page()."""
+    if not batch_enabled():
+        return
+    indices = list(range(len(images))) if indices is None else list(indices)
+    if not indices:
+        return
+    with span("tesseract_batch", pages=len(indices)):
+        results = best_rotation_batch(preprocess(images[i]) for i in indices)
+    if results is not None:
+        tesseract_page_text_cache[pdf_path] = {i: r["text"] for i, r in zip(indices, results)}
+
+
 def extract_text_azure_document(pdf_path):
-    global azure_page_text_cache
-    if azure_page_text_cache:
-        return azure_page_text_cache
-    with open(pdf_path, "rb") as f:
-        poller = client_doc.begin_analyze_document("prebuilt-layout", f)
-    result = poller.result()
+    if pdf_path in azure_page_text_cache:
+        return azure_page_text_cache[pdf_path]
+    result = analyze_layout(pdf_path)
+    page_texts = []
     for page in result.pages:
         lines = [line.content for line in page.lines]
         page_text = "\n".join(lines)
-        azure_page_text_cache.append(page_text)
-    return azure_page_text_cache
+        page_texts.append(page_text)
+    azure_page_text_cache[pdf_path] = page_texts
+    azure_page_fields_cache[pdf_path] = page_fields(result)
+    return page_texts
 
 import base64
 from io import BytesIO
@@ -100,7 +116,7 @@ def refine_text_with_azure_openai_image(image: Image.Image) -> str:
         image_data = f"data:image/jpeg;base64,{base64_image}"
         deployment = os.getenv("AZURE_DEPLOYMENT_NAME", "gpt-4o")
 
-        response = client_openai.chat.completions.create(
+        response = openai_client().chat.completions.create(
             model=deployment,
             messages=[
                 {
@@ -128,19 +144,27 @@ def refine_text_with_azure_openai_image(image: Image.Image) -> str:
         return None
 
 def extract_text_multi_ocr(image: Image.Image, pdf_path: str, page_index: int) -> Dict[str, str]:
-    tesseract_text = extract_text_from_image_with_rotation(image)
+    page_number = page_index + 1
+    batched = tesseract_page_text_cache.get(pdf_path, {})
+    if page_index in batched:
+        tesseract_text = batched[page_index]
+    else:
+        with span("tesseract", page=page_number):
+            tesseract_text = extract_text_from_image_with_rotation(image)
     azure_doc_text = ""
 
     # Azure OCR
     try:
-        azure_texts = extract_text_azure_document(pdf_path)
+        with span("azure_doc_intelligence", page=page_number):
+            azure_texts = extract_text_azure_document(pdf_path)
         azure_doc_text = azure_texts[page_index] if page_index < len(azure_texts) else ""
     except Exception as e:
         print(f"Azure OCR error: {e}")
 
     # OpenAI Clean-up (may fail)
     try:
-        openai_cleaned = refine_text_with_azure_openai_image(image)
+        with span("azure_openai", page=page_number):
+            openai_cleaned = refine_text_with_azure_openai_image(image)
     except Exception as e:
         print(f" OpenAI cleaning failed: {e}")
         openai_cleaned = azure_doc_text or tesseract_text  # fallback
@@ -151,72 +175,184 @@ def extract_text_multi_ocr(image: Image.Image, pdf_path: str, page_index: int) -
         "azure_openai": openai_cleaned
     }
 
-def split_pdf_by_form_type(pdf_path: str, session_id: str, document_id: str, conn, output_base: str = "./outputs", ocr_method: str = "tesseract"):
-    original_filename = os.path.basename(pdf_path)
-    base_name = os.path.splitext(original_filename)[0]
-    output_dir = os.path.join(output_base, session_id, f"{base_name}-{document_id}")
-    os.makedirs(output_dir, exist_ok=True)
+def output_dir_for(pdf_path: str, session_id: str, document_id: str, output_base: str = "./outputs") -> str:
+    base_name = os.path.splitext(os.path.basename(pdf_path))[0]
+    return os.path.join(output_base, session_id, f"{base_name}-{document_id}")
+
 
+def write_original_copy(reader: PdfReader, output_dir: str):
     original_copy_path = os.path.join(output_dir, "original.pdf")
     with open(original_copy_path, "wb") as f_out:
-        reader = PdfReader(pdf_path)
         writer = PdfWriter()
         for page in reader.pages:
             writer.add_page(page)
         writer.write(f_out)
 
+
+def split_pdf_by_form_type(pdf_path: str, session_id: str, document_id: str, conn, output_base: str = "./outputs", ocr_method: str = "tesseract"):
+    output_dir = output_dir_for(pdf_path, session_id, document_id, output_base)
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Same bytes already split with the same settings in another session?
+    file_hash = file_sha256(pdf_path) if REUSE_ENABLED else None
+    config = engine_config("split_OCR", ocr_method) if REUSE_ENABLED else None
+    if try_reuse(conn, "split", SPLIT_TABLES, session_id, document_id, output_dir, file_hash, config):
+        return
+
+    reader = PdfReader(pdf_path)
+    write_original_copy(reader, output_dir)
+
     print(f" Converting all PDF pages to images...")
-    images = convert_from_path(pdf_path)
+    with span("rasterize"):
+        images = convert_from_path(pdf_path)
 
+    batch_tesseract(images, pdf_path)
+    dedup = PageDeduplicator() if DEDUP_ENABLED else None
+    previews = []
     for i, image in enumerate(images):
         page_number = i + 1
-        padded_page = f"{page_number:02}"
-        print(f"\n Processing Page {page_number}...")
+        with span("page", page=page_number):
+            previews.extend(process_page(image, i, pdf_path, session_id, document_id, conn, output_dir, reader, dedup))
+
+    if dedup is not None:
+        write_duplicate_index(output_dir, dedup)
+    write_preview_manifest(output_dir, previews)
+    azure_page_text_cache.pop(pdf_path, None)
+    azure_page_fields_cache.pop(pdf_path, None)
+    tesseract_page_text_cache.pop(pdf_path, None)
+    try_record(conn, "split", session_id, document_id, output_dir, file_hash, config)
+    print(f"\n Done splitting and saving all {len(images)} pages for session: {session_id}")
 
-        pdf_path_out = os.path.join(output_dir, f"Page_{padded_page}.pdf")
-        txt_path_out = os.path.join(output_dir, f"Page_{padded_page}.txt")
-        json_path_out = os.path.join(output_dir, f"Page_{padded_page}.fields.json")
 
-        os.makedirs(os.path.dirname(pdf_path_out), exist_ok=True)
+def quick_ocr(image: Image.Image) -> str:
+    """Single upright Tesseract pass used to confirm near-duplicate pages."""
+    return image_to_string(preprocess(image)).strip()
 
-        reader = PdfReader(pdf_path)
+
+def write_duplicate_index(output_dir: str, dedup: PageDeduplicator):
+    if dedup.cross_references:
+        with open(os.path.join(output_dir, DUPLICATES_FILENAME), "w", encoding="utf-8") as f:
+            json.dump(dedup.cross_references, f, indent=2, ensure_ascii=False)
+
+
+def single_page_pdf(reader: PdfReader, i: int) -> bytes:
+    with span("split_pdf", page=i + 1):
         writer = PdfWriter()
         writer.add_page(reader.pages[i])
-        with open(pdf_path_out, "wb") as f_pdf:
-            writer.write(f_pdf)
+        pdf_buffer = io.BytesIO()
+        writer.write(pdf_buffer)
+    return pdf_buffer.getvalue()
+
+
+def page_text(image: Image.Image, pdf_path: str, i: int) -> str:
+    """Full-page OCR text of page `i`, preferring the OpenAI clean-up."""
+    texts = extract_text_multi_ocr(image, pdf_path, i)
+
+    # Always prefer OpenAI, but fallback safely
+    final_text = texts.get("azure_openai")
+    if not final_text or "[filtered" in final_text.lower() or len(final_text.strip()) < 10:
+        print(f"OpenAI blocked or failed — using fallback OCR for Page {i+1}")
+        final_text = texts.get("azure_doc_intelligence") or texts.get("tesseract")
+
+    if not final_text.strip():
+        final_text = "[NO TEXT FOUND]"
+    return final_text
+
+
+def ocr_page(image: Image.Image, i: int, pdf_path: str, reader: PdfReader = None, dedup: PageDeduplicator = None) -> Dict:
+    """OCR one rasterized page and extract its fields without writing anything."""
+    page_number = i + 1
+    print(f"\n Processing Page {page_number}...")
+
+    pdf_bytes = single_page_pdf(reader or PdfReader(pdf_path), i)
+    with span("previews", page=page_number):
+        previews = render_previews(image)
+
+    # Copies of an earlier page (ORIGINAL / DUPLICATE stamps) reuse its OCR
+    if dedup is not None:
+        with span("dedup", page=page_number):
+            image_hash = dhash(image)
+            duplicate = dedup.match(image, image_hash, quick_ocr)
+        if duplicate is not None:
+            print(f" Page {page_number} is a copy of {duplicate['duplicate_of']} (hash distance "
+                  f"{duplicate['hash_distance']}, text similarity {duplicate['text_similarity']}) — reusing its OCR")
+            page = dict(duplicate, name=f"Page_{page_number:02}", page_number=page_number,
+                        pdf_bytes=pdf_bytes, previews=previews)
+            dedup.record(page)
+            return page
+
+    final_text = page_text(image, pdf_path, i)
+
+    with span("extract_fields", page=page_number):
+        # Key-value pairs, tables and checkboxes from Document Intelligence, when it ran
+        layout = azure_page_fields_cache.get(pdf_path, [])
+        page_layout = layout[i] if i < len(layout) else {}
+        if final_text.strip() == "[NO TEXT FOUND]" or len(final_text.strip()) < 10:
+            fields = dict(page_layout)
+            print(" Skipping field extraction due to empty/invalid text.")
+        else:
+            fields = merge_fields(page_layout, extract_fields(final_text.strip()))
+
+    with span("line_items", page=page_number):
+        line_items = extract_line_items(fields, final_text, image)
+
+    page = {
+        "name": f"Page_{page_number:02}",
+        "page_number": page_number,
+        "text": final_text,
+        "fields": fields,
+        "line_items": line_items,
+        "pdf_bytes": pdf_bytes,
+        "previews": previews,
+    }
+    if dedup is not None:
+        dedup.register(image_hash, page, image)
+    return page
 
-        texts = extract_text_multi_ocr(image, pdf_path, i)
 
-# Always prefer OpenAI, but fallback safely
-        final_text = texts.get("azure_openai")
-        if not final_text or "[filtered" in final_text.lower() or len(final_text.strip()) < 10:
-            print(f"OpenAI blocked or failed — using fallback OCR for Page {i+1}")
-            final_text = texts.get("azure_doc_intelligence") or texts.get("tesseract")
+def write_page(page: Dict, output_dir: str, session_id: str, document_id: str, conn) -> List[Dict]:
+    """
+    Persist a page from ocr_page() as Page_NN.pdf/.txt/.fields.json (plus
+    thumbnail/preview images) and DB rows; returns the preview entries.
+    """
+    name = page["name"]
+    pdf_path_out = os.path.join(output_dir, f"{name}.pdf")
+    txt_path_out = os.path.join(output_dir, f"{name}.txt")
+    json_path_out = os.path.join(output_dir, f"{name}.fields.json")
 
-        if not final_text.strip():
-            final_text = "[NO TEXT FOUND]"
-            
-            
+    os.makedirs(output_dir, exist_ok=True)
 
-        with open(txt_path_out, "w", encoding="utf-8") as f_txt:
-            f_txt.write(final_text)
+    with open(pdf_path_out, "wb") as f_pdf:
+        f_pdf.write(page["pdf_bytes"])
 
-        if final_text.strip() == "[NO TEXT FOUND]" or len(final_text.strip()) < 10:
-            fields = {}
-            print(" Skipping field extraction due to empty/invalid text.")
-        else:
-            fields = extract_fields(final_text.strip())
+    with open(txt_path_out, "w", encoding="utf-8") as f_txt:
+        f_txt.write(page["text"])
 
-        with open(json_path_out, "w", encoding="utf-8") as f_json:
-            json.dump(fields, f_json, indent=2, ensure_ascii=False)
+    with open(json_path_out, "w", encoding="utf-8") as f_json:
+        json.dump(page["fields"], f_json, ensure_ascii=False, separators=(",", ":"))
 
-        save_cleaned_pdf_to_db(conn, session_id, document_id, f"Page_{padded_page}", pdf_path_out)
-        save_cleaned_text_to_db(conn, session_id, document_id, f"Page_{padded_page}", txt_path_out)
-        save_extracted_fields_to_db(conn, session_id, document_id, f"Page_{padded_page}", fields)
+    with span("sql_write", page=page["page_number"]):
+        save_cleaned_pdf_to_db(conn, session_id, document_id, name, pdf_path_out, data=page["pdf_bytes"])
+        save_cleaned_text_to_db(conn, session_id, document_id, name, page["text"], partial=page.get("partial", False))
+        # A copy's fields and items are its primary's; indexing them again would double the totals
+        copy = bool(page.get("duplicate_of"))
+        save_extracted_fields_to_db(conn, session_id, document_id, name, page["fields"], index=not copy)
+        if not copy:
+            save_line_items_to_db(conn, session_id, document_id, name, page.get("line_items"))
 
-        print(f" Page {page_number} processed and saved.")
+    previews = write_previews(output_dir, name, page.get("previews") or {})
+    with span("sql_write", page=page["page_number"]):
+        save_page_previews_to_db(conn, session_id, document_id, previews)
+    return previews
+
+
+def process_page(image: Image.Image, i: int, pdf_path: str, session_id: str, document_id: str, conn, output_dir: str,
+                 reader: PdfReader = None, dedup: PageDeduplicator = None) -> List[Dict]:
+    page = ocr_page(image, i, pdf_path, reader, dedup)
+    previews = write_page(page, output_dir, session_id, document_id, conn)
+    print(f" Page {page['page_number']} processed and saved.")
+    return previews
 
-    print(f"\n Done splitting and saving all {len(images)} pages for session: {session_id}")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Split documents by pages with OCR")
@@ -225,5 +361,6 @@ if __name__ == "__main__":
     parser.add_argument("document_id")
     parser.add_argument("ocr_method")
     args = parser.parse_args()
-    conn = get_sql_server_connection()
-    split_pdf_by_form_type(args.pdf_path, args.session_id, args.document_id, conn, ocr_method=args.ocr_method)
+    with profile_run("split_OCR"):
+        conn = get_sql_server_connection()
+        split_pdf_by_form_type(args.pdf_path, args.session_id, args.document_id, conn, ocr_method=args.ocr_method)
@@ -2,10 +2,10 @@ import sys
 import os
 import re
 import json
-import pyodbc
 from PyPDF2 import PdfReader, PdfWriter
 from pdf2image import convert_from_path
-from pytesseract import image_to_string
+from ocr_backend import image_to_string
+from preprocess import preprocess
 from PIL import Image
 from typing import List, Dict
 from datetime import datetime
@@ -18,11 +18,6 @@ from db_utils import (
     save_extracted_fields_to_db
 )
 
-from azure.ai.documentintelligence import DocumentIntelligenceClient
-from azure.core.credentials import AzureKeyCredential
-from openai import AzureOpenAI
-import requests
-
 
 
 def classify_form_type(text: str, fallback_name: str) -> str:
@@ -45,7 +40,7 @@ def sanitize_form_name(name: str) -> str:
 def extract_text_from_image_page(pdf_path, page_number):
     images = convert_from_path(pdf_path, first_page=page_number + 1, last_page=page_number + 1)
     if images:
-        raw_text = image_to_string(images[0])
+        raw_text = image_to_string(preprocess(images[0]))
         cleaned = re.sub(r'[ \t]+', ' ', raw_text)
         cleaned = re.sub(r'\n{3,}', '\n\n', cleaned).strip()
         lines = cleaned.split('\n')
@@ -127,7 +122,7 @@ def split_pdf_by_form_type(pdf_path: str, session_id: str, document_id: str, con
 
         fields = extract_fields(text_out.strip())
         with open(split_json_path, "w", encoding="utf-8") as f_json:
-            json.dump(fields, f_json, indent=2, ensure_ascii=False)
+            json.dump(fields, f_json, ensure_ascii=False, separators=(",", ":"))
 
         # Save to database
         save_cleaned_documents_to_db(conn, session_id, document_id, form_type, split_pdf_path, split_text_path)
@@ -3,49 +3,44 @@ import os
 import io
 import re
 import json
-import pyodbc
 import argparse
 from PyPDF2 import PdfReader, PdfWriter
 from collections import defaultdict
 from pdf2image import convert_from_path
-from pytesseract import image_to_string
+from ocr_backend import batch_enabled, best_rotation_batch, image_to_string
+from preprocess import preprocess
 from PIL import Image
 from typing import List, Dict
 from datetime import datetime
 from pathlib import Path
 from dotenv import load_dotenv
 from extract_fields import extract_fields
+from layout_fields import analyze_layout, merge_fields, page_fields
+from line_items import extract_line_items
 from db_utils import (
     # save_raw_document_to_db,
     save_cleaned_text_to_db,
     save_cleaned_pdf_to_db,
     save_extracted_fields_to_db,
+    save_line_items_to_db,
     get_sql_server_connection,
     save_grouped_pdf_to_db, save_grouped_text_to_db, save_grouped_fields_to_db, get_cleaned_split_data
 )
+from instrumentation import span, profile_run
 
 
 
-# Azure OCR & OpenAI
-from azure.ai.documentintelligence import DocumentIntelligenceClient
-from azure.core.credentials import AzureKeyCredential
-from openai import AzureOpenAI
+# Azure OCR & OpenAI clients are built on first use (azure_clients.py)
+from azure_clients import openai_client
 
 # Load credentials from .env
 load_dotenv()
-key_doc = os.getenv("AZURE_DOC_KEY")
-endpoint_doc = os.getenv("AZURE_DOC_ENDPOINT")
-credential_doc = AzureKeyCredential(key_doc)
-client_doc = DocumentIntelligenceClient(endpoint_doc, credential_doc)
-
-client_openai = AzureOpenAI(
-    api_key=os.getenv("AZURE_OPENAI_KEY"),
-    api_version="2024-12-01-preview",
-    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-)
 
-# Cache for Azure OCR page texts
-azure_page_text_cache = []
+# Cache for Azure OCR page texts, keyed by PDF path so one process can
+# split several documents (see batch_ingest.py)
+azure_page_text_cache = {}
+# Fields mapped from the same layout result (layout_fields.page_fields)
+azure_page_fields_cache = {}
 
 
 
@@ -65,8 +60,6 @@ def classify_form_type(text: str, fallback_name: str) -> str:
                 return cleaned
     return sanitize_form_name(fallback_name)
 
-import cv2
-import numpy as np
 
 def ocr_image_with_best_rotation(pil_image: Image.Image) -> str:
     """
@@ -75,10 +68,10 @@ def ocr_image_with_best_rotation(pil_image: Image.Image) -> str:
     max_text = ""
     max_len = 0
 
+    pil_image = preprocess(pil_image)
     for angle in [0, 90, 180, 270]:
         rotated = pil_image.rotate(angle, expand=True)
-        cv_img = cv2.cvtColor(np.array(rotated), cv2.COLOR_RGB2BGR)
-        gray = cv2.cvtColor(cv_img, cv2.COLOR_BGR2GRAY)
+        gray = rotated.convert("L")
         text = image_to_string(gray)
         text = text.strip()
         if len(text) > max_len:
@@ -104,31 +97,25 @@ def extract_text_tesseract(image: Image.Image) -> str:
 
 
 def extract_text_azure_document(pdf_path):
-    global azure_page_text_cache
-    if azure_page_text_cache:  # If already processed
-        return azure_page_text_cache
-
-    client = DocumentIntelligenceClient(
-        endpoint=os.getenv("AZURE_DOC_ENDPOINT"),
-        credential=AzureKeyCredential(os.getenv("AZURE_DOC_KEY"))
-    )
+    if pdf_path in azure_page_text_cache:  # If already processed
+        return azure_page_text_cache[pdf_path]
 
-    with open(pdf_path, "rb") as f:
-        poller = client.begin_analyze_document("prebuilt-layout", f)
-
-    result = poller.result()
+    result = analyze_layout(pdf_path)
 
+    page_texts = []
     for page in result.pages:
         lines = [line.content for line in page.lines]
         page_text = "\n".join(lines)
-        azure_page_text_cache.append(page_text)
+        page_texts.append(page_text)
 
-    return azure_page_text_cache
+    azure_page_text_cache[pdf_path] = page_texts
+    azure_page_fields_cache[pdf_path] = page_fields(result)
+    return page_texts
 
 
 def refine_text_with_azure_openai(raw_text: str) -> str:
     deployment = os.getenv("AZURE_DEPLOYMENT_NAME", "gpt-4")
-    response = client_openai.chat.completions.create(
+    response = openai_client().chat.completions.create(
         model=deployment,
         messages=[
             {"role": "system", "content": "You are an OCR text cleaner."},
@@ -140,12 +127,13 @@ def refine_text_with_azure_openai(raw_text: str) -> str:
 
 
 from pdf2image import convert_from_path
-from pytesseract import image_to_string
+from ocr_backend import image_to_string
 from PIL import Image
 
 def extract_text_from_image_with_rotation(image: Image.Image) -> str:
     max_text = ""
     max_len = 0
+    image = preprocess(image)  # deskewed, binarized, cropped grayscale
     for angle in [0, 90, 180, 270]:
         rotated = image.rotate(angle, expand=True)
         gray = rotated.convert("L")  # Grayscale improves OCR accuracy
@@ -177,7 +165,14 @@ def split_pdf_by_form_type(pdf_path: str, session_id: str, document_id: str, con
     # save_raw_document_to_db(conn, session_id, document_id, original_filename, original_copy_path)
 
     print(f" Converting all PDF pages to images...")
-    images = convert_from_path(pdf_path)
+    with span("rasterize"):
+        images = convert_from_path(pdf_path)
+
+    # One tesseract process for every page and rotation when no engine pool is available
+    batched = None
+    if batch_enabled():
+        with span("tesseract_batch", pages=len(images)):
+            batched = best_rotation_batch(preprocess(image) for image in images)
 
     for i, image in enumerate(images):
         page_number = i + 1
@@ -191,20 +186,26 @@ def split_pdf_by_form_type(pdf_path: str, session_id: str, document_id: str, con
         os.makedirs(os.path.dirname(pdf_path_out), exist_ok=True)
 
         #  Export single-page PDF FIRST
-        reader = PdfReader(pdf_path)
-        writer = PdfWriter()
-        writer.add_page(reader.pages[i])
-        with open(pdf_path_out, "wb") as f_pdf:
-            writer.write(f_pdf)
+        with span("split_pdf", page=page_number):
+            reader = PdfReader(pdf_path)
+            writer = PdfWriter()
+            writer.add_page(reader.pages[i])
+            with open(pdf_path_out, "wb") as f_pdf:
+                writer.write(f_pdf)
 
         #  Now it’s safe to extract + save
-        text = extract_text_from_image_with_rotation(image)
+        if batched is not None:
+            text = batched[i]["text"]
+        else:
+            with span("tesseract", page=page_number):
+                text = extract_text_from_image_with_rotation(image)
 
         if not text or len(text.strip()) < 20:
             print(f" Tesseract OCR failed or returned low confidence on page {page_number}")
             try:
                 print(" Trying Azure OCR fallback...")
-                texts = extract_text_azure_document(pdf_path)
+                with span("azure_doc_intelligence", page=page_number):
+                    texts = extract_text_azure_document(pdf_path)
                 text = texts[i] if i < len(texts) else ""
             except Exception as azure_error:
                 print(f" Azure fallback also failed: {azure_error}")
@@ -213,21 +214,32 @@ def split_pdf_by_form_type(pdf_path: str, session_id: str, document_id: str, con
         with open(txt_path_out, "w", encoding="utf-8") as f_txt:
             f_txt.write(text)
 
-        if text.strip() == "[NO TEXT FOUND]" or len(text.strip()) < 10:
-            fields = {}
-            print(" Skipping field extraction due to empty/invalid text.")
-        else:
-            fields = extract_fields(text.strip())
+        with span("extract_fields", page=page_number):
+            # Azure fallback ran: its key-value pairs and tables win over the regex fields
+            layout = azure_page_fields_cache.get(pdf_path, [])
+            page_layout = layout[i] if i < len(layout) else {}
+            if text.strip() == "[NO TEXT FOUND]" or len(text.strip()) < 10:
+                fields = dict(page_layout)
+                print(" Skipping field extraction due to empty/invalid text.")
+            else:
+                fields = merge_fields(page_layout, extract_fields(text.strip()))
+
+        with span("line_items", page=page_number):
+            line_items = extract_line_items(fields, text, image)
 
         with open(json_path_out, "w", encoding="utf-8") as f_json:
-            json.dump(fields, f_json, indent=2, ensure_ascii=False)
+            json.dump(fields, f_json, ensure_ascii=False, separators=(",", ":"))
 
-            save_cleaned_pdf_to_db(conn, session_id, document_id, f"Page_{padded_page}", pdf_path_out)
-            save_cleaned_text_to_db(conn, session_id, document_id, f"Page_{padded_page}", txt_path_out)
-            save_extracted_fields_to_db(conn, session_id, document_id, f"Page_{padded_page}", fields)
+            with span("sql_write", page=page_number):
+                save_cleaned_pdf_to_db(conn, session_id, document_id, f"Page_{padded_page}", pdf_path_out)
+                save_cleaned_text_to_db(conn, session_id, document_id, f"Page_{padded_page}", txt_path_out)
+                save_extracted_fields_to_db(conn, session_id, document_id, f"Page_{padded_page}", fields)
+                save_line_items_to_db(conn, session_id, document_id, f"Page_{padded_page}", line_items)
 
         print(f" Page {page_number} processed and saved.")
 
+    azure_page_text_cache.pop(pdf_path, None)
+    azure_page_fields_cache.pop(pdf_path, None)
     print(f"\n Done splitting and saving all {len(images)} pages for session: {session_id}")
 
 
@@ -242,6 +254,7 @@ if __name__ == "__main__":
     parser.add_argument("document_id")
     parser.add_argument("ocr_method")
     args = parser.parse_args()
-    conn = get_sql_server_connection()
-    split_pdf_by_form_type(args.pdf_path, args.session_id, args.document_id, conn, ocr_method=args.ocr_method)
+    with profile_run("split_by_form_azure"):
+        conn = get_sql_server_connection()
+        split_pdf_by_form_type(args.pdf_path, args.session_id, args.document_id, conn, ocr_method=args.ocr_method)
 
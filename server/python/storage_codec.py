@@ -0,0 +1,199 @@
+import os
+import re
+import sys
+import json
+import zlib
+import base64
+import hashlib
+import argparse
+from collections import Counter
+from typing import Dict, Iterable, Optional
+
+# Compressed storage for OCR text and field payloads.
+#
+# The same OCR text is stored per page (TF_ingestion_CleanedOCR) and per
+# group (TF_ingestion_mGroupsOCR), in NVARCHAR columns at two bytes a
+# character. With TF_STORAGE_CODEC=zlib, db_utils writes those columns (and
+# mGroupsFields.fields_json) as
+#
+#     ~z1:<dictionary id or ->:<base64 of raw deflate>
+#
+# Trade documents repeat the same vocabulary (clause text, party/port
+# labels, UCP references), so deflate is primed with a preset dictionary
+# trained from existing OCR output (`python storage_codec.py train`).
+# zlib rather than zstd: the Node routes read these columns too, and Node's
+# built-in zlib supports preset dictionaries (server/utils/storageCodec.js).
+# Values without the marker are returned unchanged, so old rows and
+# TF_STORAGE_CODEC=none (the default) keep working.
+#
+# Compressed ocr_text cannot be searched in the database: LIKE predicates
+# and the SQL Server full-text index (migrations/005, TF_SEARCH_BACKEND=
+# sqlserver) would only see base64. With that backend encode_ocr_text()
+# leaves OCR text plain and only field payloads are compressed; the
+# default SQLite search index is fed the plain text before encoding, so
+# it is unaffected.
+#
+#   TF_STORAGE_CODEC=none|zlib
+#   TF_CODEC_DICT=<dictionary id>      (a file in codec/; default: none)
+
+CODEC = os.getenv("TF_STORAGE_CODEC", "none").lower()
+DICT_DIR = os.getenv("TF_CODEC_DICT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "codec"))
+DICT_ID = os.getenv("TF_CODEC_DICT", "")
+MARKER = "~z1:"
+MIN_LENGTH = 200               # shorter values are not worth the base64 overhead
+LEVEL = 6
+DICT_SIZE = 32 * 1024          # deflate window; larger dictionaries are truncated
+# search_index.py reads the same variable; its SQL Server backend indexes ocr_text in place
+OCR_TEXT_CODEC = "none" if os.getenv("TF_SEARCH_BACKEND", "sqlite").lower() == "sqlserver" else CODEC
+
+_dictionaries: Dict[str, bytes] = {}
+
+
+def load_dictionary(dict_id: str) -> bytes:
+    if dict_id not in _dictionaries:
+        with open(os.path.join(DICT_DIR, f"{dict_id}.zdict"), "rb") as f:
+            _dictionaries[dict_id] = f.read()
+    return _dictionaries[dict_id]
+
+
+def _compressor(zdict: Optional[bytes]):
+    if zdict:
+        return zlib.compressobj(LEVEL, zlib.DEFLATED, -15, zdict=zdict)
+    return zlib.compressobj(LEVEL, zlib.DEFLATED, -15)
+
+
+def encode_text(text: Optional[str], codec: str = None) -> Optional[str]:
+    codec = codec or CODEC
+    if codec != "zlib" or text is None or len(text) < MIN_LENGTH or text.startswith(MARKER):
+        return text
+    zdict = load_dictionary(DICT_ID) if DICT_ID else None
+    compressor = _compressor(zdict)
+    payload = compressor.compress(text.encode("utf-8")) + compressor.flush()
+    encoded = f"{MARKER}{DICT_ID or '-'}:{base64.b64encode(payload).decode('ascii')}"
+    # NVARCHAR counts characters, so only keep the encoded form when it is shorter
+    return encoded if len(encoded) < len(text) else text
+
+
+def encode_ocr_text(text: Optional[str]) -> Optional[str]:
+    """encode_text() for ocr_text columns; plain while SQL Server full-text indexes them."""
+    return encode_text(text, OCR_TEXT_CODEC)
+
+
+def decode_text(value):
+    """Inverse of encode_text(); anything without the marker is returned as-is."""
+    if not isinstance(value, str) or not value.startswith(MARKER):
+        return value
+    dict_id, payload = value[len(MARKER):].split(":", 1)
+    if dict_id != "-":
+        decompressor = zlib.decompressobj(-15, zdict=load_dictionary(dict_id))
+    else:
+        decompressor = zlib.decompressobj(-15)
+    data = base64.b64decode(payload)
+    return (decompressor.decompress(data) + decompressor.flush()).decode("utf-8")
+
+
+def encode_json(obj, codec: str = None) -> str:
+    """Compact JSON (no indentation or spaces after separators), then encode_text()."""
+    return encode_text(json.dumps(obj, ensure_ascii=False, separators=(",", ":")), codec)
+
+
+def decode_json(value, default=None):
+    if value is None:
+        return default
+    return json.loads(decode_text(value))
+
+
+# ---------------------- Dictionary training ----------------------
+
+_LINE_SPLIT_RE = re.compile(r"\s*\n\s*")
+
+
+def train_dictionary(texts: Iterable[str], size: int = DICT_SIZE) -> bytes:
+    """
+    Preset dictionary from sample texts: the lines and word trigrams that
+    recur across documents, weighted by how many bytes they would save.
+    The most valuable entries go last, closest to the data (deflate
+    distances are cheaper for recent bytes).
+    """
+    document_counts = Counter()
+    for text in texts:
+        fragments = set()
+        for line in _LINE_SPLIT_RE.split(text):
+            line = line.strip()
+            if 4 <= len(line) <= 120:
+                fragments.add(line)
+            words = line.split()
+            for i in range(len(words) - 2):
+                fragments.add(" ".join(words[i:i + 3]))
+        document_counts.update(fragments)
+
+    scored = [(count * len(fragment), fragment) for fragment, count in document_counts.items() if count > 1]
+    scored.sort(reverse=True)
+    chosen, used = [], 0
+    for _, fragment in scored:
+        encoded = fragment.encode("utf-8") + b"\n"
+        if used + len(encoded) > size:
+            continue
+        chosen.append(encoded)
+        used += len(encoded)
+    return b"".join(reversed(chosen))
+
+
+def save_dictionary(zdict: bytes) -> str:
+    dict_id = hashlib.sha256(zdict).hexdigest()[:12]
+    os.makedirs(DICT_DIR, exist_ok=True)
+    with open(os.path.join(DICT_DIR, f"{dict_id}.zdict"), "wb") as f:
+        f.write(zdict)
+    return dict_id
+
+
+def sample_texts(roots: Iterable[str]) -> Iterable[str]:
+    for root in roots:
+        for folder, _, files in os.walk(root):
+            for name in files:
+                if name.endswith(".txt"):
+                    with open(os.path.join(folder, name), "r", encoding="utf-8", errors="replace") as f:
+                        yield f.read()
+
+
+def measure(texts, dict_id: str = "") -> Dict:
+    """Characters stored before/after encode_text() with the given dictionary."""
+    global DICT_ID
+    previous, DICT_ID = DICT_ID, dict_id
+    try:
+        before = after = 0
+        for text in texts:
+            before += len(text)
+            encoded = encode_text(text, codec="zlib")
+            assert decode_text(encoded) == text
+            after += len(encoded)
+    finally:
+        DICT_ID = previous
+    return {"chars": before, "stored": after, "ratio": round(before / after, 2) if after else None}
+
+
+if __name__ == "__main__":
+    root_dir = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+    parser = argparse.ArgumentParser(description="Train / evaluate the OCR text storage dictionary")
+    parser.add_argument("command", choices=["train", "measure"])
+    parser.add_argument("--roots", nargs="+",
+                        default=[os.path.join(root_dir, "outputs"), os.path.join(root_dir, "grouped")])
+    parser.add_argument("--dict", default=DICT_ID, help="Dictionary id for measure")
+    parser.add_argument("--size", type=int, default=DICT_SIZE)
+    args = parser.parse_args()
+
+    texts = list(sample_texts(args.roots))
+    if not texts:
+        print("No .txt samples found.")
+        sys.exit(1)
+    if args.command == "train":
+        # Hold back every fifth text to report the ratio on unseen documents
+        held_out = texts[::5]
+        training = [t for i, t in enumerate(texts) if i % 5]
+        dict_id = save_dictionary(train_dictionary(training or texts, args.size))
+        print(f"Dictionary {dict_id} written to {DICT_DIR} from {len(training or texts)} texts")
+        print(f"  no dictionary:   {measure(held_out)}")
+        print(f"  with dictionary: {measure(held_out, dict_id)}")
+        print(f"Set TF_STORAGE_CODEC=zlib TF_CODEC_DICT={dict_id} to use it")
+    else:
+        print(measure(texts, args.dict))
@@ -0,0 +1,33 @@
+import os
+import sys
+import uuid
+import tempfile
+import pytest
+
+# Tests run against the offline stand-ins in fake_services.py: SQLite for SQL
+# Server, no Azure, no Tesseract.
+#
+#   cd server/python && python -m pytest tests
+
+PYTHON_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PYTHON_DIR not in sys.path:
+    sys.path.insert(0, PYTHON_DIR)
+
+# Local SQLite side stores go to a scratch directory, never the repo root
+_SCRATCH = tempfile.mkdtemp(prefix="tf-tests-")
+os.environ.setdefault("TF_SEARCH_DB", os.path.join(_SCRATCH, "search_index.sqlite3"))
+os.environ.setdefault("TF_JOB_QUEUE_DB", os.path.join(_SCRATCH, "jobs.sqlite3"))
+os.environ.setdefault("TF_PROMPT_CACHE_DB", os.path.join(_SCRATCH, "prompt_cache.sqlite3"))
+
+
+@pytest.fixture
+def conn():
+    from fake_services import sqlite_connection
+    connection = sqlite_connection()
+    yield connection
+    connection.close()
+
+
+@pytest.fixture
+def session_id():
+    return str(uuid.uuid4())
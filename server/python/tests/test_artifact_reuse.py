@@ -0,0 +1,72 @@
+import uuid
+import pytest
+import artifact_reuse
+import search_index
+from artifact_reuse import GROUP_TABLES, SPLIT_TABLES, existing_tables, record_run, reuse_stage
+from db_utils import save_cleaned_text_to_db
+
+
+def _entries(session_id, document_id):
+    rows = search_index.connect().execute(
+        "SELECT kind, name FROM entries WHERE session_id = ? AND document_id = ? ORDER BY kind, name",
+        (session_id, document_id)).fetchall()
+    return [(row["kind"], row["name"]) for row in rows]
+
+
+def test_reuse_clones_rows_and_search_entries(conn, session_id):
+    source_doc, target_session, target_doc = "doc-1", str(uuid.uuid4()), "doc-2"
+    save_cleaned_text_to_db(conn, session_id, source_doc, "Page_1", "COMMERCIAL INVOICE LC/2024/0815")
+    record_run(conn, "hash", "config", "split", session_id, source_doc)
+
+    assert reuse_stage(conn, "split", SPLIT_TABLES, "hash", "config", target_session, target_doc)
+    cursor = conn.cursor()
+    cursor.execute("SELECT form_type FROM TF_ingestion_CleanedOCR WHERE session_id = ? AND document_id = ?",
+                   (target_session, target_doc))
+    assert [row[0] for row in cursor.fetchall()] == ["Page_1"]
+    assert _entries(target_session, target_doc) == [("page", "Page_1")]
+    hits = search_index.search("LC/2024/0815", session_id=target_session)
+    assert [hit["name"] for hit in hits] == ["Page_1"]
+
+
+def test_reuse_without_match_does_nothing(conn, session_id):
+    assert not reuse_stage(conn, "group", GROUP_TABLES, "missing", "config", session_id, "doc")
+
+
+def test_missing_tables_are_skipped(conn, session_id):
+    conn.execute("DROP TABLE TF_page_previews")
+    save_cleaned_text_to_db(conn, session_id, "doc-1", "Page_1", "PACKING LIST")
+    record_run(conn, "hash-2", "config", "split", session_id, "doc-1")
+    assert existing_tables(conn, SPLIT_TABLES).keys() == SPLIT_TABLES.keys() - {"TF_page_previews"}
+    assert reuse_stage(conn, "split", SPLIT_TABLES, "hash-2", "config", str(uuid.uuid4()), "doc-2")
+
+
+def test_missing_columns_are_skipped(conn, session_id):
+    conn.execute("ALTER TABLE TF_ingestion_CleanedOCR DROP COLUMN is_partial")
+    save_cleaned_text_to_db(conn, session_id, "doc-1", "Page_1", "BILL OF LADING")
+    record_run(conn, "hash-4", "config", "split", session_id, "doc-1")
+    columns, _ = existing_tables(conn, SPLIT_TABLES)["TF_ingestion_CleanedOCR"]
+    assert columns == ["form_type", "ocr_text"]
+
+    target_session = str(uuid.uuid4())
+    assert reuse_stage(conn, "split", SPLIT_TABLES, "hash-4", "config", target_session, "doc-2")
+    cursor = conn.cursor()
+    cursor.execute("SELECT ocr_text FROM TF_ingestion_CleanedOCR WHERE session_id = ? AND document_id = ?",
+                   (target_session, "doc-2"))
+    assert [row[0] for row in cursor.fetchall()] == ["BILL OF LADING"]
+
+
+def test_failed_clone_removes_linked_files(conn, session_id, tmp_path, monkeypatch):
+    source_dir, target_dir = tmp_path / "source", tmp_path / "target"
+    (source_dir / "pages").mkdir(parents=True)
+    (source_dir / "pages" / "Page_1.txt").write_text("text", encoding="utf-8")
+    (target_dir / "kept.txt").parent.mkdir()
+    (target_dir / "kept.txt").write_text("kept", encoding="utf-8")
+    record_run(conn, "hash-3", "config", "split", session_id, "doc-1", str(source_dir))
+
+    def broken_clone(*args):
+        raise RuntimeError("clone failed")
+
+    monkeypatch.setattr(artifact_reuse, "clone_rows", broken_clone)
+    with pytest.raises(RuntimeError):
+        reuse_stage(conn, "split", SPLIT_TABLES, "hash-3", "config", str(uuid.uuid4()), "doc-2", str(target_dir))
+    assert sorted(p.name for p in target_dir.iterdir()) == ["kept.txt"]
@@ -0,0 +1,64 @@
+import os
+import json
+import pipeline
+from PIL import Image
+from db_utils import save_cleaned_text_to_db, save_grouped_text_to_db
+from split_OCR import output_dir_for
+
+
+def test_complete_deferred_replaces_partial_text(conn, session_id, tmp_path, monkeypatch):
+    pdf_path = str(tmp_path / "bundle.pdf")
+    output_base, grouped_base = str(tmp_path / "outputs"), str(tmp_path / "grouped")
+    output_dir = output_dir_for(pdf_path, session_id, "doc", output_base)
+    group_dir = os.path.join(grouped_base, session_id, "doc", "attachment")
+    os.makedirs(output_dir)
+    os.makedirs(group_dir)
+    deferred = [{"page": "Page_02", "page_number": 2, "form_type": "attachment"},
+                {"page": "Page_03", "page_number": 3, "form_type": "attachment"}]
+    with open(os.path.join(output_dir, pipeline.DEFERRED_FILENAME), "w", encoding="utf-8") as f:
+        json.dump(deferred, f)
+    save_cleaned_text_to_db(conn, session_id, "doc", "Page_01", "COMMERCIAL INVOICE full text")
+    for entry in deferred:
+        save_cleaned_text_to_db(conn, session_id, "doc", entry["page"], "ATTACHMENT", partial=True)
+    save_grouped_text_to_db(conn, session_id, "doc", "attachment", None, text="ATTACHMENT\n\nATTACHMENT")
+
+    monkeypatch.setattr(pipeline, "convert_from_path",
+                        lambda path, first_page, last_page: [Image.new("RGB", (10, 10), "white")])
+    monkeypatch.setattr(pipeline, "page_text", lambda image, path, i: f"full text of page {i + 1}")
+
+    assert pipeline.complete_deferred(pdf_path, session_id, "doc", conn, output_base, grouped_base) == 2
+    rows = conn.execute("SELECT form_type, ocr_text, is_partial FROM TF_ingestion_CleanedOCR "
+                        "WHERE session_id = ? ORDER BY form_type", (session_id,)).fetchall()
+    assert [tuple(row) for row in rows] == [("Page_01", "COMMERCIAL INVOICE full text", 0),
+                                            ("Page_02", "full text of page 2", 0),
+                                            ("Page_03", "full text of page 3", 0)]
+    group_text = conn.execute("SELECT ocr_text FROM TF_ingestion_mGroupsOCR WHERE session_id = ?",
+                              (session_id,)).fetchone()[0]
+    assert group_text == "full text of page 2\n\nfull text of page 3"
+    with open(os.path.join(group_dir, "text.txt"), encoding="utf-8") as f:
+        assert f.read() == group_text
+    assert not os.path.exists(os.path.join(output_dir, pipeline.DEFERRED_FILENAME))
+    assert pipeline.complete_deferred(pdf_path, session_id, "doc", conn, output_base, grouped_base) == 0
+
+
+def test_unclassified_headers_are_reclassified_from_full_text(monkeypatch):
+    import group_by_form
+    headers = ["COMMERCIAL INVOICE", "illegible", "ATTACHMENT"]
+    full_texts = {1: "COMMERCIAL INVOICE full text", 2: "COMMERCIAL INVOICE page two full text"}
+    labels = {"COMMERCIAL INVOICE": "commercial invoice", "ATTACHMENT": "attachment"}
+
+    monkeypatch.setattr(group_by_form, "SEGMENTATION_ENABLED", False)
+    monkeypatch.setattr(group_by_form, "classify_form_type",
+                        lambda text, names: next((v for k, v in labels.items() if text.startswith(k)), "unknown"))
+    monkeypatch.setattr(pipeline, "header_texts", lambda images: headers)
+    monkeypatch.setattr(pipeline, "batch_tesseract", lambda images, path, indexes: None)
+    monkeypatch.setattr(pipeline, "ocr_page", lambda image, i, path, reader, dedup: {
+        "name": f"Page_{i + 1:02}", "page_number": i + 1, "text": full_texts[i + 1], "fields": {}})
+    monkeypatch.setattr(pipeline, "single_page_pdf", lambda reader, i: b"")
+    monkeypatch.setattr(pipeline, "render_previews", lambda image: [])
+
+    images = [Image.new("RGB", (10, 10), "white") for _ in headers]
+    pages, grouped, deferred = pipeline.classify_by_header(images, "bundle.pdf", None, [], None)
+    assert "unclassified" not in grouped
+    assert [page["name"] for page in grouped["commercial_invoice"]] == ["Page_01", "Page_02"]
+    assert [entry["page"] for entry in deferred] == ["Page_03"]
@@ -0,0 +1,134 @@
+from discrepancy import (FieldFrame, check_session, role_for, ROLE_DRAFT, ROLE_INVOICE, ROLE_LC, ROLE_OTHER,
+                         ROLE_PACKING)
+from field_index import relabel_pages, save_field_index
+from line_items import parse_records, relabel_pages as relabel_item_pages, save_line_items
+
+LC = {"L/C No.": "LC/2024/0815", "Credit Amount": "USD 10,000.00", "Latest Shipment Date": "15/03/2024",
+      "Expiry Date": "30/04/2024", "Port of Loading": "CHENNAI", "Beneficiary": "ACME EXPORTS LTD"}
+
+
+def add_document(conn, session_id, document_id, form_type, fields, page_name="Page_01"):
+    save_field_index(conn, session_id, document_id, page_name, fields)
+    relabel_pages(conn, session_id, document_id, [page_name], form_type)
+
+
+def findings_by_rule(conn, session_id):
+    result = {}
+    for finding in check_session(conn, session_id):
+        result.setdefault(finding["rule"], []).append(finding)
+    return result
+
+
+def test_roles_from_form_types():
+    assert role_for("letter_of_credit") == ROLE_LC
+    assert role_for("commercial_invoice") == ROLE_INVOICE
+    assert role_for("packing_list") == ROLE_PACKING
+    assert role_for("unclassified") == ROLE_OTHER
+
+
+def test_empty_session_has_no_findings(conn, session_id):
+    assert check_session(conn, session_id) == []
+    assert FieldFrame({}).size == 0
+
+
+def test_consistent_documents_pass(conn, session_id):
+    add_document(conn, session_id, "lc", "letter_of_credit", LC)
+    add_document(conn, session_id, "inv", "commercial_invoice", {
+        "L/C No.": "LC/2024/0815", "Invoice Amount": "USD 9,500.00", "Date": "01/03/2024",
+        "Port of Loading": "Chennai, India", "Seller": "ACME EXPORTS LIMITED"})
+    assert check_session(conn, session_id) == []
+
+
+def test_amount_dates_and_fields_against_the_lc(conn, session_id):
+    add_document(conn, session_id, "lc", "letter_of_credit", LC)
+    add_document(conn, session_id, "inv", "commercial_invoice", {
+        "L/C No.": "LC/2024/0816", "Invoice Amount": "USD 10,500.00", "Date": "02/05/2024"})
+    add_document(conn, session_id, "bl", "bill_of_lading", {
+        "Shipped on board date": "20/03/2024", "Port of Loading": "MUMBAI"})
+
+    found = findings_by_rule(conn, session_id)
+    assert [(f["document_id"], f["found"]) for f in found["amount_tolerance"]] == [("inv", 10500.0)]
+    assert sorted((f["field"], f["found"]) for f in found["date_order"]) == [
+        ("issue_date", "2024-05-02"), ("shipment_date", "2024-03-20")]
+    assert sorted((f["field"], f["found"]) for f in found["field_match"]) == [
+        ("lc_number", "LC 2024 0816"), ("port_of_loading", "MUMBAI")]
+
+
+def test_quantity_sums_within_tolerance(conn, session_id):
+    add_document(conn, session_id, "inv", "commercial_invoice", {"Quantity": "1,000 PCS"})
+    add_document(conn, session_id, "pl", "packing_list", {"Total Quantity": "1,040 PCS"})
+    assert check_session(conn, session_id) == []
+
+    add_document(conn, session_id, "bl", "bill_of_lading", {"Quantity": "1,200 PCS"})
+    found = findings_by_rule(conn, session_id)["quantity_sum"]
+    assert [(f["form_type"], f["found"]) for f in found] == [("transport_document", 1200.0)]
+
+
+def test_line_items_against_stated_total_and_credit(conn, session_id):
+    add_document(conn, session_id, "lc", "letter_of_credit", LC)
+    items = [{"Description": "Shirts", "Amount": "6,000.00"}, {"Description": "Jeans", "Amount": "5,000.00"},
+             {"Description": "Total", "Amount": "10,000.00"}]
+    save_line_items(conn, session_id, "inv", "Page_01", parse_records(items))
+    relabel_item_pages(conn, session_id, "inv", ["Page_01"], "commercial_invoice")
+
+    found = findings_by_rule(conn, session_id)
+    assert [(f["expected"], f["found"]) for f in found["line_item_total"]] == [(10000.0, 11000.0)]
+    assert [(f["expected"], f["found"]) for f in found["line_item_credit"]] == [(10000.0, 11000.0)]
+
+
+def test_original_and_copy_invoice_are_not_summed_together(conn, session_id):
+    add_document(conn, session_id, "lc", "letter_of_credit", LC)
+    items = [{"Description": "Shirts", "Amount": "5,000.00"}, {"Description": "Jeans", "Amount": "5,000.00"},
+             {"Description": "Total", "Amount": "10,000.00"}]
+    for page in ("Page_01", "Page_02"):             # ORIGINAL and COPY, dedup off
+        save_line_items(conn, session_id, "inv", page, parse_records(items))
+    relabel_item_pages(conn, session_id, "inv", ["Page_01", "Page_02"], "commercial_invoice")
+    assert check_session(conn, session_id) == []
+
+
+def test_amounts_in_another_currency_or_unit_are_not_compared(conn, session_id):
+    add_document(conn, session_id, "lc", "letter_of_credit", LC)
+    add_document(conn, session_id, "inv", "commercial_invoice", {"Invoice Amount": "EUR 12,000.00"})
+    add_document(conn, session_id, "pl", "packing_list", {"Total": "25,000 KGS"})
+    assert "amount_tolerance" not in findings_by_rule(conn, session_id)
+
+    add_document(conn, session_id, "draft", "bill_of_exchange", {"Amount": "10,250.00"})
+    found = findings_by_rule(conn, session_id)["amount_tolerance"]
+    assert [(f["document_id"], f["found"]) for f in found] == [("draft", 10250.0)]
+
+
+def test_lc_currency_from_its_own_field(conn, session_id):
+    add_document(conn, session_id, "lc", "letter_of_credit", {"Currency": "USD", "Credit Amount": "10,000.00"})
+    add_document(conn, session_id, "inv", "commercial_invoice", {"Invoice Amount": "EUR 10,500.00"})
+    assert check_session(conn, session_id) == []
+
+
+def test_quantity_on_two_pages_counts_twice(conn, session_id):
+    add_document(conn, session_id, "inv", "commercial_invoice", {"Quantity": "1,000 PCS"})
+    for page in ("Page_01", "Page_02"):             # two pages of one packing list, 500 + 500
+        add_document(conn, session_id, "pl", "packing_list", {"Quantity": "500 PCS", "Total Quantity": "500 PCS"},
+                     page_name=page)
+    assert check_session(conn, session_id) == []
+
+    add_document(conn, session_id, "pl", "packing_list", {"Quantity": "500 PCS"}, page_name="Page_03")
+    found = findings_by_rule(conn, session_id)["quantity_sum"]
+    assert [(f["form_type"], f["found"]) for f in found] == [("packing_list", 1500.0)]
+
+
+def test_copies_found_by_dedup_are_not_indexed(conn, session_id, tmp_path):
+    from split_OCR import write_page
+    add_document(conn, session_id, "inv", "commercial_invoice", {"Quantity": "1,000 PCS"})
+    page = {"name": "Page_01", "page_number": 1, "text": "PACKING LIST", "fields": {"Total Quantity": "1,000 PCS"},
+            "line_items": None, "pdf_bytes": b"%PDF-1.4", "previews": {}}
+    copy = dict(page, name="Page_02", page_number=2, duplicate_of="Page_01")
+    for p in (page, copy):
+        write_page(p, str(tmp_path), session_id, "pl", conn)
+    relabel_pages(conn, session_id, "pl", ["Page_01", "Page_02"], "packing_list")
+    assert check_session(conn, session_id) == []
+
+
+def test_insurance_cover_above_the_credit_is_not_flagged(conn, session_id):
+    add_document(conn, session_id, "lc", "letter_of_credit", LC)
+    add_document(conn, session_id, "ins", "insurance_certificate", {"Amount": "USD 11,000.00"})
+    assert role_for("bill_of_exchange") == ROLE_DRAFT
+    assert "amount_tolerance" not in findings_by_rule(conn, session_id)
@@ -0,0 +1,21 @@
+import os
+import pytest
+import export_parquet
+from export_parquet import DATASETS, available_datasets, export_dataset, partition_dir
+
+
+def test_datasets_without_tables_are_skipped(conn):
+    conn.execute("DROP TABLE TF_field_index")
+    conn.execute("DROP TABLE TF_line_items")
+    assert available_datasets(conn, DATASETS) == ["fields", "pages", "catalog"]
+
+
+def test_empty_export_keeps_the_previous_partition(conn, session_id, tmp_path):
+    pytest.importorskip("pyarrow")
+    out_dir = str(tmp_path)
+    conn.execute("INSERT INTO TF_fields_KeyValuePair (session_id, document_id, form_type, field_key, field_value, "
+                 "extracted_at) VALUES (?, 'doc', 'invoice', 'Amount', '100', GETDATE())", (session_id,))
+    assert export_dataset(conn, "fields", session_id, out_dir) == 1
+    conn.execute("DELETE FROM TF_fields_KeyValuePair")
+    assert export_dataset(conn, "fields", session_id, out_dir) == 0
+    assert os.path.exists(os.path.join(partition_dir(out_dir, "fields", session_id), export_parquet.PART_FILE))
@@ -0,0 +1,12 @@
+import pytest
+import benchmark
+
+
+@pytest.mark.parametrize("module", benchmark.IMPORT_MODULES)
+def test_entry_script_imports_cold_without_heavy_sdks(module, monkeypatch):
+    # Child interpreters must not leave __pycache__ or results files behind
+    monkeypatch.setattr(benchmark, "IMPORT_REPEATS", 1)
+    monkeypatch.setenv("PYTHONDONTWRITEBYTECODE", "1")
+    result = benchmark.measure_import(module)
+    assert "error" not in result, result.get("error")
+    assert result["eager_heavy_imports"] == []
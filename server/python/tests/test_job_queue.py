@@ -0,0 +1,159 @@
+import time
+import pytest
+import job_queue
+from job_queue import (
+    Heartbeat,
+    claim,
+    complete,
+    connect,
+    enqueue,
+    extend_visibility,
+    fail,
+    find_job,
+    lookup_job,
+    queue_depth,
+    requeue_failed,
+    stats,
+)
+
+PAYLOAD = {"pdf_path": "/tmp/a.pdf", "session_id": "s", "document_id": "d"}
+
+
+@pytest.fixture
+def queue(tmp_path):
+    connection = connect(str(tmp_path / "jobs.sqlite3"))
+    yield connection
+    connection.close()
+
+
+def test_unknown_kind_is_rejected(queue):
+    with pytest.raises(ValueError):
+        enqueue(queue, "ocr", PAYLOAD)
+
+
+def test_claim_by_priority_then_age(queue):
+    split = enqueue(queue, "split", PAYLOAD)
+    catalog = enqueue(queue, "catalog", PAYLOAD)
+    group = enqueue(queue, "group", PAYLOAD)
+    claimed = [claim(queue, "w1")["id"] for _ in range(3)]
+    assert claimed == [catalog, group, split]
+    assert claim(queue, "w1") is None
+
+
+def test_claim_filters_kinds_and_decodes_payload(queue):
+    enqueue(queue, "split", PAYLOAD)
+    assert claim(queue, "w1", kinds=["group"]) is None
+    job = claim(queue, "w1", kinds=["split"])
+    assert job["payload"] == PAYLOAD and job["attempts"] == 1
+    assert job["status"] == "running" and job["worker"] == "w1" and job["locked_until"] > time.time()
+
+
+def test_running_job_is_invisible_until_timeout(queue):
+    job_id = enqueue(queue, "split", PAYLOAD)
+    assert claim(queue, "w1", visibility_timeout=60)["id"] == job_id
+    assert claim(queue, "w2") is None
+    # A worker that died: its lock has expired, so the job is handed back
+    assert claim(queue, "w1", visibility_timeout=-1) is None
+    queue.execute("UPDATE jobs SET locked_until = 0 WHERE id = ?", (job_id,))
+    reclaimed = claim(queue, "w2")
+    assert reclaimed["id"] == job_id and reclaimed["attempts"] == 2
+
+
+def test_expired_job_without_attempts_left_is_parked(queue):
+    job_id = enqueue(queue, "split", PAYLOAD, max_attempts=2)
+    for _ in range(2):
+        assert claim(queue, "w1")["id"] == job_id
+        queue.execute("UPDATE jobs SET locked_until = 0 WHERE id = ?", (job_id,))
+    assert claim(queue, "w2") is None
+    assert stats(queue) == {"split": {"failed": 1}}
+    row = queue.execute("SELECT attempts, last_error FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    assert row["attempts"] == 2 and "lock expired after 2 attempt(s)" in row["last_error"]
+
+
+def test_complete_and_depth(queue):
+    enqueue(queue, "split", PAYLOAD)
+    assert queue_depth(queue) == 1
+    assert complete(queue, claim(queue, "w1"))
+    assert queue_depth(queue) == 0
+    assert stats(queue) == {"split": {"done": 1}}
+
+
+def test_failures_back_off_then_park(queue, monkeypatch):
+    monkeypatch.setattr(job_queue, "backoff_seconds", lambda attempts: 0)
+    enqueue(queue, "split", PAYLOAD, max_attempts=2)
+    fail(queue, claim(queue, "w1"), "boom 1")
+    assert stats(queue) == {"split": {"queued": 1}}
+    fail(queue, claim(queue, "w1"), "boom 2")
+    assert stats(queue) == {"split": {"failed": 1}}
+    assert claim(queue, "w1") is None
+
+    assert requeue_failed(queue) == 1
+    assert claim(queue, "w1")["attempts"] == 1
+
+
+def test_backoff_grows_and_is_capped():
+    assert job_queue.BACKOFF_BASE * 0.8 <= job_queue.backoff_seconds(1) <= job_queue.BACKOFF_BASE * 1.2
+    assert job_queue.backoff_seconds(20) <= job_queue.BACKOFF_MAX * 1.2
+
+
+def test_only_the_owner_can_finish_a_job(queue):
+    job_id = enqueue(queue, "split", PAYLOAD)
+    stale = claim(queue, "w1", visibility_timeout=60)
+    queue.execute("UPDATE jobs SET locked_until = 0 WHERE id = ?", (job_id,))
+    current = claim(queue, "w2")
+    assert current["id"] == job_id
+
+    assert not extend_visibility(queue, stale)
+    assert not complete(queue, stale)
+    assert not fail(queue, stale, "late failure")
+    assert stats(queue) == {"split": {"running": 1}}
+    assert extend_visibility(queue, current)
+    assert complete(queue, current)
+    assert not complete(queue, current)        # already done
+    assert stats(queue) == {"split": {"done": 1}}
+
+
+def test_heartbeat_keeps_a_long_job_locked(tmp_path, monkeypatch):
+    db_path = str(tmp_path / "jobs.sqlite3")
+    conn = connect(db_path)
+    monkeypatch.setattr(job_queue, "HEARTBEAT_FRACTION", 4)
+    enqueue(conn, "split", PAYLOAD)
+    job = claim(conn, "w1", visibility_timeout=4)
+
+    heartbeat = Heartbeat(job, db_path, visibility_timeout=4)
+    heartbeat.start()
+    time.sleep(1.5)
+    locked_until = conn.execute("SELECT locked_until FROM jobs WHERE id = ?", (job["id"],)).fetchone()[0]
+    heartbeat.stop()
+    assert locked_until > job["locked_until"] and not heartbeat.lost
+
+    conn.execute("UPDATE jobs SET worker = 'w2' WHERE id = ?", (job["id"],))
+    heartbeat = Heartbeat(job, db_path, visibility_timeout=4)
+    heartbeat.start()
+    heartbeat.join(timeout=5)
+    assert heartbeat.lost
+    conn.close()
+
+
+def test_find_job_matches_document_and_splitter(queue):
+    split = enqueue(queue, "split", dict(PAYLOAD, splitter="OCR_Alone"))
+    group = enqueue(queue, "group", PAYLOAD)
+    assert find_job(queue, "split", "s", "d", "OCR_Alone")["id"] == split
+    assert find_job(queue, "split", "s", "d", "split_OCR") is None
+    assert find_job(queue, "group", "s", "d")["id"] == group
+    assert find_job(queue, "group", "s", "other") is None
+
+
+def test_lookup_waits_for_the_chained_upstream_job(queue):
+    split = enqueue(queue, "split", PAYLOAD)
+    assert lookup_job(queue, "group", "s", "d")["id"] == split
+    assert lookup_job(queue, "catalog", "s", "d")["id"] == split
+    assert complete(queue, claim(queue, "w1"))
+    assert lookup_job(queue, "group", "s", "d") is None      # split done, nothing chained yet
+    group = enqueue(queue, "group", PAYLOAD)
+    assert lookup_job(queue, "group", "s", "d")["id"] == group
+    assert lookup_job(queue, "catalog", "s", "d")["id"] == group
+    # OCR_Alone splits do not chain, so they never cover the group stage
+    enqueue(queue, "split", {**PAYLOAD, "document_id": "d2", "splitter": "OCR_Alone"})
+    assert lookup_job(queue, "group", "s", "d2") is None
+    assert lookup_job(queue, "split", "s", "d2", "OCR_Alone")["status"] == "queued"
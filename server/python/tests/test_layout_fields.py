@@ -0,0 +1,97 @@
+import json
+from types import SimpleNamespace as NS
+import layout_fields
+from layout_fields import cap_tables, clean_key, clean_value, merge_fields, merge_page_fields, page_fields
+
+
+def region(page):
+    return [NS(page_number=page)]
+
+
+def pair(key, value, page=1, confidence=0.9, spans=()):
+    return NS(key=NS(content=key, bounding_regions=region(page), spans=[]),
+              value=NS(content=value, bounding_regions=region(page), spans=list(spans)),
+              confidence=confidence)
+
+
+def cell(row, column, content, kind="content"):
+    return NS(row_index=row, column_index=column, content=content, kind=kind)
+
+
+def table(rows, page=1, header=False):
+    cells = [cell(r, c, value, "columnHeader" if header and r == 0 else "content")
+             for r, row in enumerate(rows) for c, value in enumerate(row)]
+    return NS(row_count=len(rows), column_count=len(rows[0]), cells=cells, bounding_regions=region(page))
+
+
+def result(pages=1, pairs=(), tables=(), content="", marks=None):
+    marks = marks or {}
+    return NS(pages=[NS(page_number=n, selection_marks=marks.get(n, [])) for n in range(1, pages + 1)],
+              key_value_pairs=list(pairs), tables=list(tables), content=content)
+
+
+def test_clean_key_and_value():
+    assert clean_key("L/C\nNo. :") == "L/C No."
+    assert clean_value("  USD   10,000.00 ") == "USD 10,000.00"
+    assert clean_value(":selected:") == "selected"
+    assert clean_value(":unselected:") == "unselected"
+
+
+def test_key_value_pairs_by_page_with_confidence_floor():
+    fields = page_fields(result(pages=2, pairs=[
+        pair("L/C No.:", "LC/2024/0815"),
+        pair("Vessel", "MSC AURORA", page=2),
+        pair("Vessel", "EVER GIVEN", page=2),        # first value on a page wins
+        pair("Noise", "x", confidence=0.1),
+    ]))
+    assert fields == [{"L/C No.": "LC/2024/0815"}, {"Vessel": "MSC AURORA"}]
+
+
+def test_selection_marks_use_the_label_on_their_line():
+    content = "Freight\n:selected: Prepaid :unselected: Collect"
+    marks = [NS(span=NS(offset=8, length=10), state="selected"),
+             NS(span=NS(offset=27, length=12), state="unselected")]
+    fields = page_fields(result(content=content, marks={1: marks}))
+    assert fields == [{"Prepaid": "selected", "Collect": "unselected"}]
+
+
+def test_two_column_table_becomes_fields_and_goods_table_becomes_records():
+    box = table([["Shipper", "ACME EXPORTS"], ["Port of Loading", "CHENNAI"]])
+    goods = table([["Description", "Qty", "Amount"], ["T-shirts", "100", "1,000.00"], ["", "", ""],
+                   ["Total", "100", "1,000.00"]], header=True)
+    fields = page_fields(result(tables=[box, goods]))[0]
+    assert fields["Shipper"] == "ACME EXPORTS"
+    assert fields["Port of Loading"] == "CHENNAI"
+    assert json.loads(fields["Table 1"]) == [
+        {"Description": "T-shirts", "Qty": "100", "Amount": "1,000.00"},
+        {"Description": "Total", "Qty": "100", "Amount": "1,000.00"},
+    ]
+
+
+def test_disabled_returns_empty_pages(monkeypatch):
+    monkeypatch.setattr(layout_fields, "LAYOUT_FIELDS_ENABLED", False)
+    assert page_fields(result(pages=2, pairs=[pair("Vessel", "MSC AURORA")])) == [{}, {}]
+
+
+def test_merge_page_fields_keeps_first_value_and_renumbers_tables():
+    merged = merge_page_fields([{"Vessel": "A", "Table 1": "[1]"}, {"Vessel": "B", "Table 1": "[2]"}])
+    assert merged == {"Vessel": "A", "Table 1": "[1]", "Table 2": "[2]"}
+
+
+def test_merge_fields_prefers_layout_and_fills_missing_keys():
+    layout = {"L/C No.": "LC/2024/0815", "Vessel": "MSC AURORA"}
+    regex = {"LC Number": "LC/2024/O815", "Vessel": "MSC AUR0RA", "Port of Loading": "CHENNAI", "Remarks": "none"}
+    assert merge_fields(layout, regex) == {"L/C No.": "LC/2024/0815", "Vessel": "MSC AURORA",
+                                           "Port of Loading": "CHENNAI", "Remarks": "none"}
+    assert merge_fields({}, regex) == regex
+
+
+def test_cap_tables_keeps_whole_rows():
+    rows = [{"Description": f"Item {n}", "Amount": "100.00"} for n in range(200)]
+    fields = {"Vessel": "MSC AURORA", "Table 1": json.dumps(rows), "Table 2": json.dumps(rows[:2])}
+    capped = cap_tables(fields, limit=500)
+    kept = json.loads(capped["Table 1"])
+    assert 0 < len(kept) < len(rows) and kept == rows[:len(kept)]
+    assert len(capped["Table 1"]) <= 500
+    assert capped["Table 2"] == fields["Table 2"] and capped["Vessel"] == "MSC AURORA"
+    assert cap_tables({"Vessel": "A"}, limit=500) == {"Vessel": "A"}
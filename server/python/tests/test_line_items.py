@@ -0,0 +1,139 @@
+import json
+import numpy as np
+import pytest
+from line_items import (
+    ItemFrame,
+    extract_line_items,
+    header_columns,
+    load_session_items,
+    looks_tabular,
+    parse_records,
+    parse_words,
+    records_from_words,
+    save_line_items,
+    totals,
+)
+
+RECORDS = [
+    {"Description of Goods": "Cotton T-shirts", "Qty": "100 PCS", "Unit Price USD": "5.00", "Amount": "USD 500.00"},
+    {"Description of Goods": "size M"},
+    {"Description of Goods": "Denim jeans", "Qty": "50 PCS", "Unit Price USD": "10.00", "Amount": "USD 500.00"},
+    {"Description of Goods": "Total", "Qty": "150", "Amount": "USD 1,000.00"},
+]
+
+
+def tsv(words):
+    """Tesseract TSV for (text, left, top) words of height 20."""
+    rows = ["level\tpage_num\tblock_num\tpar_num\tline_num\tword_num\tleft\ttop\twidth\theight\tconf\ttext"]
+    for n, (text, left, top) in enumerate(words, start=1):
+        rows.append(f"5\t1\t{n}\t1\t1\t1\t{left}\t{top}\t{10 * len(text)}\t20\t95\t{text}")
+    return "\n".join(rows)
+
+
+def test_header_columns_prefers_longest_alias():
+    mapping = header_columns(["Description of Goods", "Qty", "Unit Price USD", "Amount"])
+    assert mapping == {"Description of Goods": "description", "Qty": "quantity",
+                       "Unit Price USD": "unit_price", "Amount": "amount"}
+    assert header_columns(["Shipper", "Consignee"]) == {}
+
+
+def test_parse_records_types_cells_and_separates_totals():
+    parsed = parse_records(RECORDS)
+    first, second = parsed["items"]
+    assert first["description"] == "Cotton T-shirts size M"
+    assert (first["quantity"], first["unit"], first["amount"], first["currency"]) == (100.0, "PCS", 500.0, "USD")
+    assert second["unit_price"] == 10.0
+    assert np.isnan(second["net_weight"])
+    assert [row["amount"] for row in parsed["totals"]] == [1000.0]
+    assert totals(parsed) == {"quantity": 150.0, "amount": 1000.0}
+
+
+def test_items_from_document_intelligence_tables():
+    fields = {"Invoice No.": "42", "Table 1": json.dumps(RECORDS), "Table 2": "not json"}
+    parsed = extract_line_items(fields)
+    assert len(parsed["items"]) == 2 and len(parsed["totals"]) == 1
+    assert extract_line_items({"Invoice No.": "42"}) == {}
+
+
+def test_items_from_word_boxes():
+    words = [("Description", 50, 100), ("Qty", 300, 100), ("Unit", 400, 102), ("Price", 445, 102),
+             ("Amount", 550, 100),
+             ("Cotton", 50, 140), ("shirts", 115, 141), ("100", 300, 140), ("5.00", 450, 140), ("500.00", 550, 140),
+             ("Denim", 50, 180), ("jeans", 110, 180), ("50", 300, 181), ("10.00", 450, 180), ("500.00", 550, 180),
+             ("Total", 50, 220), ("150", 300, 220), ("1,000.00", 550, 220),
+             ("Signature", 50, 400)]
+    records = records_from_words(parse_words(tsv(words)))
+    assert records[0] == {"Description": "Cotton shirts", "Qty": "100", "Unit Price": "5.00", "Amount": "500.00"}
+    assert len(records) == 3          # stops at the Total row
+    parsed = parse_records(records)
+    assert [item["amount"] for item in parsed["items"]] == [500.0, 500.0]
+    assert parsed["totals"][0]["quantity"] == 150.0
+
+
+def test_looks_tabular():
+    assert looks_tabular("INVOICE\nDescription    Qty    Unit Price    Amount\nShirts  100  5.00  500.00")
+    assert not looks_tabular("Shipper: ACME\nAmount: USD 500")
+
+
+def test_item_frame_sums_and_stated_totals_per_document():
+    rows = [
+        {"document_id": "d1", "form_type": "commercial_invoice", "amount": 500.0, "is_total": False},
+        {"document_id": "d1", "form_type": "commercial_invoice", "amount": 250.5, "is_total": False},
+        {"document_id": "d1", "form_type": "commercial_invoice", "amount": 700.0, "is_total": True},
+        {"document_id": "d1", "form_type": "commercial_invoice", "amount": 750.5, "is_total": True},
+        {"document_id": "d2", "form_type": "packing_list", "quantity": 10.0, "is_total": False},
+    ]
+    frame = ItemFrame(rows)
+    codes = {frame.document_key(code): code for code in range(len(frame.documents))}
+    invoice, packing = codes[("d1", "commercial_invoice")], codes[("d2", "packing_list")]
+    assert frame.sums("amount")[invoice] == pytest.approx(750.5)
+    assert np.isnan(frame.sums("amount")[packing])
+    assert frame.stated("amount")[invoice] == 750.5     # grand total over the sub-total
+    assert frame.sums("quantity")[packing] == 10.0
+
+
+def test_save_and_load_round_trip(conn, session_id):
+    assert save_line_items(conn, session_id, "doc-1", "Page_01", parse_records(RECORDS)) == 3
+    rows = load_session_items(conn, session_id)
+    assert [(row["page_name"], row["row_index"], bool(row["is_total"])) for row in rows] == [
+        ("Page_01", 0, False), ("Page_01", 1, False), ("Page_01", 2, True)]
+    assert rows[0]["unit_price"] == 5.0 and rows[0]["net_weight"] is None
+    assert save_line_items(conn, session_id, "doc-1", "Page_02", {}) == 0
+
+
+def invoice_rows(document_id, pages, amounts, total, form_type="commercial_invoice"):
+    """Item rows spread over `pages`, with the Total row on the last one."""
+    rows = [{"document_id": document_id, "form_type": form_type, "page_name": pages[n % len(pages)],
+             "row_index": n, "amount": amount, "is_total": False} for n, amount in enumerate(amounts)]
+    rows.append({"document_id": document_id, "form_type": form_type, "page_name": pages[-1],
+                 "row_index": len(amounts), "amount": total, "is_total": True})
+    return rows
+
+
+def test_original_and_copy_are_separate_documents():
+    rows = invoice_rows("d1", ["Page_01"], [5000.0, 5000.0], 10000.0) + \
+        invoice_rows("d1", ["Page_02"], [5000.0, 5000.0], 10000.0)
+    frame = ItemFrame(rows)
+    assert len(frame.documents) == 2
+    assert list(frame.sums("amount")) == [10000.0, 10000.0]
+    assert list(frame.stated("amount")) == [10000.0, 10000.0]
+    assert [frame.pages(code) for code in range(2)] == ["Page_01", "Page_02"]
+
+
+def test_multi_page_invoice_ends_on_its_total_page():
+    rows = invoice_rows("d1", ["Page_09", "Page_10"], [100.0, 200.0, 300.0], 600.0) + \
+        invoice_rows("d1", ["Page_11"], [50.0], 50.0)
+    frame = ItemFrame(rows)
+    assert [frame.pages(code) for code in range(len(frame.documents))] == ["Page_09-Page_10", "Page_11"]
+    assert list(frame.sums("amount")) == [600.0, 50.0]
+
+
+def test_copies_found_by_dedup_do_not_store_line_items(conn, session_id, tmp_path):
+    from split_OCR import write_page
+    parsed = parse_records(RECORDS)
+    page = {"name": "Page_01", "page_number": 1, "text": "INVOICE", "fields": {}, "line_items": parsed,
+            "pdf_bytes": b"%PDF-1.4", "previews": {}}
+    copy = dict(page, name="Page_02", page_number=2, duplicate_of="Page_01")
+    for p in (page, copy):
+        write_page(p, str(tmp_path), session_id, "doc-1", conn)
+    assert {row["page_name"] for row in load_session_items(conn, session_id)} == {"Page_01"}
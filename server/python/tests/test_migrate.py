@@ -0,0 +1,52 @@
+import migrate
+from migrate import apply_migrations, is_transactional, split_batches
+
+
+class RecordingConnection:
+    """pyodbc-shaped connection that records the autocommit mode of every batch."""
+
+    def __init__(self):
+        self.autocommit = False
+        self.executed = []
+        self.commits = 0
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params=()):
+        self.executed.append((sql.strip(), self.autocommit))
+
+    def fetchall(self):
+        return []
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+
+def test_fulltext_migration_is_marked_no_transaction():
+    with open(f"{migrate.MIGRATIONS_DIR}/005_ocr_fulltext.sql", encoding="utf-8") as f:
+        assert not is_transactional(f.read())
+    assert is_transactional("CREATE TABLE t (id INT)\nGO\n-- migrate: later")
+
+
+def test_no_transaction_batches_run_in_autocommit(tmp_path, monkeypatch):
+    (tmp_path / "001_table.sql").write_text("CREATE TABLE a (id INT)\nGO\n", encoding="utf-8")
+    (tmp_path / "002_fulltext.sql").write_text(
+        "-- migrate: no-transaction\nCREATE FULLTEXT CATALOG c\nGO\nCREATE FULLTEXT INDEX ON a (id)\n", encoding="utf-8")
+    monkeypatch.setattr(migrate, "MIGRATIONS_DIR", str(tmp_path))
+    conn = RecordingConnection()
+
+    assert apply_migrations(conn) == ["001_table.sql", "002_fulltext.sql"]
+    modes = {sql.splitlines()[-1]: autocommit for sql, autocommit in conn.executed}
+    assert modes["CREATE TABLE a (id INT)"] is False
+    assert modes["CREATE FULLTEXT CATALOG c"] is True
+    assert modes["CREATE FULLTEXT INDEX ON a (id)"] is True
+    assert conn.autocommit is False
+    assert conn.executed[-1] == ("INSERT INTO TF_schema_migrations (name) VALUES (?)", False)
+
+
+def test_split_batches_on_go_lines():
+    assert split_batches("SELECT 1\nGO\n\ngo\nSELECT 2\n") == ["SELECT 1", "SELECT 2"]
@@ -0,0 +1,104 @@
+from PIL import Image, ImageDraw
+from page_dedup import MAX_HASH_DISTANCE, MIN_TEXT_SIMILARITY, PageDeduplicator, dhash, hamming, minhash, minhash_similarity
+
+BL_TEXT = """BILL OF LADING
+Shipper: ACME EXPORTS LTD, 12 HARBOUR ROAD, CHENNAI
+Consignee: TO ORDER OF GLOBAL BANK
+Notify Party: BETA IMPORTS GMBH, HAMBURG
+Vessel: MSC AURORA Voyage 123E
+Port of Loading: CHENNAI  Port of Discharge: HAMBURG
+Description of Goods: 200 CARTONS COTTON T-SHIRTS
+Gross Weight: 5,000 KGS  Measurement: 24 CBM
+Freight Prepaid  Shipped on board 12/03/2024"""
+
+
+def page_image(lines, stamp=None):
+    image = Image.new("L", (600, 800), 255)
+    draw = ImageDraw.Draw(image)
+    for row, line in enumerate(lines):
+        draw.rectangle((40, 60 + row * 40, 40 + 12 * len(line), 80 + row * 40), fill=0)
+    if stamp:
+        draw.rectangle((420, 20, 560, 50), fill=0)
+    return image
+
+
+def primary_page(text=BL_TEXT):
+    return {"name": "Page_01", "text": text, "fields": {"Vessel": "MSC AURORA"}}
+
+
+def test_dhash_is_stable_for_small_changes():
+    lines = BL_TEXT.splitlines()
+    original, stamped = page_image(lines), page_image(lines, stamp=True)
+    other = Image.new("L", (600, 800), 255)
+    ImageDraw.Draw(other).rectangle((300, 300, 580, 780), fill=0)
+    assert hamming(dhash(original), dhash(stamped)) <= MAX_HASH_DISTANCE
+    assert hamming(dhash(original), dhash(other)) > MAX_HASH_DISTANCE
+
+
+def test_minhash_similarity():
+    assert minhash_similarity(minhash(BL_TEXT), minhash(BL_TEXT)) == 1.0
+    assert minhash_similarity(minhash(BL_TEXT), minhash("COMMERCIAL INVOICE total USD 100")) < 0.2
+    assert minhash_similarity([], minhash(BL_TEXT)) == 0.0
+
+
+# Full OCR (GPT-4o / Document Intelligence) reflows and cleans the text; the
+# quick Tesseract pass of both pages keeps the raw line breaks and noise
+FULL_TEXT = " ".join(BL_TEXT.split()).title()
+QUICK_TEXT = BL_TEXT.replace("Voyage", "Voy age").replace("CHENNAI", "CHENNA1")
+
+
+def quick_pass(texts):
+    def quick_ocr(image):
+        return texts[id(image)]
+    return quick_ocr
+
+
+def test_copy_is_compared_quick_ocr_to_quick_ocr():
+    original, stamped = page_image(BL_TEXT.splitlines()), page_image(BL_TEXT.splitlines(), stamp=True)
+    quick_ocr = quick_pass({id(original): QUICK_TEXT, id(stamped): QUICK_TEXT + "\nNON NEGOTIABLE COPY"})
+    dedup = PageDeduplicator()
+    dedup.register(dhash(original), primary_page(FULL_TEXT), original)
+
+    copy = dedup.match(stamped, dhash(stamped), quick_ocr)
+    assert copy["duplicate_of"] == "Page_01"
+    assert copy["text"] == FULL_TEXT
+    assert copy["fields"] == {"Vessel": "MSC AURORA"}
+    assert copy["text_similarity"] >= MIN_TEXT_SIMILARITY
+    assert copy["diff_lines"] == ["NON NEGOTIABLE COPY"]
+
+    dedup.record(dict(copy, name="Page_02"))
+    assert dedup.cross_references["Page_02"]["duplicate_of"] == "Page_01"
+
+
+def test_primary_quick_ocr_runs_once():
+    original = page_image(BL_TEXT.splitlines())
+    calls = []
+    dedup = PageDeduplicator()
+    dedup.register(dhash(original), primary_page(FULL_TEXT), original)
+    for _ in range(2):
+        assert dedup.match(original, dhash(original), lambda image: calls.append(image) or QUICK_TEXT)
+    assert len(calls) == 3
+
+
+def test_different_document_on_a_similar_layout_is_not_a_copy():
+    image = page_image(BL_TEXT.splitlines())
+    other_bl = QUICK_TEXT.replace("MSC AURORA Voy age 123E", "EVER GIVEN Voy age 77W").replace(
+        "200 CARTONS COTTON T-SHIRTS", "40 BALES RAW JUTE").replace("5,000 KGS", "8,200 KGS").replace(
+        "BETA IMPORTS GMBH, HAMBURG", "GAMMA TRADING LLC, DUBAI").replace("12/03/2024", "02/04/2024")
+    dedup = PageDeduplicator()
+    dedup.register(dhash(image), primary_page(FULL_TEXT), image)
+
+    candidate = page_image(BL_TEXT.splitlines())
+    quick_ocr = quick_pass({id(image): QUICK_TEXT, id(candidate): other_bl})
+    score = minhash_similarity(minhash(other_bl), minhash(QUICK_TEXT))
+    assert 0.3 < score < MIN_TEXT_SIMILARITY
+    assert dedup.match(candidate, dhash(candidate), quick_ocr) is None
+
+
+def test_no_quick_ocr_without_a_hash_candidate():
+    dedup = PageDeduplicator()
+    dedup.register(0, primary_page())
+
+    def quick_ocr(_):
+        raise AssertionError("quick OCR must not run without a hash candidate")
+    assert dedup.match(None, (1 << 256) - 1, quick_ocr) is None
@@ -0,0 +1,40 @@
+import hashlib
+import pytest
+from PyPDF2 import PdfReader, PdfWriter
+from db_utils import save_grouped_pdf_to_db
+from pdf_stream import write_pages_from_original
+
+
+@pytest.fixture
+def original_pdf(tmp_path):
+    writer = PdfWriter()
+    for width in (200, 300, 400):
+        writer.add_blank_page(width=width, height=500)
+    path = tmp_path / "original.pdf"
+    with open(path, "wb") as f:
+        writer.write(f)
+    return str(path)
+
+
+def test_pages_copied_with_digest(original_pdf, tmp_path):
+    out_path = tmp_path / "document.pdf"
+    digest, size = write_pages_from_original(original_pdf, [3, 1], str(out_path))
+    data = out_path.read_bytes()
+    assert (digest, size) == (hashlib.sha256(data).hexdigest(), len(data))
+    assert [int(page.mediabox.width) for page in PdfReader(str(out_path)).pages] == [400, 200]
+
+
+def test_grouped_pdf_stored_with_digest(conn, session_id, original_pdf, tmp_path):
+    out_path = str(tmp_path / "document.pdf")
+    digest, _ = write_pages_from_original(original_pdf, [2], out_path)
+    save_grouped_pdf_to_db(conn, session_id, "doc", "Commercial Invoice", out_path, sha256=digest)
+    row = conn.execute("SELECT file_data, file_sha256 FROM TF_ingestion_mGroupsPDF").fetchone()
+    assert row.file_sha256 == digest == hashlib.sha256(row.file_data).hexdigest()
+
+
+def test_changed_file_is_rejected(conn, session_id, original_pdf, tmp_path):
+    out_path = str(tmp_path / "document.pdf")
+    write_pages_from_original(original_pdf, [1], out_path)
+    with pytest.raises(ValueError):
+        save_grouped_pdf_to_db(conn, session_id, "doc", "Packing List", out_path, sha256="0" * 64)
+    assert conn.execute("SELECT COUNT(*) FROM TF_ingestion_mGroupsPDF").fetchone()[0] == 0
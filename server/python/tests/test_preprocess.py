@@ -0,0 +1,34 @@
+import numpy as np
+from PIL import Image, ImageDraw
+
+import preprocess
+from preprocess import estimate_skew, otsu_threshold, preprocess_with_info
+
+
+def _text_page(angle: float) -> Image.Image:
+    """Bilevel 0/255 page of ruled "text" lines, rotated by `angle` degrees."""
+    page = Image.new("L", (1000, 800), 255)
+    draw = ImageDraw.Draw(page)
+    for y in range(100, 700, 30):
+        draw.rectangle([100, y, 900, y + 8], fill=0)
+    rotated = page.rotate(angle, resample=Image.NEAREST, fillcolor=255)
+    return rotated.point(lambda v: 0 if v < 128 else 255)
+
+
+def test_otsu_on_bilevel_scan_keeps_ink():
+    gray = np.asarray(_text_page(0))
+    threshold = otsu_threshold(gray)
+    assert (gray <= threshold).sum() == (gray == 0).sum()
+
+
+def test_skew_is_found_on_bilevel_scan():
+    skew = estimate_skew(np.asarray(_text_page(3)))
+    assert abs(abs(skew) - 3) <= 0.5
+
+
+def test_preprocess_straightens_bilevel_scan(monkeypatch):
+    monkeypatch.setattr(preprocess, "PREPROCESS_ENABLED", True)
+    _, info = preprocess_with_info(_text_page(3).convert("RGB"))
+    assert abs(abs(info["skew"]) - 3) <= 0.5
+    straight = preprocess_with_info(_text_page(0).convert("RGB"))[1]
+    assert straight["skew"] == 0.0
@@ -0,0 +1,48 @@
+import prompt_builder
+from prompt_builder import ClassificationCache, memoized, select_lines, text_key
+
+
+def test_select_lines_drops_json_and_keeps_page_order():
+    text = 'COMMERCIAL INVOICE\n[{"Item": "Rice"}]\nInvoice No. 42\n' + 'filler words here\n' * 400
+    excerpt = select_lines(text, budget=20, keywords=["Commercial Invoice"])
+    assert excerpt.splitlines()[0] == "COMMERCIAL INVOICE"
+    assert "Rice" not in excerpt
+
+
+def test_text_key_folds_digits_case_and_space():
+    assert text_key("ns", "Invoice  No. 42") == text_key("ns", "invoice no. 17")
+    assert text_key("ns", "Invoice") != text_key("other", "Invoice")
+
+
+def test_text_key_changes_with_model_and_keywords():
+    key = text_key("ns", "Invoice", "gpt-4o", ["Invoice", "Packing List"])
+    assert key == text_key("ns", "Invoice", "gpt-4o", ["Packing List", "Invoice"])
+    assert key != text_key("ns", "Invoice", "gpt-4o-mini", ["Invoice", "Packing List"])
+    assert key != text_key("ns", "Invoice", "gpt-4o", ["Invoice", "Packing List", "Insurance Certificate"])
+
+
+def test_labels_persist_across_processes(tmp_path):
+    db_path = str(tmp_path / "prompt_cache.sqlite3")
+    first = ClassificationCache(db_path=db_path)
+    first.put("key", "Packing List")
+    first.put("failed", "openai_failure")
+
+    second = ClassificationCache(db_path=db_path)    # a fresh process sees the same file
+    assert second.get("key") == "Packing List"
+    assert second.get("failed") is None
+    assert (second.hits, second.misses) == (1, 1)
+
+
+def test_memoized_calls_classifier_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(prompt_builder, "classification_cache", ClassificationCache(db_path=str(tmp_path / "c.db")))
+    calls = []
+
+    def classify(text):
+        calls.append(text)
+        return "Bill of Lading"
+
+    assert memoized("test", "BILL OF LADING No. 1", classify) == "Bill of Lading"
+    assert memoized("test", "bill of lading no. 2", classify) == "Bill of Lading"
+    assert len(calls) == 1
+    assert memoized("test", "BILL OF LADING No. 1", classify, model="other-deployment") == "Bill of Lading"
+    assert len(calls) == 2
@@ -0,0 +1,35 @@
+from segmentation import is_continuation, page_features, page_numbering, segment_pages
+
+NAMES = ["Commercial Invoice", "Packing List", "Bill of Lading"]
+
+
+def test_page_numbering_forms():
+    assert page_numbering(["Page 2 of 3"]) == (2, 3)
+    assert page_numbering(["header", "2/3"]) == (2, 3)
+    assert page_numbering(["Page No. 4"]) == (4, None)
+    assert page_numbering(["no numbering here"]) == (None, None)
+
+
+def test_page_one_always_starts_a_document():
+    prev = page_features("COMMERCIAL INVOICE\nPage 1 of 2")
+    continues, reason = is_continuation(prev, page_features("COMMERCIAL INVOICE\nPage 1 of 2"))
+    assert (continues, reason) == (False, "page_one")
+
+
+def test_runs_follow_numbering_titles_and_duplicates():
+    pages = [
+        {"text": "COMMERCIAL INVOICE\nInvoice No. 42\nPage 1 of 2"},
+        {"text": "Item 7 cotton shirts 100 pcs\nPage 2 of 2"},
+        {"text": ""},
+        {"text": "PACKING LIST\nCartons 200\nGross weight 5000 KGS"},
+        {"text": "COMMERCIAL INVOICE\nInvoice No. 42\nPage 1 of 2", "duplicate_of": "Page_01"},
+    ]
+    assert segment_pages(pages, NAMES) == [[0, 1, 2], [3], [4]]
+    assert [page["segment_reason"] for page in pages] == ["first", "page_number", "blank", "title", "duplicate"]
+
+
+def test_repeated_letterhead_continues_a_run():
+    letterhead = "ACME EXPORTS LTD\n12 Harbour Road, Chennai\nTel 044 1234"
+    pages = [{"text": f"{letterhead}\nCOMMERCIAL INVOICE\nInvoice No. 42"},
+             {"text": f"{letterhead}\nRemarks and terms continue"}]
+    assert segment_pages(pages, NAMES) == [[0, 1]]
@@ -0,0 +1,65 @@
+import json
+import importlib
+import pytest
+import storage_codec
+from storage_codec import MARKER, decode_json, decode_text, encode_json, encode_text
+
+TEXT = "\n".join(f"COMMERCIAL INVOICE No. {i}  L/C No. LC/2024/{i:04}  Port of Loading: CHENNAI" for i in range(20))
+
+
+def test_short_and_plain_values_pass_through():
+    assert encode_text("short", codec="zlib") == "short"
+    assert encode_text(None, codec="zlib") is None
+    assert encode_text(TEXT, codec="none") == TEXT
+    assert decode_text(TEXT) == TEXT
+    assert decode_text(None) is None
+
+
+def test_text_round_trip():
+    encoded = encode_text(TEXT, codec="zlib")
+    assert encoded.startswith(MARKER + "-:")
+    assert len(encoded) < len(TEXT)
+    assert decode_text(encoded) == TEXT
+    assert encode_text(encoded, codec="zlib") == encoded  # never double-encoded
+
+
+def test_incompressible_text_stays_plain():
+    noise = "".join(chr(0x4E00 + (i * 7919) % 20000) for i in range(400))
+    assert encode_text(noise, codec="zlib") == noise
+
+
+def test_json_round_trip_is_compact():
+    fields = {"L/C No.": "LC/2024/0815", "Amount": "USD 10,000.00"}
+    assert encode_json(fields, codec="none") == json.dumps(fields, separators=(",", ":"))
+    assert decode_json(encode_json({"lines": [TEXT]}, codec="zlib")) == {"lines": [TEXT]}
+    assert decode_json(None, default=[]) == []
+
+
+def test_preset_dictionary(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage_codec, "DICT_DIR", str(tmp_path))
+    monkeypatch.setattr(storage_codec, "_dictionaries", {})
+    dict_id = storage_codec.save_dictionary(storage_codec.train_dictionary([TEXT] * 5))
+    monkeypatch.setattr(storage_codec, "DICT_ID", dict_id)
+
+    encoded = encode_text(TEXT, codec="zlib")
+    assert encoded.startswith(f"{MARKER}{dict_id}:")
+    assert decode_text(encoded) == TEXT
+
+
+def test_unknown_dictionary_fails_loudly(monkeypatch, tmp_path):
+    monkeypatch.setattr(storage_codec, "DICT_DIR", str(tmp_path))
+    with pytest.raises(FileNotFoundError):
+        decode_text(f"{MARKER}missing:AAAA")
+
+
+@pytest.mark.parametrize("backend, compressed", [("sqlite", True), ("sqlserver", False)])
+def test_ocr_text_stays_plain_for_sql_server_full_text(backend, compressed, monkeypatch):
+    monkeypatch.setenv("TF_STORAGE_CODEC", "zlib")
+    monkeypatch.setenv("TF_SEARCH_BACKEND", backend)
+    try:
+        codec = importlib.reload(storage_codec)
+        assert codec.encode_ocr_text(TEXT).startswith(MARKER) is compressed
+        assert codec.encode_json({"text": TEXT}).startswith(MARKER)
+    finally:
+        monkeypatch.undo()
+        importlib.reload(storage_codec)
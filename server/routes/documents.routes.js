@@ -7,6 +7,7 @@ import { exec, execSync } from 'child_process';
 import { fileURLToPath } from 'url';
 import { createHash } from 'crypto';
 import { spawn } from 'child_process';
+import { decodeText, decodeJson } from '../utils/storageCodec.js';
 
 
 import OpenAI from "openai";
@@ -27,6 +28,106 @@ const client = new OpenAI({
 });
 
 
+// Page thumbnails / previews written by the splitter (server/python/page_previews.py)
+const readPreviewManifest = (folderPath) => {
+  try {
+    return JSON.parse(fs.readFileSync(path.join(folderPath, 'previews.json'), 'utf-8'));
+  } catch {
+    return {};
+  }
+};
+
+const previewPaths = (manifest, pageName, urlBase) => ({
+  thumbnailPath: manifest[pageName]?.thumb ? `${urlBase}/${manifest[pageName].thumb.file}` : null,
+  previewPath: manifest[pageName]?.preview ? `${urlBase}/${manifest[pageName].preview.file}` : null,
+});
+
+
+// Page files of a finished split (OCR_Alone / split_OCR) as returned by /split and /newsplit
+const sendSplitFiles = (res, serverRoot, sessionId, filePath, documentId, output) => {
+  try {
+    const outputDir = path.join(
+      serverRoot,
+      'outputs',
+      sessionId,
+      `${path.basename(filePath, '.pdf')}-${documentId}`
+    );
+
+    if (!fs.existsSync(outputDir)) {
+      return res.status(404).json({ error: '❌ Output folder not found after split.' });
+    }
+
+    const previews = readPreviewManifest(outputDir);
+    const files = fs.readdirSync(outputDir)
+      .filter(f => f.endsWith('.pdf') && f !== 'original.pdf')
+      .map(f => {
+        const baseName = f.replace('.pdf', '');
+        return {
+          fileName: f,
+          name: f,
+          pdfPath: `/outputs/${sessionId}/${path.basename(filePath, '.pdf')}-${documentId}/${f}`,
+          textPath: `/outputs/${sessionId}/${path.basename(filePath, '.pdf')}-${documentId}/${baseName}.txt`,
+          jsonPath: `/outputs/${sessionId}/${path.basename(filePath, '.pdf')}-${documentId}/${baseName}.fields.json`,
+          ...previewPaths(previews, baseName, `/outputs/${sessionId}/${path.basename(filePath, '.pdf')}-${documentId}`),
+        };
+      });
+
+    return res.status(200).json({
+      message: '✅ Document split and processed successfully',
+      output,
+      files: files,
+    });
+  } catch (fileErr) {
+    console.error('❌ Error reading split files:', fileErr);
+    return res.status(500).json({ error: 'Split succeeded but reading output failed' });
+  }
+};
+
+// With OCR_JOB_QUEUE=true the OCR routes hand work to the Python job queue
+// workers (server/python/job_queue.py) instead of spawning a script per
+// request. "enqueue --reuse" returns the document's existing job, e.g. the
+// split the upload route queued (a failed one is queued again), so a route
+// either reports that job's status or, once it is done, answers as the
+// synchronous route would. Upload and /split queue the same OCR_Alone split,
+// so a document is OCR'd once. Past OCR_JOB_QUEUE_MAX_DEPTH queued/running
+// jobs new work is refused with 503 and Retry-After.
+const QUEUE_SCRIPT = path.join(__dirname, '..', 'python', 'job_queue.py');
+const QUEUE_MAX_DEPTH = parseInt(process.env.OCR_JOB_QUEUE_MAX_DEPTH || '200', 10);
+const QUEUE_RETRY_AFTER = 30; // seconds
+const jobQueueEnabled = () => process.env.OCR_JOB_QUEUE === 'true';
+
+const submitJob = (args) => new Promise((resolve, reject) => {
+  const queueProcess = spawn('python', [
+    QUEUE_SCRIPT, 'enqueue', ...args, '--reuse', '--max-depth', String(QUEUE_MAX_DEPTH)
+  ]);
+  let stdout = '';
+  let stderr = '';
+  queueProcess.stdout.on('data', data => { stdout += data.toString(); });
+  queueProcess.stderr.on('data', data => { stderr += data.toString(); });
+  queueProcess.on('error', reject);
+  queueProcess.on('close', (code) => {
+    try {
+      // exit 2 is "queue full", reported as {"error": ...}
+      resolve(JSON.parse(stdout.trim().split('\n').pop()));
+    } catch {
+      reject(new Error(`job_queue.py exited with code ${code}: ${stderr || stdout}`));
+    }
+  });
+});
+
+// The split /split runs; the upload route queues the same one
+const submitSplit = (filePath, sessionId, documentId, ocrMethod) =>
+  submitJob(['split', filePath, sessionId, String(documentId), ocrMethod, '--splitter', 'OCR_Alone']);
+
+const sendQueuedJob = (res, job, message) => {
+  if (job.error) {
+    res.set('Retry-After', String(QUEUE_RETRY_AFTER));
+    return res.status(503).json(job);
+  }
+  return res.status(202).json({ message: `${message} queued`, queued: true, ...job });
+};
+
+
 // Ensure the uploads directory exists
 const uploadDir = './uploads';
 if (!fs.existsSync(uploadDir)) {
@@ -226,11 +327,25 @@ router.post('/upload/:sessionId', upload.single('document'), async (req, res) =>
 
     const insertedId = result.recordset[0].Id;
 
+    // Hand OCR to the Python job queue workers instead of running it in-request;
+    // /split later picks up this job. A full queue leaves the split to /split.
+    let queued = false;
+    if (jobQueueEnabled()) {
+      try {
+        const job = await submitSplit(path.resolve(file.path), sessionId, insertedId, req.body.ocrMethod || 'azure');
+        queued = !job.error;
+        console.log('[QUEUE]:', JSON.stringify(job));
+      } catch (queueErr) {
+        console.error('[QUEUE STDERR]:', queueErr);
+      }
+    }
+
     res.status(201).json({
       message: 'Document uploaded successfully.',
       fileName: file.originalname,
       id: insertedId,
       DocumentName: documentName, // 👈 return it so frontend gets it
+      queued,
     });
 
   } catch (err) {
@@ -321,7 +436,8 @@ router.get("/ocr/:sessionId", async (req, res) => {
         ORDER BY o.created_at DESC
       `);
 
-    res.json({ results: result.recordset });
+    const results = result.recordset.map((row) => ({ ...row, ocr_text: decodeText(row.ocr_text) }));
+    res.json({ results });
   } catch (err) {
     console.error("❌ Failed to fetch OCR docs:", err);
     res.status(500).json({ error: "Failed to fetch OCR documents" });
@@ -584,6 +700,19 @@ router.post('/split/:sessionId', async (req, res) => {
     return res.status(400).json({ error: `❌ File not found: ${absoluteFilePath}` });
   }
 
+  if (jobQueueEnabled()) {
+    try {
+      const job = await submitSplit(absoluteFilePath, sessionId, documentId, ocrMethod);
+      if (job.status === 'done') {
+        return sendSplitFiles(res, serverRoot, sessionId, filePath, documentId, '');
+      }
+      return sendQueuedJob(res, job, 'Split');
+    } catch (err) {
+      console.error('❌ Queueing split failed:', err);
+      return res.status(500).json({ error: 'Failed to queue split job' });
+    }
+  }
+
   const command = `python "${scriptPath}" "${absoluteFilePath}" "${sessionId}" "${documentId}" "${ocrMethod}"`;
   console.log("📂 Running split command:", command);
 
@@ -599,40 +728,7 @@ router.post('/split/:sessionId', async (req, res) => {
       });
     }
 
-    try {
-      const outputDir = path.join(
-        serverRoot,
-        'outputs',
-        sessionId,
-        `${path.basename(filePath, '.pdf')}-${documentId}`
-      );
-
-      if (!fs.existsSync(outputDir)) {
-        return res.status(404).json({ error: '❌ Output folder not found after split.' });
-      }
-
-      const files = fs.readdirSync(outputDir)
-        .filter(f => f.endsWith('.pdf') && f !== 'original.pdf')
-        .map(f => {
-          const baseName = f.replace('.pdf', '');
-          return {
-            fileName: f,
-            name: f,
-            pdfPath: `/outputs/${sessionId}/${path.basename(filePath, '.pdf')}-${documentId}/${f}`,
-            textPath: `/outputs/${sessionId}/${path.basename(filePath, '.pdf')}-${documentId}/${baseName}.txt`,
-            jsonPath: `/outputs/${sessionId}/${path.basename(filePath, '.pdf')}-${documentId}/${baseName}.fields.json`,
-          };
-        });
-
-      return res.status(200).json({
-        message: '✅ Document split and processed successfully',
-        output: stdout,
-        files: files,
-      });
-    } catch (fileErr) {
-      console.error('❌ Error reading split files:', fileErr);
-      return res.status(500).json({ error: 'Split succeeded but reading output failed' });
-    }
+    return sendSplitFiles(res, serverRoot, sessionId, filePath, documentId, stdout);
   });
 });
 
@@ -676,6 +772,19 @@ router.post('/newsplit/:sessionId', async (req, res) => {
     return res.status(400).json({ error: `❌ File not found: ${absoluteFilePath}` });
   }
 
+  if (jobQueueEnabled()) {
+    try {
+      const job = await submitJob(['split', absoluteFilePath, sessionId, String(documentId), ocrMethod, '--splitter', 'split_OCR']);
+      if (job.status === 'done') {
+        return sendSplitFiles(res, serverRoot, sessionId, filePath, documentId, '');
+      }
+      return sendQueuedJob(res, job, 'Split');
+    } catch (err) {
+      console.error('❌ Queueing split failed:', err);
+      return res.status(500).json({ error: 'Failed to queue split job' });
+    }
+  }
+
   const command = `python "${scriptPath}" "${absoluteFilePath}" "${sessionId}" "${documentId}" "${ocrMethod}"`;
   console.log("📂 Running split command:", command);
 
@@ -691,40 +800,7 @@ router.post('/newsplit/:sessionId', async (req, res) => {
       });
     }
 
-    try {
-      const outputDir = path.join(
-        serverRoot,
-        'outputs',
-        sessionId,
-        `${path.basename(filePath, '.pdf')}-${documentId}`
-      );
-
-      if (!fs.existsSync(outputDir)) {
-        return res.status(404).json({ error: '❌ Output folder not found after split.' });
-      }
-
-      const files = fs.readdirSync(outputDir)
-        .filter(f => f.endsWith('.pdf') && f !== 'original.pdf')
-        .map(f => {
-          const baseName = f.replace('.pdf', '');
-          return {
-            fileName: f,
-            name: f,
-            pdfPath: `/outputs/${sessionId}/${path.basename(filePath, '.pdf')}-${documentId}/${f}`,
-            textPath: `/outputs/${sessionId}/${path.basename(filePath, '.pdf')}-${documentId}/${baseName}.txt`,
-            jsonPath: `/outputs/${sessionId}/${path.basename(filePath, '.pdf')}-${documentId}/${baseName}.fields.json`,
-          };
-        });
-
-      return res.status(200).json({
-        message: '✅ Document split and processed successfully',
-        output: stdout,
-        files: files,
-      });
-    } catch (fileErr) {
-      console.error('❌ Error reading split files:', fileErr);
-      return res.status(500).json({ error: 'Split succeeded but reading output failed' });
-    }
+    return sendSplitFiles(res, serverRoot, sessionId, filePath, documentId, stdout);
   });
 });
 
@@ -762,6 +838,14 @@ router.post('/group/:sessionId/:documentId', async (req, res) => {
       return res.status(404).json({ error: 'Grouping script not found.' });
     }
 
+    if (jobQueueEnabled()) {
+      const job = await submitJob(['group', '-', sessionId, documentId]);
+      if (job.status === 'done') {
+        return res.json({ message: "Grouping completed." });
+      }
+      return sendQueuedJob(res, job, 'Grouping');
+    }
+
     // ✅ Add '--group' as the first argument
     const pythonProcess = spawn('python', [scriptPath, sessionId, documentId]);
 
@@ -840,7 +924,7 @@ router.get("/grouped-fields/:sessionId/:documentId", async (req, res) => {
 
       let fields = [];
       try {
-        fields = JSON.parse(row.fields_json); // parse JSON array
+        fields = decodeJson(row.fields_json); // parse JSON array
       } catch (err) {
         console.error("❌ Failed to parse fields_json:", err);
       }
@@ -953,6 +1037,14 @@ router.post('/catalog', async (req, res) => {
       return res.status(400).json({ error: 'session_id and document_id are required' });
     }
 
+    if (jobQueueEnabled()) {
+      const job = await submitJob(['catalog', '-', session_id, document_id]);
+      if (job.status === 'done') {
+        return res.status(200).json({ success: true, output: '' });
+      }
+      return sendQueuedJob(res, job, 'Catalog');
+    }
+
     const scriptPath = path.join(__dirname, "..", "python", "catalog_with_master.py");
     const pythonProcess = spawn('python', [scriptPath, session_id, document_id]);
 
@@ -1034,6 +1126,7 @@ router.get('/split/session/:sessionId', async (req, res) => {
     const folderPath = path.join(baseDir, folder.name);
     const files = fs.readdirSync(folderPath);
     const splitFiles = files.filter(f => f.endsWith('.pdf') && f !== 'original.pdf');
+    const previews = readPreviewManifest(folderPath);
 
     result.push({
       documentId: folder.name,
@@ -1043,7 +1136,8 @@ router.get('/split/session/:sessionId', async (req, res) => {
           fileName: name,
           pdfPath: `/outputs/${sessionId}/${folder.name}/${name}`,
           textPath: `/outputs/${sessionId}/${folder.name}/${baseName}.txt`,
-          jsonPath: `/outputs/${sessionId}/${folder.name}/${baseName}.fields.json`
+          jsonPath: `/outputs/${sessionId}/${folder.name}/${baseName}.fields.json`,
+          ...previewPaths(previews, baseName, `/outputs/${sessionId}/${folder.name}`)
         };
       })
     });
@@ -1179,7 +1273,7 @@ router.get("/forms/list/:docId", async (req, res) => {
       `);
 
     if (mGroupsResult.recordset.length > 0) {
-      return res.json({ forms: mGroupsResult.recordset });
+      return res.json({ forms: mGroupsResult.recordset.map((row) => ({ ...row, ocr_text: decodeText(row.ocr_text) })) });
     }
 
     // If empty → fallback to Cleaned
@@ -1191,7 +1285,7 @@ router.get("/forms/list/:docId", async (req, res) => {
         WHERE document_id = @docId
       `);
 
-    return res.json({ forms: cleanedResult.recordset });
+    return res.json({ forms: cleanedResult.recordset.map((row) => ({ ...row, ocr_text: decodeText(row.ocr_text) })) });
 
   } catch (err) {
     console.error("Error fetching forms:", err);
@@ -1238,7 +1332,7 @@ router.get("/forms/:docId", async (req, res) => {
           .query("SELECT ocr_text FROM TF_ingestion_CleanedOCR WHERE document_id = @docId")
       ]);
 
-      const combinedText = `${orig.recordset[0]?.ocr_text || ""}\n${cleaned.recordset[0]?.ocr_text || ""}`;
+      const combinedText = `${decodeText(orig.recordset[0]?.ocr_text) || ""}\n${decodeText(cleaned.recordset[0]?.ocr_text) || ""}`;
       if (!combinedText.trim()) return res.status(404).send("Text not found");
 
       return res.json({ text: combinedText });
@@ -1250,7 +1344,7 @@ router.get("/forms/:docId", async (req, res) => {
         .input("docId", sql.UniqueIdentifier, docId)
         .query("SELECT fields_json FROM TF_ingestion_mGroupsFields WHERE document_id = @docId");
 
-      const origFields = origResult.recordset[0]?.fields_json ? JSON.parse(origResult.recordset[0].fields_json) : [];
+      const origFields = decodeJson(origResult.recordset[0]?.fields_json);
 
       // Cleaned key-value pairs
       const cleanedResult = await pool.request()
@@ -1287,7 +1381,7 @@ router.get("/forms/list/:docId", async (req, res) => {
     const forms = result.recordset.map(row => ({
       id: row.id,          // unique identifier for each form
       formName: row.form_type,
-      text: row.ocr_text
+      text: decodeText(row.ocr_text)
     }));
 
     res.json({ forms });
@@ -1324,7 +1418,7 @@ router.get("/forms/content/:formId", async (req, res) => {
         .input("formId", sql.Int, formId)
         .query("SELECT ocr_text FROM TF_ingestion_mGroupsOCR WHERE id = @formId");
 
-      return res.json({ text: result.recordset[0]?.ocr_text || "" });
+      return res.json({ text: decodeText(result.recordset[0]?.ocr_text) || "" });
     }
 
     if (type === "fields") {
@@ -1332,7 +1426,7 @@ router.get("/forms/content/:formId", async (req, res) => {
         .input("formId", sql.Int, formId)
         .query("SELECT fields_json FROM TF_ingestion_mGroupsFields WHERE id = @formId");
 
-      const fields = result.recordset[0]?.fields_json ? JSON.parse(result.recordset[0].fields_json) : [];
+      const fields = decodeJson(result.recordset[0]?.fields_json);
       return res.json(fields);
     }
   } catch (err) {
@@ -0,0 +1,36 @@
+import path from 'path';
+import fs from 'fs';
+import zlib from 'zlib';
+import { fileURLToPath } from 'url';
+
+// Reader for OCR text / fields_json stored by server/python/storage_codec.py
+// (TF_STORAGE_CODEC=zlib): "~z1:<dictionary id or ->:<base64 raw deflate>".
+// Values without the marker are returned unchanged.
+
+const __filename = fileURLToPath(import.meta.url);
+const __dirname = path.dirname(__filename);
+
+const MARKER = '~z1:';
+const DICT_DIR = process.env.TF_CODEC_DICT_DIR || path.join(__dirname, '..', 'python', 'codec');
+const dictionaries = new Map();
+
+function loadDictionary(dictId) {
+  if (!dictionaries.has(dictId)) {
+    dictionaries.set(dictId, fs.readFileSync(path.join(DICT_DIR, `${dictId}.zdict`)));
+  }
+  return dictionaries.get(dictId);
+}
+
+export function decodeText(value) {
+  if (typeof value !== 'string' || !value.startsWith(MARKER)) return value;
+  const rest = value.slice(MARKER.length);
+  const sep = rest.indexOf(':');
+  const dictId = rest.slice(0, sep);
+  const options = dictId === '-' ? {} : { dictionary: loadDictionary(dictId) };
+  return zlib.inflateRawSync(Buffer.from(rest.slice(sep + 1), 'base64'), options).toString('utf8');
+}
+
+export function decodeJson(value, fallback = []) {
+  if (value === null || value === undefined) return fallback;
+  return JSON.parse(decodeText(value));
+}